@@ -1,27 +1,45 @@
 import streamlit as st
 import os
 import io
+import sys
 import re
 import gc
+import time
 import json
 import glob
-import random
+import hashlib
 import base64
-import urllib.parse
+import binascii
+import shutil
+import subprocess
+import multiprocessing
+import concurrent.futures
+import importlib
+import importlib.util
+import site
+import zlib
+import zipfile
+import wave
+import struct
 import tempfile
+import threading
+import logging
+import contextlib
+import contextvars
+import collections
 import numpy as np
 
 # --- OPTIMISATION VITESSE 1 : BACKEND NON-INTERACTIF ---
+# Pas de pyplot (0,5 s d'import) : toutes les figures passent par l'API objet Figure (dans rendu_kora)
 import matplotlib
 matplotlib.use('Agg') 
+from PIL import Image
+import rendu_kora
+from rendu_kora import (POSITIONS_X, COULEURS_CORDES_REF, get_color_for_note, NoteSequence, en_note_sequence, PartitionLongue,
+                        variantes_page, emballer_tache, rendre_page_livret, rendre_tuile_video)
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.font_manager as fm
-import matplotlib.image as mpimg
-from matplotlib.figure import Figure
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-from fpdf import FPDF
+# Les processus de rendu n'importent que rendu_kora : le script Streamlit n'y est pas rejoué
+if __name__ == '__main__': rendu_kora.principal_non_reimporte(globals())
 
 # ==============================================================================
 # ⚙️ CONFIGURATION & CHEMINS
@@ -136,25 +154,17 @@ def load_css_styles():
 st.markdown(load_css_styles(), unsafe_allow_html=True)
 
 # --- CONSTANTES & RESOURCES ---
-CHEMIN_POLICE = 'ML.ttf'
-CHEMIN_IMAGE_FOND = 'texture_ngonilele.png'
-CHEMIN_ICON_POUCE = 'icon_pouce.png'
-CHEMIN_ICON_INDEX = 'icon_index.png'
-CHEMIN_ICON_POUCE_BLANC = 'icon_pouce_blanc.png'
-CHEMIN_ICON_INDEX_BLANC = 'icon_index_blanc.png'
 CHEMIN_LOGO_APP = 'ico_ngonilele.png'
 CHEMIN_HEADER_IMG = 'texture_ngonilele_2.png'
 DOSSIER_SAMPLES = 'samples'
+CHEMIN_PACK_SAMPLES = os.path.join(DOSSIER_SAMPLES, 'samples_pcm.pack')
 
 # --- CONSTANTES RYTHMIQUES (BASE 12) ---
 TICKS_NOIRE = 12; TICKS_CROCHE = 6; TICKS_TRIOLET = 4; TICKS_DOUBLE = 3
 SYMBOLES_DUREE = {'+': TICKS_NOIRE, '♪': TICKS_CROCHE, '🎶': TICKS_TRIOLET, '♬': TICKS_DOUBLE}
 
 # --- COULEURS & LOGIQUE ---
-POSITIONS_X = {'1G': -1, '2G': -2, '3G': -3, '4G': -4, '5G': -5, '6G': -6, '1D': 1, '2D': 2, '3D': 3, '4D': 4, '5D': 5, '6D': 6}
-COULEURS_CORDES_REF = {'C': '#FF0000', 'D': '#FF8C00', 'E': '#FFD700', 'F': '#32CD32', 'G': '#00BFFF', 'A': '#00008B', 'B': '#9400D3'}
 COLORS_VISU = {'6G':'#00BFFF','5G':'#FF4B4B','4G':'#00008B','3G':'#FFD700','2G':'#FF4B4B','1G':'#00BFFF','1D':'#32CD32','2D':'#00008B','3D':'#FFA500','4D':'#00BFFF','5D':'#9400D3','6D':'#FFD700'}
-TRADUCTION_NOTES = {'C':'do', 'D':'ré', 'E':'mi', 'F':'fa', 'G':'sol', 'A':'la', 'B':'si'}
 AUTOMATIC_FINGERING = {'1G':'P','2G':'P','3G':'P','1D':'P','2D':'P','3D':'P','4G':'I','5G':'I','6G':'I','4D':'I','5D':'I','6D':'I'}
 
 NOTES_GAMME = [
@@ -193,19 +203,79 @@ BANQUE_TABLATURES = {
 }
 
 # ==============================================================================
-# 🚀 FONCTIONS UTILES
+# ⏱️ INSTRUMENTATION (durées par étape, journal JSON)
 # ==============================================================================
-@st.cache_resource
-def load_font_properties():
-    if os.path.exists(CHEMIN_POLICE):
-        return fm.FontProperties(fname=CHEMIN_POLICE)
-    return fm.FontProperties(family='sans-serif')
+# Active avec NGONI_MESURES=1 ou l'URL ?debug=1. Hors d'une exécution mesurée, mesure() renvoie
+# un contexte vide partagé : le coût se limite à la lecture d'une ContextVar.
+MESURES_ENV = os.environ.get('NGONI_MESURES', '') == '1'
+NB_EXECUTIONS_DEBUG = 20
+journal_mesures = logging.getLogger('ngonilele.mesures')
+if not journal_mesures.handlers:
+    journal_mesures.addHandler(logging.StreamHandler()); journal_mesures.setLevel(logging.INFO); journal_mesures.propagate = False
+execution_courante = contextvars.ContextVar('execution_courante', default=None)
+
+class MesureInactive:
+    def __enter__(self): return {}
+    def __exit__(self, *exc): return False
+MESURE_INACTIVE = MesureInactive()
+
+class MesureEtape:
+    def __init__(self, execution, etape, infos):
+        self.execution = execution; self.etape = etape; self.infos = infos
+    def __enter__(self):
+        self.t0 = time.perf_counter(); return self.infos
+    def __exit__(self, type_exc, exc, tb):
+        self.execution.ajouter(self.etape, (time.perf_counter() - self.t0) * 1000, **self.infos)
+        return False
+
+class ExecutionMesuree:
+    # Une action de l'utilisateur (Générer, Créer Audio...) : regroupe ses étapes, puis part dans l'historique
+    def __init__(self, nom, historique):
+        self.nom = nom; self.historique = historique; self.etapes = []
+        self.id = f"{int(time.time() * 1000):x}-{os.getpid()}"
+    def __enter__(self):
+        self.debut = time.time(); self.t0 = time.perf_counter(); self.jeton = execution_courante.set(self)
+        return self
+    def __exit__(self, type_exc, exc, tb):
+        execution_courante.reset(self.jeton)
+        bilan = {'execution': self.nom, 'id': self.id, 'debut': self.debut, 'duree_ms': round((time.perf_counter() - self.t0) * 1000, 2), 'erreur': type_exc.__name__ if type_exc else None, 'etapes': self.etapes}
+        journal_mesures.info(json.dumps({k: v for k, v in bilan.items() if k != 'etapes'}, ensure_ascii=False))
+        self.historique.append(bilan)
+        return False
+    def ajouter(self, etape, duree_ms, **infos):
+        enregistrement = {'etape': etape, 'duree_ms': round(duree_ms, 2), **infos}
+        self.etapes.append(enregistrement)
+        journal_mesures.info(json.dumps({'execution': self.nom, 'id': self.id, **enregistrement}, ensure_ascii=False, default=str))
+
+@st.cache_resource(show_spinner=False)
+def get_historique_mesures():
+    return collections.deque(maxlen=NB_EXECUTIONS_DEBUG)
+
+def mesures_actives():
+    return MESURES_ENV or st.session_state.get('debug_mesures', False)
+
+def execution_mesuree(nom):
+    if not mesures_actives(): return contextlib.nullcontext()
+    return ExecutionMesuree(nom, get_historique_mesures())
+
+def mesure(etape, **infos):
+    # with mesure('pdf', pages=3) as m: ... ; m['octets'] = n  -> infos complétées pendant l'étape
+    execution = execution_courante.get()
+    if execution is None: return MESURE_INACTIVE
+    return MesureEtape(execution, etape, infos)
+
+def enregistrer_etape(etape, duree_ms, **infos):
+    # Pour les durées mesurées ailleurs (processus de rendu, tuiles vidéo)
+    execution = execution_courante.get()
+    if execution is not None: execution.ajouter(etape, duree_ms, **infos)
 
-@st.cache_resource
-def load_image_asset(path):
-    if os.path.exists(path):
-        return mpimg.imread(path)
-    return None
+# ==============================================================================
+# 🚀 FONCTIONS UTILES
+# ==============================================================================
+@st.cache_data(show_spinner=False, max_entries=4)
+def lire_fichier_cache(chemin, mtime):
+    # mtime fait partie de la clé : un fichier remplacé sur disque est relu
+    with open(chemin, "rb") as f: return f.read()
 
 def afficher_header_style(titre):
     st.markdown(f"""
@@ -217,13 +287,9 @@ def afficher_header_style(titre):
 def parse_gamme_string(gamme_str):
     return re.findall(r"[A-G][#b]?[0-9]*", gamme_str)
 
-def get_color_for_note(note):
-    base_note = note[0].upper() 
-    return COULEURS_CORDES_REF.get(base_note, '#000000')
-
 def get_note_value(note_str):
     semitones = {'C': 0, 'C#': 1, 'DB': 1, 'D': 2, 'D#': 3, 'EB': 3, 'E': 4, 'F': 5, 'F#': 6, 'GB': 6, 'G': 7, 'G#': 8, 'AB': 8, 'A': 9, 'A#': 10, 'BB': 10, 'B': 11}
-    match = re.match(r"^([A-G][#b]?)([0-9]+)$", note_str.upper())
+    match = re.match(r"^([A-G][#B]?)([0-9]+)$", note_str.upper())
     if not match: return -1
     note_name = match.group(1)
     octave = int(match.group(2))
@@ -243,6 +309,10 @@ def get_valid_notes_for_string(string_key):
             valid_list.append(n)
     return valid_list if valid_list else [base_note]
 
+def note_accordage_valide(string_key, note):
+    # Accordage venu de l'extérieur (lien, projet) : seules les notes proposées par le sélecteur de la corde passent
+    return string_key in POSITIONS_X and note in get_valid_notes_for_string(string_key)
+
 # ==============================================================================
 # 📦 GESTION DE LA PERSISTANCE (Initialisation groupée)
 # ==============================================================================
@@ -251,11 +321,15 @@ if 'init_done' not in st.session_state:
     st.session_state.partition_generated = False
     st.session_state.video_path = None
     st.session_state.audio_buffer = None
+    st.session_state.audio_source = None
     st.session_state.metronome_buffer = None
+    st.session_state.metronome_format = "audio/wav"
     st.session_state.code_actuel = ""
     st.session_state.pdf_buffer = None
-    st.session_state.seq_grid = {}
+    st.session_state.seq_grid = frozenset()
+    st.session_state.seq_version = 0
     st.session_state.stored_blocks = {}
+    st.session_state.travaux = {}
     for k, v in DEF_ACC.items():
         if f"acc_{k}" not in st.session_state:
             st.session_state[f"acc_{k}"] = v
@@ -271,91 +345,105 @@ with col_titre:
     st.title("Générateur Tablature Ngonilélé")
     base_text = "Composez, Écoutez et Exportez."
     pdf_path = "Livret_Ngonilélé.pdf"
-    link_html = ""
+    st.markdown(base_text)
     if os.path.exists(pdf_path):
-        with open(pdf_path, "rb") as f:
-            b64_pdf = base64.b64encode(f.read()).decode('utf-8')
-        link_html = f'&nbsp;&nbsp;|&nbsp;&nbsp;<a href="data:application/pdf;base64,{b64_pdf}" download="{pdf_path}" style="color:#A67C52; text-decoration:none; font-weight:bold;">📥 Télécharger le livret PDF Ngonilélé</a>'
-    st.markdown(f"{base_text}{link_html}", unsafe_allow_html=True)
+        # Octets lus seulement au clic (puis gardés en cache jusqu'à la prochaine modification du fichier) :
+        # plus de PDF encodé en base64 dans la page à chaque rerun
+        mtime_livret = os.path.getmtime(pdf_path)
+        st.download_button("📥 Télécharger le livret PDF Ngonilélé", data=lambda: lire_fichier_cache(pdf_path, mtime_livret), file_name=pdf_path, mime="application/pdf", type="tertiary", on_click="ignore", help="Livret de référence de l'instrument")
 
 # ==============================================================================
 # 🧠 MOTEUR LOGIQUE
 # ==============================================================================
-HAS_MOVIEPY = False
-try:
-    from moviepy.editor import ImageClip, CompositeVideoClip, AudioFileClip, ColorClip
-    HAS_MOVIEPY = True
-except ImportError:
-    try:
-        from moviepy.editor import ImageClip, CompositeVideoClip, AudioFileClip
-        from moviepy.video.VideoClip import ColorClip
-        HAS_MOVIEPY = True
-    except: HAS_MOVIEPY = False
-
-HAS_PYDUB = False
-try:
-    from pydub import AudioSegment
-    from pydub.generators import Sine, WhiteNoise
-    HAS_PYDUB = True
-except: pass
-
-def get_font_cached(size, weight='normal', style='normal'):
-    prop = load_font_properties().copy()
-    prop.set_size(size)
-    prop.set_weight(weight)
-    prop.set_style(style)
-    return prop
+# --- IMPORTS DIFFÉRÉS : pydub, mido, imageio_ffmpeg et le moteur PDF ne sont chargés qu'à la première action
+# qui en a besoin ; au démarrage, on vérifie seulement qu'ils sont installés (find_spec, sans import) ---
+def module_disponible(nom):
+    try: return importlib.util.find_spec(nom) is not None
+    except (ImportError, ValueError): return False
+
+@st.cache_resource(show_spinner=False)
+def get_couts_imports():
+    return {} # module -> durée du premier import (ms), pour le panneau de mesures
+
+@st.cache_resource(show_spinner=False)
+def get_modules_casses():
+    return set() # modules installés mais dont l'import a échoué (ex. pydub sans audioop-lts sous Python 3.13)
+
+def importer(nom):
+    module = sys.modules.get(nom)
+    if module is not None: return module
+    t0 = time.perf_counter()
+    try: module = importlib.import_module(nom)
+    except ImportError: get_modules_casses().add(nom.split('.')[0]); raise
+    get_couts_imports()[nom] = round((time.perf_counter() - t0) * 1000, 1)
+    return module
+
+def module_utilisable(nom):
+    # find_spec dit seulement que le module est installé : l'import n'est tenté qu'ici, à la première action qui en a
+    # besoin ; s'il échoue, le module est traité comme absent (même message que s'il manquait)
+    if not module_disponible(nom) or nom in get_modules_casses(): return False
+    try: importer(nom); return True
+    except ImportError: return False
+
+def module_casse(nom):
+    return nom in get_modules_casses()
+
+@st.cache_resource(show_spinner=False)
+def get_ffmpeg_exe():
+    try: return importer('imageio_ffmpeg').get_ffmpeg_exe()
+    except Exception: return shutil.which('ffmpeg')
+
+HAS_FFMPEG = module_disponible('imageio_ffmpeg') or shutil.which('ffmpeg') is not None
+HAS_PYDUB = module_disponible('pydub')
+HAS_MIDO = module_disponible('mido')
 
 # --- NOUVEAU PARSER (COMPATIBLE BASE 12) ---
-def parser_texte(texte):
+# État du parser entre deux lignes : (current_tick, last_note_tick, last_note_duration)
+ETAT_PARSER_INITIAL = (0, 0, TICKS_NOIRE) # Durée par défaut = Noire
+
+def parser_ligne(ligne, etat):
+    current_tick, last_note_tick, last_note_duration = etat
     data = []
-    current_tick = 0
-    last_note_tick = 0
-    last_note_duration = TICKS_NOIRE # Durée par défaut = Noire
-    
-    if not texte: return []
-    
-    for ligne in texte.strip().split('\n'):
-        parts = ligne.strip().split(maxsplit=2)
-        if not parts: continue
-        try:
-            col1 = parts[0]
-            
-            # 1. DÉTECTION DU RYTHME
-            if col1 == '=':
-                this_start = last_note_tick
-                this_duration = last_note_duration
-            elif col1.isdigit():
-                # Cas "1" (début) ou chiffre => on reset ou on avance d'une noire
-                this_start = 0 if col1 == '1' else current_tick
+    parts = ligne.strip().split(maxsplit=2)
+    if not parts: return data, etat
+    try:
+        col1 = parts[0]
+        
+        # 1. DÉTECTION DU RYTHME
+        if col1 == '=':
+            this_start = last_note_tick
+            this_duration = last_note_duration
+        elif col1.isdigit():
+            # Cas "1" (début) ou chiffre => on reset ou on avance d'une noire
+            this_start = 0 if col1 == '1' else current_tick
+            this_duration = TICKS_NOIRE
+            current_tick = this_start + this_duration
+        elif col1 in SYMBOLES_DUREE:
+            # C'est un symbole (+, ♪, etc.)
+            this_duration = SYMBOLES_DUREE[col1]
+            this_start = current_tick
+            current_tick += this_duration
+        else:
+            # Cas par défaut (si l'utilisateur a tapé une vieille syntaxe sans symbole)
+            # On assume que c'est une Noire si ça ressemble à un '+' ou chiffre
+            if col1 == '+': 
                 this_duration = TICKS_NOIRE
-                current_tick = this_start + this_duration
-            elif col1 in SYMBOLES_DUREE:
-                # C'est un symbole (+, ♪, etc.)
-                this_duration = SYMBOLES_DUREE[col1]
                 this_start = current_tick
                 current_tick += this_duration
-            else:
-                # Cas par défaut (si l'utilisateur a tapé une vieille syntaxe sans symbole)
-                # On assume que c'est une Noire si ça ressemble à un '+' ou chiffre
-                if col1 == '+': 
-                    this_duration = TICKS_NOIRE
-                    this_start = current_tick
-                    current_tick += this_duration
-                else: continue
-
-            last_note_tick = this_start
-            last_note_duration = this_duration
-
-            # 2. ANALYSE DU CONTENU
-            corde_valide = parts[1].upper()
-            
-            if corde_valide == 'TXT':
-                msg = parts[2] if len(parts) > 2 else ""
-                data.append({'tick': this_start, 'duration': this_duration, 'corde': 'TEXTE', 'message': msg}); continue
-            elif corde_valide == 'PAGE':
-                data.append({'tick': this_start, 'duration': 0, 'corde': 'PAGE_BREAK'}); continue
-            
+            else: return data, etat
+
+        last_note_tick = this_start
+        last_note_duration = this_duration
+
+        # 2. ANALYSE DU CONTENU
+        corde_valide = parts[1].upper()
+        
+        if corde_valide == 'TXT':
+            msg = parts[2] if len(parts) > 2 else ""
+            data.append((this_start, this_duration, 'TEXTE', None, msg))
+        elif corde_valide == 'PAGE':
+            data.append((this_start, 0, 'PAGE_BREAK', None, None))
+        else:
             corde_valide = 'SILENCE' if corde_valide=='S' else 'SEPARATOR' if corde_valide=='SEP' else corde_valide
             
             doigt = None; repetition = 1
@@ -370,18 +458,46 @@ def parser_texte(texte):
             # Gestion répétition
             temp_cursor = this_start
             for i in range(repetition):
-                note = {'tick': temp_cursor, 'duration': this_duration, 'corde': corde_valide}
-                if doigt: note['doigt'] = doigt
-                data.append(note)
+                data.append((temp_cursor, this_duration, corde_valide, doigt, None))
                 
                 if i < repetition - 1:
                     temp_cursor += this_duration
                     current_tick = temp_cursor + this_duration # Mise à jour du curseur global si répétition
 
-        except: pass
-        
-    data.sort(key=lambda x: x['tick'])
-    return data
+    except: pass
+    return data, (current_tick, last_note_tick, last_note_duration)
+
+def parser_texte(texte):
+    if not texte: return NoteSequence.depuis_tuples([])
+    data = []; etat = ETAT_PARSER_INITIAL
+    for ligne in texte.strip().split('\n'):
+        notes, etat = parser_ligne(ligne, etat)
+        data.extend(notes)
+    return NoteSequence.depuis_tuples(data)
+
+class ParseurIncremental:
+    # Mémorise les lignes, leurs notes et l'état du parser après chaque ligne :
+    # seul ce qui suit la première ligne modifiée est ré-analysé. Résultat identique à parser_texte.
+    def __init__(self):
+        self.lignes = []; self.notes = []; self.etats = []
+
+    def parser(self, texte):
+        if not texte: return NoteSequence.depuis_tuples([])
+        lignes = texte.strip().split('\n')
+        i = 0; nb_communes = min(len(lignes), len(self.lignes))
+        while i < nb_communes and lignes[i] == self.lignes[i]: i += 1
+        del self.lignes[i:]; del self.notes[i:]; del self.etats[i:]
+        etat = self.etats[-1] if self.etats else ETAT_PARSER_INITIAL
+        for ligne in lignes[i:]:
+            notes, etat = parser_ligne(ligne, etat)
+            self.lignes.append(ligne); self.notes.append(notes); self.etats.append(etat)
+        return NoteSequence.depuis_tuples([n for notes in self.notes for n in notes])
+
+def parser_code_actuel():
+    if 'parseur' not in st.session_state: st.session_state.parseur = ParseurIncremental()
+    with mesure('analyse', caracteres=len(st.session_state.code_actuel)) as m:
+        sequence = st.session_state.parseur.parser(st.session_state.code_actuel); m['notes'] = len(sequence)
+    return sequence
 
 def compiler_arrangement(structure_str, blocks_dict):
     full_text = ""
@@ -407,331 +523,1486 @@ def get_note_freq(note_name):
     base_freqs = {'C': 261.63, 'C#': 277.18, 'D': 293.66, 'Eb': 311.13, 'E': 329.63, 'F': 349.23, 'F#': 369.99, 'G': 392.00, 'G#': 415.30, 'A': 440.00, 'Bb': 466.16, 'B': 493.88}
     return base_freqs.get(note_name[0].upper(), 440.0)
 
-@st.cache_data(show_spinner=False)
-def generer_audio_mix(sequence, bpm, acc_config, preview_mode=False):
-    if not HAS_PYDUB: return None
-    if not sequence: return None
-    
-    samples_loaded = {}
-    cordes_utilisees = set([n['corde'] for n in sequence if n['corde'] in POSITIONS_X])
-    
-    for corde in cordes_utilisees:
-        loaded = False
+# --- MIXAGE NUMPY (un seul buffer float32, additions par tranches) ---
+FREQ_ECHANTILLONNAGE = 44100
+DUREE_FADE_MS = 15
+DUREE_MAX_PREVIEW_MS = 2000
+
+def ms_vers_frames(ms):
+    return int(ms * FREQ_ECHANTILLONNAGE / 1000)
+
+def segment_vers_pcm(segment):
+    segment = segment.set_frame_rate(FREQ_ECHANTILLONNAGE).set_channels(2).set_sample_width(2)
+    pcm = np.frombuffer(segment.raw_data, dtype=np.int16).reshape(-1, 2)
+    return pcm.astype(np.float32) / 32768.0
+
+def pcm_vers_segment(pcm):
+    data = np.clip(pcm * 32768.0, -32768, 32767).astype(np.int16)
+    return importer('pydub').AudioSegment(data.tobytes(), frame_rate=FREQ_ECHANTILLONNAGE, sample_width=2, channels=2)
+
+def pcm_vers_wav(pcm, freq):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1 if pcm.ndim == 1 else pcm.shape[1]); w.setsampwidth(2); w.setframerate(freq)
+        w.writeframes(np.clip(pcm * 32768.0, -32768, 32767).astype('<i2').tobytes())
+    buffer.seek(0)
+    return buffer
+
+# --- PACK PCM PRÉ-CALCULÉ (construire_pack_samples.py) ---
+# En-tête : magic, version, nb d'entrées, fréquence, canaux ; puis l'index (nom, offset, nb frames)
+# et les données int16 entrelacées, chaque entrée alignée sur 64 octets pour des vues memmap directes.
+PACK_MAGIC = b'NGPK'; PACK_VERSION = 1
+PACK_ENTETE = struct.Struct('<4sHHIHH')
+PACK_ENTREE = struct.Struct('<16sQQ')
+PACK_ALIGNEMENT = 64
+
+def ecrire_pack_samples(chemin, samples_pcm):
+    noms = sorted(samples_pcm)
+    offset = PACK_ENTETE.size + PACK_ENTREE.size * len(noms)
+    index = []
+    for nom in noms:
+        offset += -offset % PACK_ALIGNEMENT
+        index.append((nom, offset, len(samples_pcm[nom])))
+        offset += samples_pcm[nom].nbytes
+    # Nom propre à l'écrivain (serveurs, construire_pack_samples.py) : seul os.replace est partagé
+    chemin_tmp = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(chemin_tmp, "wb") as f:
+            f.write(PACK_ENTETE.pack(PACK_MAGIC, PACK_VERSION, len(noms), FREQ_ECHANTILLONNAGE, 2, 0))
+            for nom, off, nb_frames in index: f.write(PACK_ENTREE.pack(nom.encode('utf-8'), off, nb_frames))
+            for nom, off, nb_frames in index:
+                f.write(b'\0' * (off - f.tell()))
+                f.write(np.ascontiguousarray(samples_pcm[nom], dtype='<i2').tobytes())
+        os.replace(chemin_tmp, chemin)
+    except Exception:
+        if os.path.exists(chemin_tmp): os.remove(chemin_tmp)
+        raise
+
+def lire_pack_samples(chemin):
+    # Vues zéro-copie sur le fichier mappé en mémoire : rien n'est décodé ni copié ici
+    data = np.memmap(chemin, dtype=np.uint8, mode='r')
+    magic, version, nb, freq, canaux, _ = PACK_ENTETE.unpack_from(data, 0)
+    if magic != PACK_MAGIC or version != PACK_VERSION or freq != FREQ_ECHANTILLONNAGE or canaux != 2: return {}
+    samples = {}
+    for i in range(nb):
+        nom, off, nb_frames = PACK_ENTREE.unpack_from(data, PACK_ENTETE.size + i * PACK_ENTREE.size)
+        samples[nom.rstrip(b'\0').decode('utf-8')] = data[off:off + nb_frames * 4].view('<i2').reshape(-1, 2)
+    return samples
+
+def pack_samples_a_jour(chemin_pack, dossier):
+    if not os.path.exists(chemin_pack): return False
+    mtime_pack = os.path.getmtime(chemin_pack)
+    return all(os.path.getmtime(p) <= mtime_pack for p in glob.glob(os.path.join(dossier, "*.mp3")))
+
+# --- BANQUE DE SAMPLES PARTAGÉE (décodée une seule fois par processus) ---
+PRECHARGER_SAMPLES = True
+
+class BanqueSamples:
+    def __init__(self, dossier, chemin_pack=None):
+        self.dossier = dossier; self.chemin_pack = chemin_pack
+        self.pcm = {}
+        self.verrou = threading.Lock(); self.verrou_pack = threading.Lock()
+        self.a_sauver = False # Des samples décodés ne sont pas encore dans le pack
+        if chemin_pack and pack_samples_a_jour(chemin_pack, dossier):
+            try: self.pcm.update(lire_pack_samples(chemin_pack))
+            except Exception: pass
+
+    def get(self, nom):
+        # Renvoie le PCM int16 stéréo (frames, 2) de samples/<nom>.mp3, ou None si absent
+        if nom in self.pcm: return self.pcm[nom]
+        chemin = os.path.join(self.dossier, f"{nom}.mp3")
+        if not os.path.exists(chemin): return None
+        with self.verrou:
+            if nom not in self.pcm:
+                sound = importer('pydub').AudioSegment.from_mp3(chemin).set_frame_rate(FREQ_ECHANTILLONNAGE).set_channels(2).set_sample_width(2)
+                self.pcm[nom] = np.frombuffer(sound.raw_data, dtype=np.int16).reshape(-1, 2); self.a_sauver = True
+        return self.pcm[nom]
+
+    def prechauffer(self):
+        for chemin in sorted(glob.glob(os.path.join(self.dossier, "*.mp3"))):
+            try: self.get(os.path.splitext(os.path.basename(chemin))[0])
+            except Exception: pass
+        self.sauver_pack()
+
+    def sauver_pack(self):
+        # Déploiement sans construire_pack_samples.py : le pack se complète à chaque nouveau décodage,
+        # les démarrages suivants le mappent au lieu de relancer ffmpeg
+        if not self.chemin_pack or not self.a_sauver: return
+        with self.verrou_pack:
+            with self.verrou:
+                if not self.a_sauver: return
+                samples = dict(self.pcm); self.a_sauver = False
+            try: ecrire_pack_samples(self.chemin_pack, samples)
+            except OSError: pass
+
+    def memoire_octets(self):
+        # Les vues du pack sont mappées depuis le disque et ne comptent pas dans le tas
+        return sum(p.nbytes for p in list(self.pcm.values()) if not isinstance(p, np.memmap))
+
+@st.cache_resource(show_spinner=False)
+def get_banque_samples():
+    # Préchauffage seulement si le pack est là (il ne décode alors que les MP3 ajoutés depuis) : sans pack,
+    # un démarrage à froid ne lance ni pydub ni ffmpeg, les samples sont décodés à la première écoute
+    banque = BanqueSamples(DOSSIER_SAMPLES, CHEMIN_PACK_SAMPLES)
+    if PRECHARGER_SAMPLES and banque.pcm: threading.Thread(target=banque.prechauffer, daemon=True).start()
+    return banque
+
+if HAS_PYDUB and PRECHARGER_SAMPLES and os.path.exists(CHEMIN_PACK_SAMPLES): get_banque_samples()
+
+def charger_samples_pcm(cordes, acc_config):
+    banque = get_banque_samples()
+    samples_pcm = {}
+    for corde in cordes:
         note_name = acc_config.get(corde, {'n':'C'})['n']
-        chemin = os.path.join(DOSSIER_SAMPLES, f"{note_name}.mp3")
-        
-        if os.path.exists(DOSSIER_SAMPLES):
-            if os.path.exists(chemin): 
-                sound = AudioSegment.from_mp3(chemin) 
-                samples_loaded[corde] = sound
-                loaded = True
-            else:
-                chemin_def = os.path.join(DOSSIER_SAMPLES, f"{corde}.mp3")
-                if os.path.exists(chemin_def):
-                    sound = AudioSegment.from_mp3(chemin_def)
-                    samples_loaded[corde] = sound
-                    loaded = True
-
-        if not loaded:
-            freq = get_note_freq(note_name)
-            duration = 1000 
-            tone = Sine(freq).to_audio_segment(duration=duration).apply_gain(-5)
-            samples_loaded[corde] = tone 
-            
-    if not samples_loaded: return None
-    
+        pcm = banque.get(note_name)
+        if pcm is None: pcm = banque.get(corde)
+        if pcm is not None: samples_pcm[corde] = pcm.astype(np.float32) / 32768.0
+        else: samples_pcm[corde] = segment_vers_pcm(importer('pydub.generators').Sine(get_note_freq(note_name)).to_audio_segment(duration=1000).apply_gain(-5))
+    if banque.a_sauver: threading.Thread(target=banque.sauver_pack, daemon=True).start()
+    return samples_pcm
+
+def preparer_son_joue(pcm, len_to_keep):
+    # Équivalent de sample[:len_to_keep].fade_out(15) en opérations sur tableau
+    if round(len(pcm) * 1000 / FREQ_ECHANTILLONNAGE) <= len_to_keep: return pcm
+    son = pcm[:ms_vers_frames(len_to_keep)].copy()
+    nb_fade = min(len(son), ms_vers_frames(DUREE_FADE_MS))
+    if nb_fade > 0: son[-nb_fade:] *= np.linspace(1.0, 0.0, nb_fade, endpoint=False, dtype=np.float32)[:, None]
+    return son
+
+def placer_notes(sequence, bpm, samples_pcm, preview_mode=False):
+    # Positions et longueurs de toutes les notes calculées d'un coup : (cordes, débuts en frames, ms gardées, frames du mix)
+    sequence = en_note_sequence(sequence)
     ms_par_tick = (60000 / bpm) / TICKS_NOIRE
-    dernier_tick = sequence[-1]['tick'] + sequence[-1]['duration']
-    duree_totale_ms = int(dernier_tick * ms_par_tick) + 1000
-    mix = AudioSegment.silent(duration=duree_totale_ms)
-    
-    for n in sequence:
-        corde = n['corde']
-        if corde in samples_loaded:
-            start_ms = int(n['tick'] * ms_par_tick)
-            duration_ticks = n['duration']
-            note_ms = int(duration_ticks * ms_par_tick)
-            original_sample = samples_loaded[corde]
-            len_to_keep = note_ms
-            if preview_mode and len_to_keep > 2000: len_to_keep = 2000
-            if len(original_sample) > len_to_keep:
-                played_sample = original_sample[:len_to_keep].fade_out(15)
-            else:
-                played_sample = original_sample
-            mix = mix.overlay(played_sample, position=start_ms)
-    
-    buffer = io.BytesIO(); mix.export(buffer, format="mp3", bitrate="128k"); buffer.seek(0)
+    ticks = sequence.ticks.astype(np.int64); durees = sequence.durees.astype(np.int64)
+    duree_totale_ms = int((ticks[-1] + durees[-1]) * ms_par_tick) + 1000
+    nb_frames = ms_vers_frames(duree_totale_ms)
+    starts = ((ticks * ms_par_tick).astype(np.int64) * FREQ_ECHANTILLONNAGE / 1000).astype(np.int64)
+    lens_to_keep = (durees * ms_par_tick).astype(np.int64)
+    if preview_mode: lens_to_keep = np.minimum(lens_to_keep, DUREE_MAX_PREVIEW_MS)
+    jouees = sequence.masque_cordes(samples_pcm) & (starts < nb_frames)
+    return sequence.noms_cordes()[jouees], starts[jouees], lens_to_keep[jouees], nb_frames
+
+def mixer_sequence_pcm(sequence, bpm, samples_pcm, preview_mode=False):
+    cordes, starts, lens_to_keep, nb_frames = placer_notes(sequence, bpm, samples_pcm, preview_mode)
+    mix = np.zeros((nb_frames, 2), dtype=np.float32)
+    sons_joues = {}
+    for corde, start, len_to_keep in zip(cordes.tolist(), starts.tolist(), lens_to_keep.tolist()):
+        cle = (corde, len_to_keep)
+        if cle not in sons_joues: sons_joues[cle] = preparer_son_joue(samples_pcm[corde], len_to_keep)
+        son = sons_joues[cle]
+        fin = min(start + len(son), nb_frames)
+        mix[start:fin] += son[:fin - start]
+    return mix
+
+# --- MIX PAR FENÊTRES (écoute en continu des longs arrangements) ---
+FENETRE_AUDIO_S = 6
+
+def mixer_par_fenetres(sequence, bpm, samples_pcm, preview_mode=False, fenetre_s=FENETRE_AUDIO_S):
+    # Générateur : le même mix que mixer_sequence_pcm, fenêtre après fenêtre. Les sons qui débordent d'une fenêtre
+    # laissent leur queue dans un report ajouté au début de la suivante ; la première fenêtre ne dépend pas de la longueur du morceau.
+    cordes, starts, lens_to_keep, nb_frames = placer_notes(sequence, bpm, samples_pcm, preview_mode)
+    ordre = np.argsort(starts, kind='stable')
+    cordes = cordes[ordre].tolist(); starts = starts[ordre]; lens_to_keep = lens_to_keep[ordre].tolist()
+    taille = ms_vers_frames(fenetre_s * 1000) // 2 * 2 # Nombre pair de frames (réduction d'écoute par paires)
+    sons_joues = {}; report = np.zeros((0, 2), dtype=np.float32); i = 0
+    for debut in range(0, nb_frames, taille):
+        fin = min(debut + taille, nb_frames)
+        j = int(np.searchsorted(starts, fin)); sons = []
+        for corde, start, len_to_keep in zip(cordes[i:j], starts[i:j].tolist(), lens_to_keep[i:j]):
+            cle = (corde, len_to_keep)
+            if cle not in sons_joues: sons_joues[cle] = preparer_son_joue(samples_pcm[corde], len_to_keep)
+            sons.append((start - debut, sons_joues[cle]))
+        bloc = np.zeros((max([fin - debut, len(report)] + [o + len(son) for o, son in sons]), 2), dtype=np.float32)
+        bloc[:len(report)] += report
+        for o, son in sons: bloc[o:o + len(son)] += son
+        report = bloc[fin - debut:]; i = j
+        yield bloc[:fin - debut]
+
+# Lecteur WebAudio de la page (créé une seule fois) : il décode les fenêtres WAV reçues
+# et les programme bout à bout sur la même horloge, donc sans trou entre deux fenêtres.
+# Les fenêtres peuvent arriver dans le désordre (décodage asynchrone) : elles attendent leur tour dans recues.
+# Une lecture arrêtée ou remplacée ne redémarre pas si ses scripts sont remontés par un rerun.
+LECTEUR_FENETRES_JS = """
+window.ngoniLecteur = window.ngoniLecteur || {
+  id: null, ctx: null, fin: 0, suivante: 0, recues: {}, sources: [], passees: new Set(),
+  arreter() {
+    this.sources.forEach(s => { try { s.stop(); } catch (e) {} });
+    if (this.ctx) this.ctx.close();
+    if (this.id) this.passees.add(this.id);
+    this.id = null; this.ctx = null; this.sources = []; this.recues = {};
+  },
+  ajouter(id, i, b64) {
+    if (id !== this.id) {
+      if (this.passees.has(id)) return;
+      this.arreter(); this.id = id; this.suivante = 0;
+      this.ctx = new (window.AudioContext || window.webkitAudioContext)(); this.fin = this.ctx.currentTime + 0.1;
+    }
+    const ctx = this.ctx; const octets = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+    ctx.decodeAudioData(octets.buffer).then(buf => { if (ctx === this.ctx) { this.recues[i] = buf; this.programmer(); } });
+  },
+  programmer() {
+    while (this.recues[this.suivante]) {
+      const buf = this.recues[this.suivante]; delete this.recues[this.suivante]; this.suivante++;
+      const src = this.ctx.createBufferSource(); src.buffer = buf; src.connect(this.ctx.destination);
+      this.fin = Math.max(this.fin, this.ctx.currentTime + 0.05); src.start(this.fin); this.fin += buf.duration;
+      this.sources.push(src);
+    }
+  }
+};
+"""
+
+def html_fenetre_audio(id_lecture, index, wav):
+    return f"""<script>{LECTEUR_FENETRES_JS}
+window.ngoniLecteur.ajouter({json.dumps(id_lecture)}, {index}, "{base64.b64encode(wav).decode('ascii')}");
+</script>"""
+
+HTML_ARRET_LECTURE = "<script>window.ngoniLecteur && window.ngoniLecteur.arreter();</script>"
+
+def lire_en_fenetres(sequence, bpm, acc_config):
+    # Chaque fenêtre part vers le navigateur dès qu'elle est mixée : la lecture commence pendant le mixage de la suite.
+    # Un élément par fenêtre : remplacer le même st.empty() laisserait le navigateur sauter les deltas intermédiaires.
+    sequence = en_note_sequence(sequence)
+    if not module_utilisable('pydub') or not sequence: return False
+    cordes_utilisees = set(sequence.noms_cordes()[sequence.masque_cordes(POSITIONS_X)].tolist())
+    samples_pcm = charger_samples_pcm(cordes_utilisees, acc_config)
+    if not samples_pcm: return False
+    id_lecture = f"{sequence.empreinte()}-{time.time()}"
+    zone = st.container(); t0 = time.perf_counter(); nb = 0
+    for nb, fenetre in enumerate(mixer_par_fenetres(sequence, bpm, samples_pcm), start=1):
+        wav = pcm_vers_wav(reduire_pour_ecoute(fenetre), FREQ_ECOUTE).getvalue()
+        zone.html(html_fenetre_audio(id_lecture, nb - 1, wav), unsafe_allow_javascript=True)
+        if nb == 1: enregistrer_etape('premiere_fenetre', (time.perf_counter() - t0) * 1000, notes=len(sequence))
+    enregistrer_etape('fenetres_audio', (time.perf_counter() - t0) * 1000, fenetres=nb)
+    return True
+
+# --- RENDU AUDIO : WAV immédiat pour l'écoute, MP3 encodé seulement au téléchargement ---
+FREQ_ECOUTE = 22050 # Écoute dans le navigateur : mono 22,05 kHz, 4x plus léger que le WAV complet
+TAILLE_MAX_CACHE_AUDIO = 256 * 1024 * 1024
+AGE_MAX_CACHE_AUDIO_S = 24 * 3600
+DEBITS_AUDIO = {'mp3': "128k"}
+
+def mixer_audio(sequence, bpm, acc_config, preview_mode=False):
+    sequence = en_note_sequence(sequence)
+    cordes_utilisees = set(sequence.noms_cordes()[sequence.masque_cordes(POSITIONS_X)].tolist())
+    samples_pcm = charger_samples_pcm(cordes_utilisees, acc_config)
+    if not samples_pcm: return None
+    with mesure('mixage_audio', notes=len(sequence)): return mixer_sequence_pcm(sequence, bpm, samples_pcm, preview_mode)
+
+def reduire_pour_ecoute(mix):
+    # Stéréo 44,1 kHz -> mono 22,05 kHz : moyenne des deux canaux sur chaque paire de frames
+    nb = len(mix) // 2 * 2
+    return mix[:nb].reshape(-1, 4).mean(axis=1)
+
+@st.cache_data(show_spinner=False, max_entries=16, hash_funcs={NoteSequence: lambda s: s.empreinte()})
+def generer_audio_mix(sequence, bpm, acc_config, preview_mode=False, complet=False):
+    # WAV sans encodeur : écoute (mono 22,05 kHz) ou complet (44,1 kHz stéréo, piste de la vidéo)
+    if not module_utilisable('pydub'): return None
+    if not sequence: return None
+    mix = mixer_audio(sequence, bpm, acc_config, preview_mode)
+    if mix is None: return None
+    with mesure('export_wav') as m:
+        buffer = pcm_vers_wav(mix, FREQ_ECHANTILLONNAGE) if complet else pcm_vers_wav(reduire_pour_ecoute(mix), FREQ_ECOUTE)
+        m['octets'] = buffer.getbuffer().nbytes
     return buffer
 
-@st.cache_data(show_spinner=False)
-def generer_metronome(bpm, duration_sec=30, signature="4/4"):
-    if not HAS_PYDUB: return None
-    shaker_acc = WhiteNoise().to_audio_segment(duration=60).fade_out(50)
-    click_acc = Sine(1500).to_audio_segment(duration=20).fade_out(20).apply_gain(-10)
-    sound_accent = shaker_acc.overlay(click_acc).apply_gain(-2)
-    sound_normal = WhiteNoise().to_audio_segment(duration=40).fade_out(35).apply_gain(-8)
-    ms_per_beat = 60000 / bpm
-    silence_acc = max(0, ms_per_beat - len(sound_accent))
-    silence_norm = max(0, ms_per_beat - len(sound_normal))
-    beat_accent = sound_accent + AudioSegment.silent(duration=silence_acc)
-    beat_normal = sound_normal + AudioSegment.silent(duration=silence_norm)
-    if signature == "3/4": measure_block = beat_accent + beat_normal + beat_normal
-    else: measure_block = beat_accent + beat_normal + beat_normal + beat_normal
-    nb_mesures = int((duration_sec * 1000) / len(measure_block)) + 1
-    metronome_track = (measure_block * nb_mesures)[:int(duration_sec*1000)]
+def cle_audio(sequence, bpm, acc_config, format_audio):
+    config = sorted([k, v['n']] for k, v in acc_config.items())
+    entrees = [en_note_sequence(sequence).empreinte(), bpm, config, DEBITS_AUDIO[format_audio]]
+    return hashlib.blake2b(json.dumps(entrees).encode('utf-8'), digest_size=20).hexdigest() + '.' + format_audio
+
+def encoder_audio_mix(sequence, bpm, acc_config, format_audio='mp3', cache=None):
+    # Appelé par le bouton de téléchargement : encodé une seule fois, puis relu depuis le cache disque
+    cache = cache or get_cache_audio(); cle = cle_audio(sequence, bpm, acc_config, format_audio)
+    data = cache.lire(cle)
+    if data is not None: return data
+    mix = mixer_audio(sequence, bpm, acc_config)
+    if mix is None: return b""
+    with mesure(f'export_{format_audio}') as m:
+        buffer = io.BytesIO(); pcm_vers_segment(mix).export(buffer, format=format_audio, bitrate=DEBITS_AUDIO[format_audio]); data = buffer.getvalue()
+        m['octets'] = len(data)
+    cache.ecrire(cle, data)
+    return data
+
+# --- MÉTRONOME NUMPY (une mesure synthétisée une fois, puis répétée) ---
+FREQ_METRONOME = 22050
+DUREE_MIN_BOUCLE_S = 4.0 # La boucle WAV contient assez de mesures entières pour durer au moins ça
+SIGNATURES_METRONOME = ["4/4", "3/4", "2/4", "5/4", "6/8", "7/8", "12/8"]
+SUBDIVISIONS_METRONOME = {"Aucune": 1, "Croches": 2, "Triolets": 3, "Doubles": 4}
+
+def parser_signature(signature):
+    # "7/8" -> (7, 8) ; un texte invalide retombe sur 4/4
+    try: nb, unite = (int(v) for v in str(signature).split('/'))
+    except ValueError: return 4, 4
+    if nb < 1 or unite not in (1, 2, 4, 8, 16): return 4, 4
+    return nb, unite
+
+def accents_signature(nb, unite):
+    # 2 = premier temps, 1 = accent secondaire (x/8 composées : groupes de 3 croches), 0 = temps faible
+    groupe = 3 if unite == 8 and nb % 3 == 0 and nb > 3 else nb
+    return [2 if i == 0 else (1 if i % groupe == 0 else 0) for i in range(nb)]
+
+def son_clic(duree_ms, fade_ms, gain_db, rng=None, freq=None):
+    # Bruit blanc (rng) ou sinus (freq), fondu linéaire sur la fin, comme WhiteNoise/Sine + fade_out de pydub
+    n = int(FREQ_METRONOME * duree_ms / 1000)
+    son = np.sin(2 * np.pi * freq * np.arange(n) / FREQ_METRONOME) if freq else rng.uniform(-1.0, 1.0, n)
+    nb_fade = min(n, int(FREQ_METRONOME * fade_ms / 1000)); son[n - nb_fade:] *= np.linspace(1.0, 0.0, nb_fade, endpoint=False)
+    return (son * 10 ** (gain_db / 20)).astype(np.float32)
+
+def sons_metronome():
+    rng = np.random.default_rng(0) # Bruit figé : la même mesure à chaque synthèse
+    accent = son_clic(60, 50, 0, rng); accent[:int(FREQ_METRONOME * 0.02)] += son_clic(20, 20, -10, freq=1500)
+    return {2: np.clip(accent * 10 ** (-2 / 20), -1, 1), 1: son_clic(40, 35, -4, rng), 0: son_clic(40, 35, -8, rng), -1: son_clic(25, 20, -16, rng)}
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def synthetiser_mesure_metronome(bpm, signature="4/4", subdivision=1, swing=0.0):
+    # Une mesure mono float32 ; chaque temps de la signature (noire en x/4, croche en x/8) dure 60/bpm s.
+    # swing (0 à 1) retarde les subdivisions impaires jusqu'au placement ternaire (2/3 du temps à 1.0).
+    nb, unite = parser_signature(signature); sons = sons_metronome()
+    frames_temps = FREQ_METRONOME * 60 / bpm
+    bloc = np.zeros(int(round(nb * frames_temps)), dtype=np.float32)
+    for i, niveau in enumerate(accents_signature(nb, unite)):
+        for k in range(subdivision):
+            decalage = (k + (swing / 3 if k % 2 and subdivision % 2 == 0 else 0)) / subdivision
+            son = sons[niveau if k == 0 else -1]; debut = int(round((i + decalage) * frames_temps))
+            # Addition circulaire : une queue qui dépasse la mesure retombe au début, la boucle reste sans couture
+            np.add.at(bloc, (debut + np.arange(len(son))) % len(bloc), son)
+    return np.clip(bloc, -1, 1)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def generer_metronome(bpm, duration_sec=None, signature="4/4", subdivision=1, swing=0.0):
+    # Sans durée : courte boucle WAV (mesures entières) à lire avec st.audio(loop=True), taille indépendante de la durée ;
+    # avec durée : piste MP3 complète, la mesure étant simplement répétée
+    bloc = synthetiser_mesure_metronome(bpm, signature, subdivision, swing)
+    if duration_sec is None:
+        nb_mesures = max(1, -(-int(DUREE_MIN_BOUCLE_S * FREQ_METRONOME) // len(bloc)))
+        return pcm_vers_wav(np.tile(bloc, nb_mesures), FREQ_METRONOME)
+    if not module_utilisable('pydub'): return None
+    nb_frames = int(duration_sec * FREQ_METRONOME)
+    piste = np.tile(bloc, -(-nb_frames // len(bloc)))[:nb_frames]
+    data = np.clip(piste * 32768.0, -32768, 32767).astype(np.int16)
     buffer = io.BytesIO()
-    metronome_track.export(buffer, format="mp3", bitrate="32k", parameters=["-preset", "ultrafast"])
+    importer('pydub').AudioSegment(data.tobytes(), frame_rate=FREQ_METRONOME, sample_width=2, channels=1).export(buffer, format="mp3", bitrate="32k", parameters=["-preset", "ultrafast"])
     buffer.seek(0)
     return buffer
 
 # ==============================================================================
-# 🎨 MOTEUR AFFICHAGE
+# 🎼 MIDI (EXPORT / IMPORT)
 # ==============================================================================
-def dessiner_contenu_legende(ax, y_pos, styles, mode_white=False):
-    c_txt = styles['TEXTE']; c_fond = styles['LEGENDE_FOND']
-    prop_annotation = get_font_cached(16, 'bold'); prop_legende = get_font_cached(12, 'bold')
-    img_pouce = load_image_asset(CHEMIN_ICON_POUCE_BLANC if mode_white else CHEMIN_ICON_POUCE)
-    img_index = load_image_asset(CHEMIN_ICON_INDEX_BLANC if mode_white else CHEMIN_ICON_INDEX)
-
-    rect = patches.FancyBboxPatch((-7.5, y_pos - 3.6), 15, 3.3, boxstyle="round,pad=0.1", linewidth=1.5, edgecolor=c_txt, facecolor=c_fond, zorder=0); ax.add_patch(rect)
-    ax.text(0, y_pos - 0.6, "LÉGENDE", ha='center', va='center', fontsize=14, fontweight='bold', color=c_txt, fontproperties=prop_annotation)
-    x_icon_center = -5.5; x_text_align = -4.5; y_row1 = y_pos - 1.2; y_row2 = y_pos - 1.8; y_row3 = y_pos - 2.4; y_row4 = y_pos - 3.0
-    
-    if img_pouce is not None: ab = AnnotationBbox(OffsetImage(img_pouce, zoom=0.045), (x_icon_center, y_row1), frameon=False); ax.add_artist(ab)
-    ax.text(x_text_align, y_row1, "= Pouce", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
-    
-    if img_index is not None: ab = AnnotationBbox(OffsetImage(img_index, zoom=0.045), (x_icon_center, y_row2), frameon=False); ax.add_artist(ab)
-    ax.text(x_text_align, y_row2, "= Index", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
-    
-    ax.text(0, y_row3, "RYTHMES :  + = Noire  |  ♪ = Croche  |  🎶 = Triolet  |  ♬ = Double", ha='center', va='center', fontsize=12, fontweight='bold', color=c_txt)
-
-    x_droite = 1.5; y_text_top = y_pos - 1.2; line_height = 0.45
-    ax.plot([x_droite + 0.5, 6.0], [y_text_top + 0.2, y_text_top + 0.2], color='black', lw=2)
-    ax.text(x_droite + 0.2, y_text_top + 0.2, "G", ha='right', va='center', fontsize=14, fontweight='bold', color=c_txt)
-    ax.text(6.3, y_text_top + 0.2, "D", ha='left', va='center', fontsize=14, fontweight='bold', color=c_txt)
-    ax.text(x_droite, y_text_top - line_height, "1G = 1ère corde à gauche", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
-    ax.text(x_droite, y_text_top - line_height*2, "2G = 2ème corde à gauche", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
-
-def generer_page_1_legende(titre, styles, mode_white=False):
-    c_fond = styles['FOND']; c_txt = styles['TEXTE']; prop_titre = get_font_cached(32, 'bold')
-    fig = Figure(figsize=(16, 8), facecolor=c_fond)
-    ax = fig.subplots()
-    ax.set_facecolor(c_fond)
-    ax.text(0, 2.5, titre, ha='center', va='bottom', fontproperties=prop_titre, color=c_txt)
-    dessiner_contenu_legende(ax, 0.5, styles, mode_white)
-    ax.set_xlim(-7.5, 7.5); ax.set_ylim(-6, 4); ax.axis('off')
-    return fig
-
-def generer_page_notes(notes_page, idx, titre, config_acc, styles, options_visuelles, mode_white=False):
-    c_fond = styles['FOND']; c_txt = styles['TEXTE']; c_perle = styles['PERLE_FOND']
-    img_pouce = load_image_asset(CHEMIN_ICON_POUCE_BLANC if mode_white else CHEMIN_ICON_POUCE)
-    img_index = load_image_asset(CHEMIN_ICON_INDEX_BLANC if mode_white else CHEMIN_ICON_INDEX)
-    
-    tick_min = notes_page[0]['tick']
-    tick_max = notes_page[-1]['tick'] + 12 
-    hauteur_unites = (tick_max - tick_min) / 12.0
-    hauteur_fig = max(6, (hauteur_unites * 0.75) + 6)
-    
-    fig = Figure(figsize=(16, hauteur_fig), facecolor=c_fond)
-    ax = fig.subplots()
-    ax.set_facecolor(c_fond)
-    
-    y_top = 2.5; y_bot = - hauteur_unites - 1.5; y_top_cordes = y_top
-    prop_titre = get_font_cached(32, 'bold'); prop_texte = get_font_cached(20, 'bold')
-    prop_note_us = get_font_cached(24, 'bold'); prop_note_eu = get_font_cached(18, 'normal', 'italic')
-    prop_numero = get_font_cached(14, 'bold'); prop_standard = get_font_cached(14, 'bold')
-    prop_annotation = get_font_cached(16, 'bold')
-    
-    if not mode_white and options_visuelles['use_bg']:
-        img_fond = load_image_asset(CHEMIN_IMAGE_FOND)
-        if img_fond is not None:
-            try:
-                h_px, w_px = img_fond.shape[:2]; ratio = w_px / h_px
-                largeur_finale = 15.0 * 0.7; hauteur_finale = (largeur_finale / ratio) * 1.4
-                y_center = (y_top + y_bot) / 2
-                extent = [-largeur_finale/2, largeur_finale/2, y_center - hauteur_finale/2, y_center + hauteur_finale/2]
-                ax.imshow(img_fond, extent=extent, aspect='auto', zorder=-1, alpha=options_visuelles['alpha'])
-            except: pass
-            
-    ax.text(0, y_top + 3.0, f"{titre} (Page {idx})", ha='center', va='bottom', fontproperties=prop_titre, color=c_txt)
-    ax.text(-3.5, y_top_cordes + 2.0, "Cordes de Gauche", ha='center', va='bottom', fontproperties=prop_texte, color=c_txt)
-    ax.text(3.5, y_top_cordes + 2.0, "Cordes de Droite", ha='center', va='bottom', fontproperties=prop_texte, color=c_txt)
-    ax.vlines(0, y_bot, y_top_cordes + 1.8, color=c_txt, lw=5, zorder=2)
-    
-    for code, props in config_acc.items():
-        x = props['x']; note = props['n']; 
-        c = get_color_for_note(note)
-        ax.text(x, y_top_cordes + 1.3, code, ha='center', color='gray', fontproperties=prop_numero)
-        ax.text(x, y_top_cordes + 0.7, note, ha='center', color=c, fontproperties=prop_note_us)
-        ax.text(x, y_top_cordes + 0.1, TRADUCTION_NOTES.get(note[0].upper(), '?'), ha='center', color=c, fontproperties=prop_note_eu)
-        ax.vlines(x, y_bot, y_top_cordes, colors=c, lw=3, zorder=1)
-    
-    start_beat_tick = (tick_min // 12) * 12
-    for t in range(start_beat_tick, tick_max + 12, 12):
-        y = - ((t - tick_min) / 12.0)
-        ax.axhline(y=y, color='#666666', linestyle='-', linewidth=1, alpha=0.7, zorder=0.5)
-
-    map_labels = {}; last_sep_tick = tick_min - 12
-    processed_t = set()
-    for n in notes_page:
-        t = n['tick']
-        if n['corde'] in ['SEPARATOR', 'TEXTE']: last_sep_tick = t
-        elif t % 12 == 0 and t not in processed_t:
-            num_temps = (t - last_sep_tick) // 12
-            if num_temps > 0: map_labels[t] = str(num_temps)
-            processed_t.add(t)
-            
-    notes_par_tick = {}; rayon = 0.30
-    for n in notes_page:
-        tick_absolu = n['tick']
-        y = - ((tick_absolu - tick_min) / 12.0)
-        if y not in notes_par_tick: notes_par_tick[y] = []
-        notes_par_tick[y].append(n); code = n['corde']
-        
-        if code == 'TEXTE': 
-            bbox = dict(boxstyle="round,pad=0.5", fc=c_perle, ec=c_txt, lw=2)
-            ax.text(0, y, n.get('message',''), ha='center', va='center', color='black', fontproperties=prop_annotation, bbox=bbox, zorder=10)
-        elif code == 'SEPARATOR': 
-            ax.axhline(y, color=c_txt, lw=3, zorder=4)
-        elif code in config_acc:
-            props = config_acc[code]; x = props['x']; c = get_color_for_note(props['n'])
-            ax.add_patch(patches.Circle((x, y), rayon, color=c_perle, zorder=3))
-            ax.add_patch(patches.Circle((x, y), rayon, fill=False, edgecolor=c, lw=3, zorder=4))
-            label = map_labels.get(tick_absolu, "")
-            ax.text(x, y, label, ha='center', va='center', color='black', fontproperties=prop_standard, zorder=6)
-            if 'doigt' in n:
-                doigt = n['doigt']; current_img = img_index if doigt == 'I' else img_pouce
-                if current_img is not None:
-                    try: ab = AnnotationBbox(OffsetImage(current_img, zoom=0.045), (x - 0.70, y + 0.1), frameon=False, zorder=8); ax.add_artist(ab)
-                    except: pass
-                else: ax.text(x - 0.70, y, doigt, ha='center', va='center', color=c_txt, fontproperties=prop_standard, zorder=7)
-    
-    for y, group in notes_par_tick.items():
-        xs = [config_acc[n['corde']]['x'] for n in group if n['corde'] in config_acc]
-        if len(xs) > 1: ax.plot([min(xs), max(xs)], [y, y], color=c_txt, lw=2, zorder=2)
-
-    sorted_notes = sorted([n for n in notes_page if n['corde'] in config_acc], key=lambda x: x['tick'])
-    for i in range(len(sorted_notes) - 1):
-        n1 = sorted_notes[i]; n2 = sorted_notes[i+1]
-        if n1['duration'] < 12 and n2['duration'] < 12:
-            beat1 = n1['tick'] // 12; beat2 = n2['tick'] // 12
-            if beat1 == beat2:
-                y1 = - ((n1['tick'] - tick_min) / 12.0); y2 = - ((n2['tick'] - tick_min) / 12.0)
-                lw_link = 3 if n1['duration'] <= 4 else 1.5
-                color_link = '#A67C52'
-                if n1['duration'] == 3:
-                      ax.plot([-0.2, -0.2], [y1, y2], color=color_link, lw=lw_link, zorder=2, alpha=0.7)
-                      ax.plot([-0.3, -0.3], [y1, y2], color=color_link, lw=lw_link, zorder=2, alpha=0.7)
-                else:
-                      ax.plot([-0.2, -0.2], [y1, y2], color=color_link, lw=lw_link, zorder=2, alpha=0.7)
-            
-    ax.set_xlim(-7.5, 7.5); ax.set_ylim(y_bot, y_top + 5); ax.axis('off')
-    return fig
-
-def generer_image_longue_calibree(sequence, config_acc, styles, dpi=72):
-    if not sequence: return None, 0, 0
-    t_min = sequence[0]['tick']; t_max = sequence[-1]['tick']
-    hauteur_unites = (t_max - t_min) / 12.0
-    y_max_header = 3.0; y_min_footer = -hauteur_unites - 2.0
-    FIG_WIDTH = 16; FIG_HEIGHT = (y_max_header - y_min_footer) * 0.8; DPI = dpi
-    c_fond = styles['FOND']; c_txt = styles['TEXTE']; c_perle = styles['PERLE_FOND']
-    fig = Figure(figsize=(FIG_WIDTH, FIG_HEIGHT), dpi=DPI, facecolor=c_fond)
-    ax = fig.subplots()
-    ax.set_facecolor(c_fond)
-    ax.set_ylim(y_min_footer, y_max_header); ax.set_xlim(-7.5, 7.5)
-    y_top = 2.0; y_bot = y_min_footer + 1.0 
-    prop_note_us = get_font_cached(24, 'bold'); prop_note_eu = get_font_cached(18, 'normal', 'italic'); prop_numero = get_font_cached(14, 'bold'); prop_standard = get_font_cached(14, 'bold'); prop_annotation = get_font_cached(16, 'bold')
-    img_pouce = load_image_asset(CHEMIN_ICON_POUCE_BLANC if c_fond == 'white' else CHEMIN_ICON_POUCE)
-    img_index = load_image_asset(CHEMIN_ICON_INDEX_BLANC if c_fond == 'white' else CHEMIN_ICON_INDEX)
-
-    ax.vlines(0, y_bot, y_top + 1.8, color=c_txt, lw=5, zorder=2)
-    for code, props in config_acc.items():
-        x = props['x']; note = props['n']; c = get_color_for_note(note)
-        ax.text(x, y_top + 1.3, code, ha='center', color='gray', fontproperties=prop_numero); ax.text(x, y_top + 0.7, note, ha='center', color=c, fontproperties=prop_note_us); ax.text(x, y_top + 0.1, TRADUCTION_NOTES.get(note[0].upper(), '?'), ha='center', color=c, fontproperties=prop_note_eu); ax.vlines(x, y_bot, y_top, colors=c, lw=3, zorder=1)
-    
-    start_beat = (t_min // 12) * 12
-    for t in range(start_beat, t_max + 12, 12):
-        y = - ((t - t_min) / 12.0)
-        ax.axhline(y=y, color='#666666', linestyle='-', linewidth=1, alpha=0.7, zorder=0.5)
-        
-    notes_par_tick = {}; rayon = 0.30
+MIDI_TICKS_PAR_NOIRE = 480 # Multiple de TICKS_NOIRE : chaque tick de tablature tombe sur un tick MIDI entier
+CANAUX_DOIGTS = {'P': 0, 'I': 1} # Le doigté voyage dans le canal MIDI (canal 2 = sans doigté)
+DOIGTS_CANAUX = {v: k for k, v in CANAUX_DOIGTS.items()}
+MARQUEURS_MIDI = {'PAGE_BREAK': 'PAGE', 'SEPARATOR': 'SEP'}
+GRILLES_IMPORT_MIDI = {"Exacte": 1, "♬ Doubles": TICKS_DOUBLE, "🎶 Triolets": TICKS_TRIOLET, "♪ Croches": TICKS_CROCHE}
+
+def note_vers_midi(note):
+    val = get_note_value(note)
+    if val == -1: val = get_note_value(f"{note}4") # Note sans octave : octave 4
+    return val + 12 if val != -1 else 60 # get_note_value compte C0 = 0, le MIDI C-1 = 0
+
+def exporter_midi(sequence, acc_config, bpm=100, titre=None):
+    # Fichier type 0 : hauteur = accordage courant de la corde, doigté dans le canal,
+    # TXT en événements texte, PAGE/SEP en marqueurs ; tick MIDI = tick de tablature × 40, sans arrondi
+    mido = importer('mido'); sequence = en_note_sequence(sequence)
+    echelle = MIDI_TICKS_PAR_NOIRE // TICKS_NOIRE
+    evenements = [] # (tick MIDI, ordre, message) ; à tick égal : fins de notes, puis textes, puis attaques
     for n in sequence:
-        if n['corde'] == 'PAGE_BREAK': continue 
-        t_absolu = n['tick']; y = - ((t_absolu - t_min) / 12.0)
-        if y not in notes_par_tick: notes_par_tick[y] = []
-        notes_par_tick[y].append(n); code = n['corde']
-        
-        if code == 'TEXTE': bbox = dict(boxstyle="round,pad=0.5", fc=c_perle, ec=c_txt, lw=2); ax.text(0, y, n.get('message',''), ha='center', va='center', color='black', fontproperties=prop_annotation, bbox=bbox, zorder=10)
-        elif code == 'SEPARATOR': ax.axhline(y, color=c_txt, lw=3, zorder=4)
-        elif code in config_acc:
-            props = config_acc[code]; x = props['x']; c = get_color_for_note(props['n'])
-            ax.add_patch(patches.Circle((x, y), rayon, color=c_perle, zorder=3)); ax.add_patch(patches.Circle((x, y), rayon, fill=False, edgecolor=c, lw=3, zorder=4))
-            if 'doigt' in n:
-                doigt = n['doigt']; current_img = img_index if doigt == 'I' else img_pouce
-                if current_img is not None:
-                    try: ab = AnnotationBbox(OffsetImage(current_img, zoom=0.045), (x - 0.70, y + 0.1), frameon=False, zorder=8); ax.add_artist(ab)
-                    except: pass
-                else: ax.text(x - 0.70, y, doigt, ha='center', va='center', color=c_txt, fontproperties=prop_standard, zorder=7)
-    for y, group in notes_par_tick.items():
-        xs = [config_acc[n['corde']]['x'] for n in group if n['corde'] in config_acc]; 
-        if len(xs) > 1: ax.plot([min(xs), max(xs)], [y, y], color=c_txt, lw=2, zorder=2)
-    ax.axis('off')
-    
-    px_y_t0 = ax.transData.transform((0, 0))[1]
-    px_y_t1 = ax.transData.transform((0, -1))[1] 
-    total_h_px = FIG_HEIGHT * DPI
-    pixels_par_temps = px_y_t0 - px_y_t1
-    offset_premiere_note_px = total_h_px - px_y_t0
-    buf = io.BytesIO(); fig.savefig(buf, format='png', dpi=DPI, facecolor=c_fond, bbox_inches=None)
-    buf.seek(0)
-    plt.close(fig) 
-    return buf, pixels_par_temps, offset_premiere_note_px
-
-def creer_video_avec_son_calibree(image_buffer, audio_buffer, duration_sec, metrics, bpm, fps=15):
+        t = n['tick'] * echelle; corde = n['corde']
+        if corde in acc_config and corde in POSITIONS_X:
+            hauteur = note_vers_midi(acc_config[corde]['n']); canal = CANAUX_DOIGTS.get(n.get('doigt'), 2)
+            evenements.append((t, 2, mido.Message('note_on', channel=canal, note=hauteur, velocity=100)))
+            evenements.append((t + max(1, n['duration']) * echelle, 0, mido.Message('note_off', channel=canal, note=hauteur, velocity=0)))
+        elif corde == 'TEXTE': evenements.append((t, 1, mido.MetaMessage('text', text=n.get('message', ""))))
+        elif corde in MARQUEURS_MIDI: evenements.append((t, 1, mido.MetaMessage('marker', text=MARQUEURS_MIDI[corde])))
+    evenements.sort(key=lambda e: (e[0], e[1]))
+    piste = mido.MidiTrack()
+    if titre: piste.append(mido.MetaMessage('track_name', name=titre))
+    piste.append(mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(bpm)))
+    piste.append(mido.MetaMessage('time_signature', numerator=4, denominator=4))
+    precedent = 0
+    for t, _, msg in evenements: piste.append(msg.copy(time=t - precedent)); precedent = t
+    fichier = mido.MidiFile(type=0, ticks_per_beat=MIDI_TICKS_PAR_NOIRE, charset='utf-8'); fichier.tracks.append(piste)
+    buffer = io.BytesIO(); fichier.save(file=buffer); buffer.seek(0)
+    return buffer
+
+def table_cordes_midi(acc_config):
+    # Hauteur MIDI -> corde dont l'accordage courant est le plus proche (après repli à l'octave dans la tessiture) ;
+    # à distance égale, une corde qui peut être accordée sur cette note (get_valid_notes_for_string) passe devant
+    accord = {c: note_vers_midi(acc_config[c]['n']) for c in ORDRE_MAPPING_GAMME if c in acc_config}
+    atteignables = {c: {note_vers_midi(n) for n in get_valid_notes_for_string(c) if get_note_value(n) != -1} for c in accord}
+    bas = min(accord.values()); haut = max(accord.values())
+    table = []
+    for hauteur in range(128):
+        if hauteur < bas: hauteur += 12 * -(-(bas - hauteur) // 12)
+        elif hauteur > haut: hauteur -= 12 * -(-(hauteur - haut) // 12)
+        table.append(min(accord, key=lambda c: (abs(accord[c] - hauteur), hauteur not in atteignables[c])))
+    return table
+
+def ecart_ecrivable(ecart):
+    # Sommes de 12, 6, 4 et 3 : tout sauf 1, 2 et 5
+    return ecart in (0, 3, 4) or ecart >= 6
+
+def decomposer_duree(ecart, premiere=None):
+    # Écart entre deux attaques -> symboles de durée ; la durée propre de la note (premiere) ouvre la liste si elle tient
+    durees = {d: s for s, d in SYMBOLES_DUREE.items()}
+    if premiere in durees and premiere <= ecart and ecart_ecrivable(ecart - premiere): parts = [durees[premiere]]; ecart -= premiere
+    else: parts = []
+    while ecart > 0:
+        d = next(d for d in sorted(durees, reverse=True) if d <= ecart and ecart_ecrivable(ecart - d))
+        parts.append(durees[d]); ecart -= d
+    return parts
+
+def importer_midi(data, acc_config, grille=1):
+    # Un seul passage sur les messages : les événements sont regroupés par attaque quantifiée sur la grille
+    # (en ticks de tablature, 1 = exacte) et chaque groupe est écrit dès que l'attaque suivante est connue.
+    # Un écart impossible à écrire (1, 2 ou 5 ticks) est arrondi et le décalage reporté sur la suite.
+    mido = importer('mido')
+    try: fichier = mido.MidiFile(file=io.BytesIO(data), charset='utf-8')
+    except UnicodeDecodeError: fichier = mido.MidiFile(file=io.BytesIO(data), charset='latin1')
+    table = table_cordes_midi(acc_config)
+    echelle = TICKS_NOIRE / fichier.ticks_per_beat
+    messages = fichier.tracks[0] if len(fichier.tracks) == 1 else mido.merge_tracks(fichier.tracks)
+    lignes = []; groupe = []; t_groupe = 0; tete = None; duree_tete = None; tick = 0; derniere_fin = 0; bpm = None
+
+    def ecrire_groupe(ecart):
+        parts = decomposer_duree(ecart, duree_tete)
+        for i, contenu in enumerate(groupe): lignes.append(f"{parts[0] if i == 0 else '='}   {contenu}")
+        for s in (parts[1:] if groupe else parts): lignes.append(f"{s}   S")
+
+    for msg in messages:
+        tick += msg.time
+        q = int(round(tick * echelle / grille)) * grille
+        if msg.type == 'set_tempo':
+            if bpm is None: bpm = int(round(mido.tempo2bpm(msg.tempo)))
+            continue
+        if msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            derniere_fin = max(derniere_fin, q)
+            if duree_tete is None and (msg.channel, msg.note) == tete: duree_tete = max(0, q - t_groupe)
+            continue
+        if msg.type == 'note_on':
+            corde = table[msg.note]; doigt = DOIGTS_CANAUX.get(msg.channel)
+            contenu = f"{corde}   {doigt}" if doigt and doigt != AUTOMATIC_FINGERING.get(corde) else corde
+        elif msg.type == 'marker' and msg.text.strip().upper() in MARQUEURS_MIDI.values(): contenu = msg.text.strip().upper()
+        elif msg.type in ('text', 'marker') and msg.text.strip(): contenu = f"TXT  {msg.text.strip()}"
+        else: continue
+        ecart = q - t_groupe
+        if ecart == 1 and groupe: ecart = 0 # Trop proche : rejoint l'accord en cours
+        elif not ecart_ecrivable(ecart): ecart = {1: 3, 2: 3, 5: 4}.get(ecart, 0)
+        if ecart > 0: ecrire_groupe(ecart); groupe = []; t_groupe += ecart; tete = None; duree_tete = None
+        if tete is None and msg.type == 'note_on': tete = (msg.channel, msg.note)
+        groupe.append(contenu); derniere_fin = max(derniere_fin, q)
+    if groupe:
+        fin = max(derniere_fin - t_groupe, duree_tete or 0, 3)
+        ecrire_groupe(fin if ecart_ecrivable(fin) else fin + 1)
+    if lignes and lignes[0].startswith('+'): lignes[0] = '1' + lignes[0][1:] # Même en-tête que les morceaux de la banque
+    return "\n".join(lignes), bpm or 100
+
+# ==============================================================================
+# 🔗 LIENS DE PARTAGE (tablature tokenisée, compressée, versionnée)
+# ==============================================================================
+# Jeton = base64 URL-safe de [version] + zlib(corps). Corps : drapeaux, lignes, puis accordage et blocs si demandés.
+# Une ligne de tablature tient en 1 octet (rythme sur 3 bits, contenu sur 4 bits, bit 7 = modificateurs),
+# + 1 octet de modificateurs (doigt, répétition) ; TXT et lignes non reconnues gardent leur texte.
+# Les espacements sont normalisés au décodage (même analyse, même rendu).
+VERSION_LIEN = 1
+RYTHMES_LIEN = ['1', '+', '♪', '🎶', '♬', '=']
+CONTENUS_LIEN = ORDRE_MAPPING_GAMME + ['S', 'SEP', 'PAGE']
+INDEX_CONTENUS_LIEN = {c: i for i, c in enumerate(CONTENUS_LIEN)}
+CONTENU_TXT_LIEN = 15; RYTHME_BRUT_LIEN = 7
+DOIGTS_LIEN = {'I': 1, 'P': 2}; LIEN_DOIGTS = {v: k for k, v in DOIGTS_LIEN.items()}
+DRAPEAU_ACCORDAGE = 1; DRAPEAU_BLOCS = 2
+TAILLE_MAX_LIEN_DECOMPRESSE = 4 * 1024 * 1024
+
+def ecrire_varint(sortie, n):
+    while n >= 0x80: sortie.append((n & 0x7F) | 0x80); n >>= 7
+    sortie.append(n)
+
+def lire_varint(data, pos):
+    n = 0; decalage = 0
+    while True:
+        octet = data[pos]; pos += 1
+        n |= (octet & 0x7F) << decalage; decalage += 7
+        if octet < 0x80: return n, pos
+
+def ecrire_chaine(sortie, texte):
+    octets = texte.encode('utf-8'); ecrire_varint(sortie, len(octets)); sortie += octets
+
+def lire_chaine(data, pos):
+    n, pos = lire_varint(data, pos)
+    if pos + n > len(data): raise ValueError("Lien tronqué.")
+    return data[pos:pos + n].decode('utf-8'), pos + n
+
+def modificateurs_lien(mots):
+    # (doigt, répétition) si tous les mots sont des modificateurs connus, sinon None (ligne gardée en texte)
+    doigt = 0; repetition = None
+    for mot in mots:
+        mot = mot.upper()
+        if mot in DOIGTS_LIEN: doigt = DOIGTS_LIEN[mot]
+        elif mot.startswith('X') and mot[1:].isdigit(): repetition = int(mot[1:])
+        else: return None
+    return doigt, repetition
+
+def encoder_ligne_lien(sortie, ligne):
+    parts = ligne.strip().split(maxsplit=2)
+    if len(parts) >= 2 and parts[0] in RYTHMES_LIEN:
+        rythme = RYTHMES_LIEN.index(parts[0]) << 4; contenu = parts[1].upper()
+        if contenu == 'TXT':
+            sortie.append(rythme | CONTENU_TXT_LIEN); ecrire_chaine(sortie, parts[2] if len(parts) > 2 else ""); return
+        modifs = modificateurs_lien(parts[2].split() if len(parts) > 2 else [])
+        if contenu in INDEX_CONTENUS_LIEN and modifs is not None:
+            doigt, repetition = modifs
+            if not doigt and repetition is None: sortie.append(rythme | INDEX_CONTENUS_LIEN[contenu]); return
+            sortie.append(0x80 | rythme | INDEX_CONTENUS_LIEN[contenu]); sortie.append(doigt | (4 if repetition is not None else 0))
+            if repetition is not None: ecrire_varint(sortie, repetition)
+            return
+    sortie.append(RYTHME_BRUT_LIEN << 4); ecrire_chaine(sortie, ligne)
+
+def encoder_lignes_lien(sortie, texte):
+    lignes = texte.split('\n'); ecrire_varint(sortie, len(lignes))
+    for ligne in lignes: encoder_ligne_lien(sortie, ligne)
+
+def decoder_lignes_lien(data, pos):
+    nb, pos = lire_varint(data, pos); lignes = []
+    for _ in range(nb):
+        octet = data[pos]; pos += 1
+        rythme = (octet >> 4) & 7; contenu = octet & 0x0F
+        if rythme == RYTHME_BRUT_LIEN: ligne, pos = lire_chaine(data, pos); lignes.append(ligne); continue
+        symbole = RYTHMES_LIEN[rythme]
+        if contenu == CONTENU_TXT_LIEN:
+            message, pos = lire_chaine(data, pos); lignes.append(f"{symbole}   TXT  {message}" if message else f"{symbole}   TXT"); continue
+        ligne = f"{symbole}   {CONTENUS_LIEN[contenu]}"
+        if octet & 0x80:
+            modifs = data[pos]; pos += 1; mots = []
+            if modifs & ~7 or modifs & 3 == 3: raise ValueError(f"Modificateur inconnu ({modifs}).")
+            if modifs & 3: mots.append(LIEN_DOIGTS[modifs & 3])
+            if modifs & 4: repetition, pos = lire_varint(data, pos); mots.append(f"x{repetition}")
+            ligne += "   " + " ".join(mots)
+        lignes.append(ligne)
+    return "\n".join(lignes), pos
+
+def encoder_lien(code, accordage=None, blocs=None):
+    corps = bytearray([(DRAPEAU_ACCORDAGE if accordage else 0) | (DRAPEAU_BLOCS if blocs else 0)])
+    encoder_lignes_lien(corps, code)
+    if accordage:
+        for k in ORDRE_MAPPING_GAMME: ecrire_chaine(corps, accordage.get(k, DEF_ACC[k]))
+    if blocs:
+        ecrire_varint(corps, len(blocs))
+        for nom, contenu in blocs.items(): ecrire_chaine(corps, nom); encoder_lignes_lien(corps, contenu)
+    return base64.urlsafe_b64encode(bytes([VERSION_LIEN]) + zlib.compress(bytes(corps), 9)).decode('ascii').rstrip('=')
+
+def decoder_lien(jeton):
+    # Renvoie {'code', 'accordage', 'blocs'} (None si absents) ; ValueError si le lien est illisible
+    try:
+        data = base64.urlsafe_b64decode(jeton + '=' * (-len(jeton) % 4))
+        if not data or data[0] != VERSION_LIEN: raise ValueError(f"Version de lien inconnue ({data[0] if data else '?'}).")
+        decompresseur = zlib.decompressobj(); corps = decompresseur.decompress(data[1:], TAILLE_MAX_LIEN_DECOMPRESSE)
+        if decompresseur.unconsumed_tail: raise ValueError("Lien trop volumineux.")
+        if not decompresseur.eof: raise ValueError("Lien tronqué.")
+        drapeaux = corps[0]; code, pos = decoder_lignes_lien(corps, 1)
+        accordage = blocs = None
+        if drapeaux & DRAPEAU_ACCORDAGE:
+            accordage = {}
+            for k in ORDRE_MAPPING_GAMME:
+                note, pos = lire_chaine(corps, pos)
+                if note_accordage_valide(k, note): accordage[k] = note # Une note hors du sélecteur est ignorée
+        if drapeaux & DRAPEAU_BLOCS:
+            nb, pos = lire_varint(corps, pos); blocs = {}
+            for _ in range(nb):
+                nom, pos = lire_chaine(corps, pos); blocs[nom], pos = decoder_lignes_lien(corps, pos)
+        return {'code': code, 'accordage': accordage, 'blocs': blocs}
+    except (IndexError, KeyError, UnicodeDecodeError, zlib.error, binascii.Error) as e: raise ValueError(f"Lien illisible ({type(e).__name__}).") from e
+
+# ==============================================================================
+# 📦 PROJETS .ngoni (v2 : conteneur zip + manifeste)
+# ==============================================================================
+# manifeste.json (titre, accordage, BPM, liste des membres) + tablature.txt + blocs.json, et en option les
+# rendus déjà calculés (pages, MP3, MP4) sous artefacts/<magasin>/<clé>. À l'ouverture, seul le manifeste est lu ;
+# les artefacts sont recopiés en flux dans la zone de la session (jamais dans les magasins partagés : la clé est
+# choisie par le fichier), où Générer / Créer Vidéo / ⬇️ MP3 de cette session seulement les retrouvent.
+# Un projet JSON "1.0" ({titre, code, blocs}) est migré à la volée.
+VERSION_PROJET = 2
+MANIFESTE_PROJET = "manifeste.json"
+MEMBRES_PROJET = {'code': "tablature.txt", 'blocs': "blocs.json"}
+MAGASINS_PROJET = {'pages': lambda: get_cache_pages(), 'audio': lambda: get_cache_audio(), 'videos': lambda: get_cache_videos()}
+MOTIF_CLE_ARTEFACT = re.compile(r"[0-9a-f]{40}\.(png|pdf|mp3|mp4)")
+BPM_PROJET = ('preview', 'video', 'audio') # -> widgets bpm_<nom>
+
+def exporter_projet(titre, code, blocs, accordage, bpm, artefacts=(), session_artefacts=None):
+    # artefacts : (magasin, clé) des rendus à embarquer ; ceux qui ne sont plus en cache sont ignorés
+    chemins = {(m, c): magasin_travail(m, session_artefacts).chemin(c) for m, c in artefacts}
+    presents = [(m, c) for m, c in artefacts if os.path.exists(chemins[(m, c)])]
+    manifeste = {'format': "ngoni", 'version': VERSION_PROJET, 'titre': titre, 'accordage': accordage, 'bpm': bpm, 'membres': MEMBRES_PROJET,
+                 'artefacts': [{'magasin': m, 'cle': c, 'membre': f"artefacts/{m}/{c}"} for m, c in presents]}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(MANIFESTE_PROJET, json.dumps(manifeste, ensure_ascii=False, indent=2))
+        z.writestr(MEMBRES_PROJET['code'], code)
+        z.writestr(MEMBRES_PROJET['blocs'], json.dumps(blocs, ensure_ascii=False, indent=2))
+        for a in manifeste['artefacts']: z.write(chemins[(a['magasin'], a['cle'])], a['membre'], compress_type=zipfile.ZIP_STORED) # déjà compressés
+    return buf.getvalue()
+
+class ProjetNgoni:
+    # membres : ZipFile (v2, lu à la demande) ou {nom: octets} (projet 1.0 migré)
+    def __init__(self, manifeste, membres):
+        # Tout vient d'un fichier envoyé par l'utilisateur : un champ du mauvais type rend le projet illisible (ValueError) ou est ignoré
+        if not isinstance(manifeste, dict): raise ValueError("Manifeste de projet invalide.")
+        if not isinstance(manifeste.get('membres'), dict) or not all(isinstance(manifeste['membres'].get(m), str) for m in MEMBRES_PROJET): raise ValueError("Liste des membres du projet invalide.")
+        self.manifeste = manifeste; self.membres = membres
+        self.titre = manifeste['titre'] if isinstance(manifeste.get('titre'), str) else None
+        self.accordage = manifeste['accordage'] if isinstance(manifeste.get('accordage'), dict) else {}
+        self.bpm = manifeste['bpm'] if isinstance(manifeste.get('bpm'), dict) else {}
+        self.artefacts = manifeste['artefacts'] if isinstance(manifeste.get('artefacts'), list) else []
+
+    def lire(self, nom):
+        try: return self.membres[nom] if isinstance(self.membres, dict) else self.membres.read(nom)
+        except (KeyError, zlib.error, zipfile.BadZipFile, OSError) as e: raise ValueError(f"Membre {nom} du projet illisible ({type(e).__name__}).") from e
+
+    def code(self):
+        return self.lire(self.manifeste['membres']['code']).decode('utf-8')
+
+    def blocs(self):
+        blocs = json.loads(self.lire(self.manifeste['membres']['blocs']))
+        if not isinstance(blocs, dict) or not all(isinstance(v, str) for v in blocs.values()): raise ValueError("Blocs du projet invalides.")
+        return blocs
+
+    def restaurer_artefacts(self, session):
+        # Copie en flux (pas de lecture complète en mémoire) dans la zone de la session ; renvoie le nombre d'artefacts copiés
+        # Les rendus sont facultatifs : une entrée invalide, absente de l'archive ou corrompue est ignorée
+        purger_artefacts_sessions(); nb = 0
+        noms = set(self.membres.namelist()) if self.artefacts else set()
+        for a in self.artefacts:
+            if not isinstance(a, dict) or a.get('magasin') not in MAGASINS_PROJET or not MOTIF_CLE_ARTEFACT.fullmatch(str(a.get('cle', ""))): continue
+            if not isinstance(a.get('membre'), str) or a['membre'] not in noms: continue
+            magasin = artefacts_session(session, a['magasin'])
+            if magasin.existe(a['cle']) or self.membres.getinfo(a['membre']).file_size > magasin.taille_max: continue
+            chemin_tmp = magasin.chemin_temporaire(a['cle'])
+            try:
+                with self.membres.open(a['membre']) as source, open(chemin_tmp, "wb") as dest: shutil.copyfileobj(source, dest)
+            except (zlib.error, zipfile.BadZipFile, OSError):
+                if os.path.exists(chemin_tmp): os.remove(chemin_tmp)
+                continue
+            magasin.valider(chemin_tmp, a['cle']); nb += 1
+        return nb
+
+def migrer_projet_v1(data):
+    if not isinstance(data, dict) or not isinstance(data.get('code', ""), str): raise ValueError("Projet JSON invalide.")
+    manifeste = {'format': "ngoni", 'version': VERSION_PROJET, 'migre_de': data.get('version', "1.0"), 'titre': data.get('titre'), 'membres': MEMBRES_PROJET, 'artefacts': []}
+    membres = {MEMBRES_PROJET['code']: data.get('code', "").encode('utf-8'), MEMBRES_PROJET['blocs']: json.dumps(data.get('blocs', {})).encode('utf-8')}
+    return ProjetNgoni(manifeste, membres)
+
+def ouvrir_projet(fichier):
+    if zipfile.is_zipfile(fichier):
+        fichier.seek(0); z = zipfile.ZipFile(fichier)
+        manifeste = json.loads(z.read(MANIFESTE_PROJET))
+        if not isinstance(manifeste, dict): raise ValueError("Manifeste de projet invalide.")
+        if manifeste.get('format') != "ngoni" or manifeste.get('version') != VERSION_PROJET: raise ValueError(f"Projet version {manifeste.get('version')} non prise en charge.")
+        return ProjetNgoni(manifeste, z)
+    fichier.seek(0)
+    return migrer_projet_v1(json.load(fichier))
+
+def charger_projet(fichier, session):
+    # (blocs, valeurs des widgets, nb de rendus restaurés) ; code et blocs sont validés avant la copie des rendus :
+    # un projet refusé ne laisse rien dans la zone de la session
+    projet = ouvrir_projet(fichier)
+    blocs = projet.blocs(); valeurs = valeurs_widgets_projet(projet)
+    return blocs, valeurs, projet.restaurer_artefacts(session)
+
+def valeurs_widgets_projet(projet):
+    # Valeurs à poser dans session_state au prochain passage, avant la création des widgets
+    valeurs = {'code_actuel': projet.code()}; valeurs['widget_input'] = valeurs['code_actuel']
+    if projet.titre: valeurs['titre_partition'] = projet.titre
+    for k, note in projet.accordage.items():
+        if note_accordage_valide(k, note): valeurs[f"acc_{k}"] = note
+    for nom in BPM_PROJET:
+        if isinstance(projet.bpm.get(nom), int) and 40 <= projet.bpm[nom] <= 200: valeurs[f"bpm_{nom}"] = projet.bpm[nom]
+    return valeurs
+
+# ==============================================================================
+# 🎨 MOTEUR AFFICHAGE
+# ==============================================================================
+# Le dessin (pages du livret, partition déroulante) vit dans rendu_kora, importé par les processus de rendu
+# --- RENDU VIDÉO EN FLUX (images brutes envoyées à ffmpeg par stdin) ---
+HAUTEUR_VIDEO = 480; POSITION_BARRE_VIDEO = 100; FPS_VIDEO = 12
+VERSION_RENDU_VIDEO = 1 # À incrémenter quand le rendu vidéo change
+COULEUR_FOND_VIDEO = (229, 196, 163); COULEUR_BARRE_VIDEO = (255, 215, 0); OPACITE_BARRE_VIDEO = 0.3
+
+class SourceImageVideo:
+    # Donne les lignes [debut, fin) de la partition déroulante sous forme de vues,
+    # avec la couleur de fond au-dessus et au-dessous de l'image
+    def __init__(self, image):
+        self.image = np.ascontiguousarray(image)
+        self.hauteur, self.largeur = self.image.shape[:2]
+        self.fond = np.empty((HAUTEUR_VIDEO, self.largeur, 3), dtype=np.uint8); self.fond[:] = COULEUR_FOND_VIDEO
+
+    def lignes(self, debut, fin):
+        vues = []; y = debut
+        while y < fin:
+            if 0 <= y < self.hauteur:
+                stop = min(fin, self.hauteur); vues.append(self.image[y:stop])
+            else:
+                stop = min(fin, 0) if y < 0 else fin
+                stop = min(stop, y + HAUTEUR_VIDEO); vues.append(self.fond[:stop - y])
+            y = stop
+        return vues
+
+class SourceTuilesVideo(SourceImageVideo):
+    # Même interface, mais les tuiles sont rendues dans les processus de rendu (quelques-unes d'avance, dans l'ordre)
+    # et oubliées dès que le cadre les a dépassées : le cadre ne fait que descendre, on ne garde que les tuiles
+    # qu'il peut encore toucher
+    def __init__(self, partition):
+        self.partition = partition; self.hauteur = partition.hauteur; self.largeur = partition.largeur // 2 * 2
+        self.fond = np.empty((HAUTEUR_VIDEO, self.largeur, 3), dtype=np.uint8); self.fond[:] = COULEUR_FOND_VIDEO
+        self.tuiles = {}
+        # Chaque tâche n'emporte que les notes de sa tuile : envoi et reconstruction proportionnels à la tuile, pas au morceau
+        bornes = (partition.t_min, partition.t_max)
+        taches = [(partition.extrait(k).etat(), bornes, partition.config_acc, partition.styles, partition.dpi, partition.hauteur_tuile, k) for k in range(partition.nb_tuiles)]
+        self.rendues = rendre_en_parallele(rendre_tuile_video, taches, CPU_PAR_TRAVAIL)
+
+    def tuile(self, k):
+        # Une tuile que le cadre a sautée d'un bond est simplement écartée
+        for i, (tuile, duree_ms) in self.rendues:
+            self.partition.tuiles_rendues += 1; self.partition.duree_tuiles_ms += duree_ms
+            if i == k: return tuile[:, :self.largeur]
+        raise RuntimeError(f"Tuile {k} hors de la partition.")
+
+    def lignes(self, debut, fin):
+        h_tuile = self.partition.hauteur_tuile
+        for k in [k for k in self.tuiles if (k + 1) * h_tuile <= debut - HAUTEUR_VIDEO]: del self.tuiles[k]
+        vues = []; y = debut
+        while y < fin:
+            if 0 <= y < self.hauteur:
+                k = y // h_tuile; stop = min(fin, self.hauteur, (k + 1) * h_tuile)
+                if k not in self.tuiles: self.tuiles[k] = self.tuile(k)
+                vues.append(self.tuiles[k][y - k * h_tuile:stop - k * h_tuile])
+            else:
+                stop = min(fin, 0) if y < 0 else fin
+                stop = min(stop, y + HAUTEUR_VIDEO); vues.append(self.fond[:stop - y])
+            y = stop
+        return vues
+
+def charger_image_rgb(image_buffer):
+    image_buffer.seek(0)
+    with Image.open(image_buffer) as img: return np.asarray(img.convert('RGB'))
+
+def ecrire_images_video(sortie, source, nb_images, fps, start_y, speed_px_sec, bar_height):
+    # Chaque image = vues de la source écrites telles quelles, sauf la bande de la barre
+    # surlignée, mélangée sur place dans un tampon réutilisé
+    bar_top = max(0, int(POSITION_BARRE_VIDEO - bar_height / 2)); bar_bot = min(HAUTEUR_VIDEO, bar_top + max(bar_height, 0))
+    barre = np.empty((bar_bot - bar_top, source.largeur, 3), dtype=np.uint8)
+    barre_16 = np.empty(barre.shape, dtype=np.uint16)
+    alpha_fond = int(round((1 - OPACITE_BARRE_VIDEO) * 256))
+    couleur_barre = np.array([int(round(c * OPACITE_BARRE_VIDEO * 256)) for c in COULEUR_BARRE_VIDEO], dtype=np.uint16)
+    for i in range(nb_images):
+        haut = -int(start_y - speed_px_sec * (i / fps)) # Ligne de l'image affichée en haut du cadre
+        for vue in source.lignes(haut, haut + bar_top): sortie.write(vue.data)
+        if len(barre):
+            np.concatenate(source.lignes(haut + bar_top, haut + bar_bot), out=barre)
+            np.multiply(barre, alpha_fond, out=barre_16, dtype=np.uint16); barre_16 += couleur_barre; barre_16 >>= 8
+            barre[:] = barre_16
+            sortie.write(barre.data)
+        for vue in source.lignes(haut + bar_bot, haut + HAUTEUR_VIDEO): sortie.write(vue.data)
+
+def creer_video_avec_son_calibree(partition, audio_buffer, duration_sec, metrics, bpm, fps=15, output_filename=None):
+    # partition : PartitionLongue (tuiles rendues au fil de l'encodage) ou image complète (buffer PNG)
+    # output_filename : chemin imposé (fichier temporaire du magasin de vidéos), sinon un fichier temporaire
     pixels_par_temps, offset_premiere_note_px = metrics
-    temp_img_path = None; temp_audio_path = None; output_filename = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as f_img:
-            f_img.write(image_buffer.getbuffer()); temp_img_path = f_img.name
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as f_audio:
-            f_audio.write(audio_buffer.getbuffer()); temp_audio_path = f_audio.name 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as f_vid:
-            output_filename = f_vid.name
-        clip_img = ImageClip(temp_img_path)
-        w, h = clip_img.size; video_h = 480; bar_y = 100
-        start_y = bar_y - offset_premiere_note_px
+        if isinstance(partition, PartitionLongue): source = SourceTuilesVideo(partition)
+        else:
+            source = SourceImageVideo(charger_image_rgb(partition))
+            if source.largeur % 2: source = SourceImageVideo(source.image[:, :-1]) # yuv420p exige une largeur paire
+        if output_filename is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as f_vid: output_filename = f_vid.name
+        start_y = POSITION_BARRE_VIDEO - offset_premiere_note_px
         speed_px_sec = pixels_par_temps * (bpm / 60.0)
-        def scroll_func(t): return ('center', start_y - (speed_px_sec * t))
-        moving_clip = clip_img.set_position(scroll_func).set_duration(duration_sec)
-        try:
-            bar_height = int(pixels_par_temps)
-            highlight_bar = ColorClip(size=(w, bar_height), color=(255, 215, 0)).set_opacity(0.3).set_position(('center', bar_y - bar_height/2)).set_duration(duration_sec)
-            bg_clip = ColorClip(size=(w, video_h), color=(229, 196, 163)).set_duration(duration_sec) 
-            video_visual = CompositeVideoClip([bg_clip, moving_clip, highlight_bar], size=(w, video_h))
-        except: video_visual = CompositeVideoClip([moving_clip], size=(w, video_h))
-        audio_clip = AudioFileClip(temp_audio_path).subclip(0, duration_sec)
-        final = video_visual.set_audio(audio_clip)
-        final.fps = fps
-        final.write_videofile(output_filename, codec='libx264', audio_codec='aac', preset='ultrafast', ffmpeg_params=['-pix_fmt', 'yuv420p'], logger=None)
-        audio_clip.close(); video_visual.close(); clip_img.close(); final.close()
+        nb_images = int(np.ceil(duration_sec * fps))
+        # L'audio WAV arrive par un second tube (fd 3) : aucun fichier intermédiaire ni encodage MP3
+        audio_r, audio_w = os.pipe()
+        cmd = [get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{source.largeur}x{HAUTEUR_VIDEO}", '-r', str(fps), '-i', 'pipe:0',
+               '-f', 'wav', '-i', f"pipe:{audio_r}",
+               '-map', '0:v', '-map', '1:a', '-af', 'apad', '-t', f"{duration_sec:.3f}",
+               '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-threads', str(CPU_PAR_TRAVAIL), '-f', 'mp4', output_filename]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(audio_r,))
+        os.close(audio_r)
+        def envoyer_audio():
+            try:
+                with os.fdopen(audio_w, 'wb') as f: f.write(audio_buffer.getbuffer())
+            except OSError: pass
+        fil_audio = threading.Thread(target=envoyer_audio, daemon=True); fil_audio.start()
+        with mesure('encodage_video', images=nb_images, fps=fps) as m:
+            try: ecrire_images_video(proc.stdin, source, nb_images, fps, start_y, speed_px_sec, int(pixels_par_temps))
+            except BrokenPipeError: pass
+            finally:
+                try: proc.stdin.close()
+                except BrokenPipeError: pass
+            erreurs = proc.stderr.read().decode('utf-8', 'replace'); proc.wait(); fil_audio.join(timeout=5)
+            m['octets'] = os.path.getsize(output_filename)
+        if isinstance(partition, PartitionLongue): enregistrer_etape('tuiles_partition', partition.duree_tuiles_ms, tuiles=partition.tuiles_rendues, hauteur_px=partition.hauteur)
+        if proc.returncode != 0: raise RuntimeError(erreurs.strip() or f"ffmpeg a échoué ({proc.returncode})")
         return output_filename
-    except Exception as e: st.error(f"Erreur vidéo : {e}"); return None
-    finally:
-        if temp_img_path and os.path.exists(temp_img_path): os.remove(temp_img_path)
-        if temp_audio_path and os.path.exists(temp_audio_path): os.remove(temp_audio_path)
+    except Exception:
+        if output_filename and os.path.exists(output_filename): os.remove(output_filename)
+        raise
+
+# --- ÉCRITURE DU PDF EN MÉMOIRE (images PNG/JPEG intégrées sans fichier temporaire) ---
+PT_PAR_MM = 72 / 25.4
+FORMAT_A4_MM = (210, 297)
+MARGE_PDF_MM = 10; LARGEUR_IMAGE_PDF_MM = 190
+NIVEAU_ZLIB_PDF = 6
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def lire_png_brut(data):
+    # (largeur, hauteur, nb couleurs, IDAT) quand le flux PNG peut être copié tel quel dans le PDF
+    # (8 bits, gris ou RVB, non entrelacé : le prédicteur PNG 15 du PDF relit les filtres de lignes) ; sinon None
+    if data[:8] != PNG_SIGNATURE: return None
+    pos = 8; idat = []; entete = None
+    while pos + 8 <= len(data):
+        longueur, type_bloc = struct.unpack('>I4s', data[pos:pos + 8])
+        if type_bloc == b'IHDR': entete = struct.unpack('>IIBBBBB', data[pos + 8:pos + 21])
+        elif type_bloc == b'IDAT': idat.append(data[pos + 8:pos + 8 + longueur])
+        elif type_bloc == b'IEND': break
+        pos += 12 + longueur
+    if entete is None: return None
+    largeur, hauteur, profondeur, couleur, _, _, entrelace = entete
+    if profondeur != 8 or entrelace or couleur not in (0, 2): return None
+    return largeur, hauteur, 1 if couleur == 0 else 3, b''.join(idat)
+
+MOTIF_REF_PDF = re.compile(rb"(?<![\w./])(\d+) 0 R\b")
+
+def lire_objets_pdf(data):
+    # ({num: (dictionnaire, flux ou None)}, num du catalogue) d'un PDF à table xref classique, celui qu'écrit
+    # matplotlib ; les /Length indirects sont résolus pour que les flux se recopient tels quels
+    debut_xref = int(data[data.rindex(b"startxref") + 9:].split()[0])
+    fin_table = data.index(b"trailer", debut_xref)
+    jetons = data[debut_xref:fin_table].split()[1:]; decalages = {}; i = 0
+    while i + 1 < len(jetons):
+        premier, nombre = int(jetons[i]), int(jetons[i + 1]); i += 2
+        for n in range(nombre):
+            if jetons[i + 2] == b'n': decalages[premier + n] = int(jetons[i])
+            i += 3
+    racine = int(re.search(rb"/Root (\d+) 0 R", data[fin_table:]).group(1))
+    bornes = {}
+    for num, pos in decalages.items():
+        debut = data.index(b"obj", pos) + 3
+        bornes[num] = (debut, min(p for p in (data.find(b"stream", debut), data.find(b"endobj", debut)) if p >= 0))
+    objets = {}
+    for num, (debut, fin) in bornes.items():
+        dictionnaire = data[debut:fin].strip(); flux = None
+        if data.startswith(b"stream", fin):
+            longueur = re.search(rb"/Length (\d+)( 0 R)?", dictionnaire)
+            n = int(data[slice(*bornes[int(longueur.group(1))])] if longueur.group(2) else longueur.group(1))
+            debut_flux = fin + (8 if data[fin + 6:fin + 8] == b"\r\n" else 7)
+            flux = data[debut_flux:debut_flux + n]
+            dictionnaire = dictionnaire[:longueur.start()] + b"/Length %d" % n + dictionnaire[longueur.end():]
+        objets[num] = (dictionnaire, flux)
+    return objets, racine
+
+def chaine_pdf(texte):
+    return b'<FEFF' + texte.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+class EcrivainPdf:
+    # PDF écrit au fil de l'eau dans un flux binaire : chaque objet part dès qu'il est prêt,
+    # seuls les décalages de la table xref restent en mémoire
+    def __init__(self, sortie, titre=""):
+        self.sortie = sortie; self.titre = titre
+        self.position = 0; self.decalages = [None]; self.pages = []
+        self.num_pages = self.nouvel_objet()
+        self.ecrire(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def ecrire(self, data):
+        self.sortie.write(data); self.position += len(data)
+
+    def nouvel_objet(self):
+        self.decalages.append(None); return len(self.decalages) - 1
+
+    def objet(self, num, dictionnaire, flux=None):
+        self.decalages[num] = self.position
+        if flux is None: self.ecrire(b"%d 0 obj\n%s\nendobj\n" % (num, dictionnaire))
+        else:
+            self.ecrire(b"%d 0 obj\n%s\nstream\n" % (num, dictionnaire)); self.ecrire(flux); self.ecrire(b"\nendstream\nendobj\n")
+        return num
+
+    def image(self, data):
+        # JPEG : flux DCT recopié ; PNG gris/RVB : IDAT recopié ; autre PNG (RGBA de matplotlib) : décodé puis Flate
+        if data[:2] == b'\xff\xd8':
+            with Image.open(io.BytesIO(data)) as img: (largeur, hauteur), mode = img.size, img.mode
+            if mode in ('L', 'RGB'):
+                espace = b'/DeviceGray' if mode == 'L' else b'/DeviceRGB'
+                dictionnaire = b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 /Filter /DCTDecode /Length %d >>" % (largeur, hauteur, espace, len(data))
+                return self.objet(self.nouvel_objet(), dictionnaire, data), largeur, hauteur
+        png = lire_png_brut(data)
+        if png:
+            largeur, hauteur, couleurs, idat = png
+            espace = b'/DeviceGray' if couleurs == 1 else b'/DeviceRGB'
+            dictionnaire = b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 /Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors %d /BitsPerComponent 8 /Columns %d >> /Length %d >>" % (largeur, hauteur, espace, couleurs, largeur, len(idat))
+            return self.objet(self.nouvel_objet(), dictionnaire, idat), largeur, hauteur
+        with Image.open(io.BytesIO(data)) as img:
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                if img.getextrema()[3][0] < 255: fond = Image.new('RGBA', img.size, 'white'); fond.alpha_composite(img); img = fond
+            img = img.convert('RGB'); largeur, hauteur = img.size
+            flux = zlib.compress(img.tobytes(), NIVEAU_ZLIB_PDF)
+        dictionnaire = b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode /Length %d >>" % (largeur, hauteur, len(flux))
+        return self.objet(self.nouvel_objet(), dictionnaire, flux), largeur, hauteur
+
+    def ajouter_page_image(self, data, x_mm=MARGE_PDF_MM, y_mm=MARGE_PDF_MM, largeur_mm=LARGEUR_IMAGE_PDF_MM):
+        # Même mise en page qu'avant : image en haut à gauche, largeur fixe, hauteur proportionnelle
+        num_image, largeur, hauteur = self.image(data)
+        hauteur_mm = largeur_mm * hauteur / largeur
+        l_pt, h_pt = (c * PT_PAR_MM for c in FORMAT_A4_MM)
+        contenu = b"q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q" % (largeur_mm * PT_PAR_MM, hauteur_mm * PT_PAR_MM, x_mm * PT_PAR_MM, h_pt - (y_mm + hauteur_mm) * PT_PAR_MM)
+        num_contenu = self.objet(self.nouvel_objet(), b"<< /Length %d >>" % len(contenu), contenu)
+        page = b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (self.num_pages, l_pt, h_pt, num_image, num_contenu)
+        self.pages.append(self.objet(self.nouvel_objet(), page))
+
+    def ajouter_page_pdf(self, data):
+        # Première page d'un PDF (celui d'une figure matplotlib) recopiée avec ses ressources : seuls les objets
+        # atteignables depuis la page sont renumérotés et réécrits, son catalogue et son arbre de pages restent en route
+        objets, racine = lire_objets_pdf(data)
+        num_pages = int(re.search(rb"/Pages (\d+) 0 R", objets[racine][0]).group(1))
+        page = int(re.search(rb"/Kids \[\s*(\d+) 0 R", objets[num_pages][0]).group(1))
+        objets[page] = (re.sub(rb"/Parent \d+ 0 R", b"", objets[page][0]), objets[page][1])
+        nouveaux = {}; a_voir = [page]
+        while a_voir:
+            num = a_voir.pop()
+            if num in nouveaux: continue
+            nouveaux[num] = self.nouvel_objet()
+            a_voir += [int(r) for r in MOTIF_REF_PDF.findall(objets[num][0]) if int(r) in objets]
+        renumeroter = lambda m: b"%d 0 R" % nouveaux[int(m.group(1))] if int(m.group(1)) in nouveaux else b"null"
+        for num, nouveau in nouveaux.items():
+            dictionnaire, flux = objets[num]
+            dictionnaire = MOTIF_REF_PDF.sub(renumeroter, dictionnaire)
+            if num == page: dictionnaire = b"<< /Parent %d 0 R " % self.num_pages + dictionnaire[2:]
+            self.objet(nouveau, dictionnaire, flux)
+        self.pages.append(nouveaux[page])
+
+    def terminer(self):
+        enfants = b" ".join(b"%d 0 R" % p for p in self.pages)
+        self.objet(self.num_pages, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (enfants, len(self.pages)))
+        num_info = self.objet(self.nouvel_objet(), b"<< /Title %s /Producer %s >>" % (chaine_pdf(self.titre), chaine_pdf("Ngonilélé Tab Gen")))
+        num_catalogue = self.objet(self.nouvel_objet(), b"<< /Type /Catalog /Pages %d 0 R >>" % self.num_pages)
+        debut_xref = self.position
+        lignes = [b"xref\n0 %d\n0000000000 65535 f \n" % len(self.decalages)] + [b"%010d 00000 n \n" % d for d in self.decalages[1:]]
+        self.ecrire(b"".join(lignes))
+        self.ecrire(b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.decalages), num_catalogue, num_info, debut_xref))
 
 def generer_pdf_livret(buffers, titre):
-    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    # Pages vectorielles (PDF d'une page, mode vectoriel) ou images PNG
+    buf = io.BytesIO(); pdf = EcrivainPdf(buf, titre)
     for item in buffers:
-        pdf.add_page()
-        temp_img = f"temp_pdf_{item['type']}_{item.get('idx', 0)}_{random.randint(0,1000)}.png"
-        item['buf'].seek(0)
-        with open(temp_img, "wb") as f: f.write(item['buf'].read()) 
-        pdf.image(temp_img, x=10, y=10, w=190)
-        if os.path.exists(temp_img): os.remove(temp_img)
-    buf = io.BytesIO(); pdf_output = pdf.output(dest='S').encode('latin-1'); buf.write(pdf_output); buf.seek(0)
+        if 'pdf' in item: pdf.ajouter_page_pdf(item['pdf'])
+        else: pdf.ajouter_page_image(item['buf'].getvalue())
+    pdf.terminer(); buf.seek(0)
     return buf
 
+# ==============================================================================
+# 🖨️ RENDU DU LIVRET (processus parallèles)
+# ==============================================================================
+DELAI_MAX_RENDU_S = 120
+
+@st.cache_resource(show_spinner=False)
+def get_pool_rendu():
+    # Processus de rendu persistants, partagés par tous les travaux. Jamais de fork du serveur Streamlit (plusieurs
+    # fils, verrous possiblement tenus au moment du fork) : forkserver ou spawn, chaque processus importe rendu_kora
+    # une fois pour toutes ; matplotlib et numpy sont préchargés dans le forkserver.
+    ctx = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+    if ctx.get_start_method() == 'forkserver': ctx.set_forkserver_preload(['numpy', 'matplotlib'])
+    # Chaque processus reçoit le sys.path du serveur au moment de son lancement, où le dossier de l'application
+    # peut manquer (le script ne l'y met que le temps d'une exécution) : il l'ajoute lui-même pour importer rendu_kora
+    dossier = os.path.dirname(os.path.abspath(rendu_kora.__file__))
+    return concurrent.futures.ProcessPoolExecutor(max_workers=NB_CPU, mp_context=ctx, initializer=site.addsitedir, initargs=(dossier,))
+
+def abandonner_pool_rendu(pool):
+    # Pool cassé ou bloqué : le prochain rendu en recrée un
+    get_pool_rendu.clear(); pool.shutdown(wait=False, cancel_futures=True)
+
+def rendre_sur_place(fonction, taches, debut=0):
+    # Repli quand les processus de rendu ne démarrent pas : mêmes résultats, calculés ici une tâche à la fois
+    for i in range(debut, len(taches)):
+        with rendu_kora.VERROU_RENDU_SUR_PLACE: resultat = fonction(taches[i])
+        yield i, resultat
+
+def rendre_en_parallele(fonction, taches, nb_processus=None):
+    # Générateur : (indice, résultat) dans l'ordre des tâches, au fur et à mesure qu'elles se terminent.
+    # Agg n'étant pas sûr entre threads, matplotlib tourne dans les processus de rendu ; au plus
+    # nb_processus tâches de ce travail y sont en cours à la fois. fonction appartient à rendu_kora
+    # (picklée par référence) et les tâches sont des données simples.
+    nb_processus = max(1, min(nb_processus or NB_CPU, len(taches)))
+    try: pool = get_pool_rendu()
+    except (OSError, ImportError, NotImplementedError):
+        yield from rendre_sur_place(fonction, taches); return
+    en_cours = {}; suivante = 0; termines = {}; prochain = 0
+    try:
+        while prochain < len(taches):
+            while suivante < len(taches) and len(en_cours) < nb_processus:
+                try: f = pool.submit(fonction, taches[suivante])
+                except (OSError, concurrent.futures.process.BrokenProcessPool):
+                    # Processus impossible à lancer : le reste du travail est rendu sur place
+                    abandonner_pool_rendu(pool); yield from rendre_sur_place(fonction, taches, prochain); return
+                en_cours[f] = suivante; suivante += 1
+            finis, _ = concurrent.futures.wait(en_cours, timeout=DELAI_MAX_RENDU_S, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not finis:
+                abandonner_pool_rendu(pool); raise RuntimeError("Rendu bloqué : aucune page terminée à temps.")
+            for f in finis:
+                i = en_cours.pop(f)
+                try: termines[i] = f.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    abandonner_pool_rendu(pool); raise RuntimeError("Un processus de rendu s'est arrêté.")
+            while prochain in termines:
+                yield prochain, termines.pop(prochain); prochain += 1
+    finally:
+        for f in en_cours: f.cancel()
+
+# --- CACHE DES PAGES (adressé par contenu, sur disque, partagé entre sessions) ---
+DOSSIER_CACHE = os.path.join(tempfile.gettempdir(), 'ngonilele_cache')
+TAILLE_MAX_CACHE_PAGES = 256 * 1024 * 1024
+VERSION_RENDU_PAGES = 1 # À incrémenter quand le dessin des pages change
+TAILLE_MAX_CACHE_VIDEOS = 1024 * 1024 * 1024
+AGE_MAX_CACHE_VIDEOS_S = 24 * 3600
+DUREE_BAIL_REFERENCE_S = 3600 # Une session qui ne réaffiche plus son fichier le libère au bout de ce délai
+AGE_MAX_TEMPORAIRES_S = 3600 # Écritures abandonnées (processus tué pendant un rendu)
+
+class CacheDisque:
+    # Un fichier par clé ; la date de modification sert d'horodatage LRU (rafraîchie à chaque lecture).
+    # Éviction par taille et par âge ; un fichier référencé par une session (bail renouvelé à chaque
+    # affichage) n'est jamais supprimé, les autres (orphelins) partent dès qu'ils dépassent une limite.
+    def __init__(self, dossier, taille_max, age_max=None):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self.age_max = age_max
+        self.verrou = threading.Lock()
+        self.references = {} # clé -> {session: dernier renouvellement}
+        os.makedirs(dossier, exist_ok=True)
+        self.evincer()
+
+    def chemin(self, cle):
+        return os.path.join(self.dossier, cle)
+
+    def lire(self, cle):
+        chemin = self.chemin(cle)
+        try:
+            with open(chemin, "rb") as f: data = f.read()
+            os.utime(chemin)
+            return data
+        except OSError: return None
+
+    def existe(self, cle):
+        try: os.utime(self.chemin(cle)); return True
+        except OSError: return False
+
+    def chemin_temporaire(self, cle):
+        return f"{self.chemin(cle)}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def valider(self, chemin_tmp, cle):
+        # Écriture atomique : le fichier n'apparaît sous sa clé qu'une fois complet
+        os.replace(chemin_tmp, self.chemin(cle))
+        self.evincer()
+
+    def ecrire(self, cle, data):
+        chemin_tmp = self.chemin_temporaire(cle)
+        with open(chemin_tmp, "wb") as f: f.write(data)
+        self.valider(chemin_tmp, cle)
+
+    def retenir(self, cle, session):
+        with self.verrou: self.references.setdefault(cle, {})[session] = time.time()
+
+    def liberer(self, session):
+        with self.verrou:
+            for cle in list(self.references):
+                self.references[cle].pop(session, None)
+                if not self.references[cle]: del self.references[cle]
+
+    def retenue(self, cle, maintenant):
+        # Appelé sous le verrou ; les baux expirés sont oubliés au passage
+        sessions = self.references.get(cle)
+        if not sessions: return False
+        for session in [s for s, t in sessions.items() if t < maintenant - DUREE_BAIL_REFERENCE_S]: del sessions[session]
+        if not sessions: del self.references[cle]
+        return bool(sessions)
+
+    def entrees(self, temporaires=False):
+        liste = []
+        for nom in os.listdir(self.dossier):
+            if nom.endswith('.tmp') != temporaires: continue
+            try: st_fichier = os.stat(os.path.join(self.dossier, nom))
+            except OSError: continue
+            liste.append((st_fichier.st_mtime, st_fichier.st_size, nom))
+        return liste
+
+    def taille_totale(self):
+        return sum(taille for _, taille, _ in self.entrees())
+
+    def supprimer(self, nom):
+        try: os.remove(os.path.join(self.dossier, nom)); return True
+        except OSError: return False
+
+    def evincer(self):
+        with self.verrou:
+            maintenant = time.time()
+            for mtime, _, nom in self.entrees(temporaires=True):
+                if mtime < maintenant - AGE_MAX_TEMPORAIRES_S: self.supprimer(nom)
+            entrees = sorted(self.entrees())
+            total = sum(taille for _, taille, _ in entrees)
+            for mtime, taille, nom in entrees:
+                trop_vieux = self.age_max is not None and mtime < maintenant - self.age_max
+                if (total <= self.taille_max and not trop_vieux) or self.retenue(nom, maintenant): continue
+                if self.supprimer(nom): total -= taille
+
+@st.cache_resource(show_spinner=False)
+def get_cache_pages():
+    return CacheDisque(os.path.join(DOSSIER_CACHE, 'pages'), TAILLE_MAX_CACHE_PAGES)
+
+@st.cache_resource(show_spinner=False)
+def get_cache_audio():
+    return CacheDisque(os.path.join(DOSSIER_CACHE, 'audio'), TAILLE_MAX_CACHE_AUDIO, AGE_MAX_CACHE_AUDIO_S)
+
+@st.cache_resource(show_spinner=False)
+def get_cache_videos():
+    return CacheDisque(os.path.join(DOSSIER_CACHE, 'videos'), TAILLE_MAX_CACHE_VIDEOS, AGE_MAX_CACHE_VIDEOS_S)
+
+# --- RENDUS IMPORTÉS D'UN PROJET (vus par la seule session qui l'a ouvert) ---
+# Un .ngoni nomme lui-même ses clés : ses rendus restent dans un dossier par session, consulté avant le magasin
+# partagé par cette session uniquement. Les travaux qui les lisent portent l'id de session dans leurs arguments,
+# donc dans leur clé : leur résultat n'est jamais partagé avec une autre session.
+DOSSIER_ARTEFACTS_SESSIONS = os.path.join(DOSSIER_CACHE, 'sessions')
+AGE_MAX_ARTEFACTS_SESSION_S = DUREE_BAIL_REFERENCE_S # Rafraîchi à chaque lecture, comme les magasins partagés
+
+def artefacts_session(session, magasin):
+    return CacheDisque(os.path.join(DOSSIER_ARTEFACTS_SESSIONS, session, magasin), MAGASINS_PROJET[magasin]().taille_max, AGE_MAX_ARTEFACTS_SESSION_S)
+
+def purger_artefacts_sessions():
+    # Dossiers des sessions disparues : plus aucun fichier lu depuis AGE_MAX_ARTEFACTS_SESSION_S
+    if not os.path.isdir(DOSSIER_ARTEFACTS_SESSIONS): return
+    limite = time.time() - AGE_MAX_ARTEFACTS_SESSION_S
+    for session in os.listdir(DOSSIER_ARTEFACTS_SESSIONS):
+        dossier = os.path.join(DOSSIER_ARTEFACTS_SESSIONS, session)
+        mtimes = [os.path.getmtime(os.path.join(d, f)) for d, _, fichiers in os.walk(dossier) for f in fichiers]
+        if max(mtimes, default=0) < limite: shutil.rmtree(dossier, ignore_errors=True)
+
+class CacheSuperpose:
+    # Vue d'une session : ses rendus importés d'abord, puis le magasin partagé, seul à recevoir les écritures
+    def __init__(self, prive, partage):
+        self.prive = prive; self.partage = partage
+
+    def lire(self, cle):
+        data = self.prive.lire(cle)
+        return data if data is not None else self.partage.lire(cle)
+
+    def existe(self, cle):
+        return self.prive.existe(cle) or self.partage.existe(cle)
+
+    def chemin(self, cle):
+        return self.prive.chemin(cle) if self.prive.existe(cle) else self.partage.chemin(cle)
+
+    def ecrire(self, cle, data): self.partage.ecrire(cle, data)
+
+    def chemin_temporaire(self, cle): return self.partage.chemin_temporaire(cle)
+
+    def valider(self, chemin_tmp, cle): self.partage.valider(chemin_tmp, cle)
+
+def magasin_travail(magasin, session_artefacts=None):
+    # session_artefacts : id de la session qui a importé des rendus, None sinon (magasin partagé seul)
+    partage = MAGASINS_PROJET[magasin]()
+    return CacheSuperpose(artefacts_session(session_artefacts, magasin), partage) if session_artefacts else partage
+
+def session_artefacts():
+    return id_session() if st.session_state.get('artefacts_importes') else None
+
+def cle_video(sequence, acc_config, bpm, fps, bg_color, duree):
+    config = sorted([k, v['x'], v['n']] for k, v in acc_config.items())
+    entrees = [VERSION_RENDU_VIDEO, sequence.empreinte(), config, bpm, fps, bg_color, round(duree, 3)]
+    return hashlib.blake2b(json.dumps(entrees).encode('utf-8'), digest_size=20).hexdigest() + '.mp4'
+
+def liberer_video():
+    # La session ne montre plus sa vidéo : le fichier redevient évinçable (s'il n'est retenu par personne d'autre)
+    if st.session_state.get('video_path'): get_cache_videos().liberer(id_session())
+    st.session_state.video_path = None
+
+def cle_image_page(tache, styles, mode_white, dpi):
+    type_page, idx, notes_page, ctx = tache
+    entrees = [VERSION_RENDU_PAGES, type_page, ctx['titre'], styles, mode_white, dpi]
+    if type_page == 'page':
+        config = sorted([k, v['x'], v['n']] for k, v in ctx['config_acc'].items())
+        entrees += [idx, notes_page.empreinte(), config, ctx['options_visuelles']]
+    return hashlib.blake2b(json.dumps(entrees, sort_keys=True).encode('utf-8'), digest_size=20).hexdigest() + ('.pdf' if dpi is None else '.png')
+
+def rendre_livret(taches, cache=None, nb_processus=None):
+    # Générateur : (indice, item de partition_buffers) dans l'ordre des pages.
+    # Seules les pages absentes du cache partent dans les processus de rendu.
+    cles = []; images = []
+    with mesure('cache_pages', pages=len(taches)) as m:
+        for tache in taches:
+            cles_tache = {champ: cle_image_page(tache, styles, mode_white, dpi) for champ, styles, mode_white, dpi in variantes_page(tache[3])}
+            trouvees = {champ: cache.lire(cle) for champ, cle in cles_tache.items()} if cache else {}
+            cles.append(cles_tache)
+            images.append(trouvees if trouvees and all(v is not None for v in trouvees.values()) else None)
+        m['trouvees'] = sum(imgs is not None for imgs in images)
+    a_rendre = [emballer_tache(taches[i]) for i, imgs in enumerate(images) if imgs is None]
+    rendues = rendre_en_parallele(rendre_page_livret, a_rendre, nb_processus)
+    for i, (type_page, idx, _, _) in enumerate(taches):
+        if images[i] is None:
+            _, images[i] = next(rendues)
+            mesures_page = images[i].pop('mesures', None)
+            if mesures_page: enregistrer_etape('rendu_page', mesures_page['figure_ms'] + mesures_page['savefig_ms'], **mesures_page)
+            if cache:
+                for champ, data in images[i].items(): cache.ecrire(cles[i][champ], data)
+        item = {'type': type_page, 'idx': idx, 'img_ecran': images[i]['img_ecran'], 'cles': cles[i]}
+        if 'buf' in images[i]: item['buf'] = io.BytesIO(images[i]['buf'])
+        if 'pdf' in images[i]: item['pdf'] = images[i]['pdf']
+        yield i, item
+
+# ==============================================================================
+# 🧵 FILE DE TRAVAUX (partagée entre toutes les sessions)
+# ==============================================================================
+# Générer, Créer Vidéo et Créer Audio ne tournent plus dans le script de la session qui clique : ils partent
+# dans une file commune servie par NB_TRAVAILLEURS fils. Chaque session a sa propre file, servie à tour de rôle
+# (un seul travail en cours par session), et un travail identique déjà en file, en cours ou terminé récemment
+# est partagé au lieu d'être relancé. Chaque travail reçoit CPU_PAR_TRAVAIL cœurs (processus de rendu, fils ffmpeg).
+NB_CPU = os.cpu_count() or 1
+NB_TRAVAILLEURS = max(1, min(4, NB_CPU // 2))
+CPU_PAR_TRAVAIL = max(1, NB_CPU // NB_TRAVAILLEURS)
+MAX_TRAVAUX_PAR_SESSION = 3
+MAX_TRAVAUX_EN_ATTENTE = 60
+DUREE_RETENTION_TRAVAUX_S = 600
+INTERVALLE_SUIVI_S = 1.0
+
+def valeur_cle_travail(valeur):
+    # Types que json ne sait pas écrire : une séquence vaut son empreinte ; tout autre objet est refusé, sans quoi
+    # sa représentation (adresse mémoire comprise) rendrait chaque clé unique et le partage des travaux inopérant
+    if isinstance(valeur, NoteSequence): return ['NoteSequence', valeur.empreinte()]
+    raise TypeError(f"Argument de travail sans forme stable : {type(valeur).__name__}")
+
+def cle_travail(nom, args):
+    return hashlib.blake2b(json.dumps([nom, args], sort_keys=True, default=valeur_cle_travail).encode('utf-8'), digest_size=16).hexdigest()
+
+class Travail:
+    def __init__(self, cle, nom, fonction, args, mesurer=False):
+        self.cle = cle; self.nom = nom; self.fonction = fonction; self.args = args; self.mesurer = mesurer
+        self.etat = 'en_attente'; self.progression = 0; self.message = ""
+        self.resultat = None; self.erreur = None; self.fin = None
+        self.termine = threading.Event()
+
+    @property
+    def actif(self): return self.etat in ('en_attente', 'en_cours')
+
+    def avancer(self, progression, message):
+        # Appelé par la fonction du travail ; lu par le suivi périodique des sessions abonnées
+        self.progression = progression; self.message = message
+
+    def executer(self):
+        self.etat = 'en_cours'
+        try:
+            with (ExecutionMesuree(self.nom, get_historique_mesures()) if self.mesurer else contextlib.nullcontext()):
+                self.resultat = self.fonction(self, *self.args)
+            self.etat = 'termine'
+        except Exception as e: self.erreur = f"{type(e).__name__}: {e}"; self.etat = 'erreur'
+        self.fin = time.time(); self.termine.set()
+
+class OrdonnanceurTravaux:
+    def __init__(self, nb_travailleurs=NB_TRAVAILLEURS):
+        self.condition = threading.Condition()
+        self.files = collections.OrderedDict() # session -> travaux en attente ; l'ordre sert de rotation
+        self.en_cours = {} # session -> travail
+        self.par_cle = {} # clé -> travail en file, en cours ou terminé depuis moins de DUREE_RETENTION_TRAVAUX_S
+        for i in range(nb_travailleurs): threading.Thread(target=self.boucle, name=f"travaux-{i}", daemon=True).start()
+
+    def soumettre(self, session, nom, fonction, args, mesurer=False):
+        # Renvoie le travail (nouveau ou partagé), ou None si la session ou le serveur a atteint sa limite
+        cle = cle_travail(nom, args)
+        with self.condition:
+            self.purger()
+            travail = self.par_cle.get(cle)
+            if travail is not None and travail.etat != 'erreur': return travail
+            file = self.files.get(session, ())
+            if len(file) + (session in self.en_cours) >= MAX_TRAVAUX_PAR_SESSION or self.nb_en_attente() >= MAX_TRAVAUX_EN_ATTENTE: return None
+            travail = Travail(cle, nom, fonction, args, mesurer)
+            self.files.setdefault(session, collections.deque()).append(travail); self.par_cle[cle] = travail
+            self.condition.notify()
+            return travail
+
+    def nb_en_attente(self):
+        return sum(len(file) for file in self.files.values())
+
+    def purger(self):
+        limite = time.time() - DUREE_RETENTION_TRAVAUX_S
+        for cle in [c for c, t in self.par_cle.items() if t.fin is not None and t.fin < limite]: del self.par_cle[cle]
+
+    def prochain(self):
+        # Première session de la rotation avec un travail en attente et aucun en cours ; elle passe en fin de rotation
+        for session, file in self.files.items():
+            if file and session not in self.en_cours:
+                self.files.move_to_end(session)
+                return session, file.popleft()
+        return None, None
+
+    def boucle(self):
+        while True:
+            with self.condition:
+                session, travail = self.prochain()
+                while travail is None:
+                    self.condition.wait(); session, travail = self.prochain()
+                self.en_cours[session] = travail
+            try: travail.executer()
+            finally:
+                with self.condition:
+                    del self.en_cours[session]
+                    if not self.files.get(session): self.files.pop(session, None)
+                    self.condition.notify_all()
+
+@st.cache_resource(show_spinner=False)
+def get_ordonnanceur():
+    return OrdonnanceurTravaux()
+
+# --- Travaux (aucun appel st.* : ils tournent hors du script de la session) ---
+def travail_livret(travail, code, contexte_rendu, session_artefacts=None):
+    pages_data = parser_texte(code).pages()
+    taches = [('legende', 1, None, contexte_rendu)] + [('page', idx+2, page, contexte_rendu) for idx, page in enumerate(pages_data)]
+    travail.avancer(5, f"📘 Dessin de la légende et de {len(pages_data)} page(s)...")
+    buffers = []
+    for i, item in rendre_livret(taches, magasin_travail('pages', session_artefacts), nb_processus=CPU_PAR_TRAVAIL):
+        buffers.append(item)
+        travail.avancer(int(((i + 1) / len(taches)) * 90), f"Page {i+1}/{len(taches)} terminée...")
+    travail.avancer(95, "Assemblage du livret PDF...")
+    with mesure('assemblage_pdf', pages=len(buffers), vectoriel=contexte_rendu['vectoriel']) as m:
+        pdf = generer_pdf_livret(buffers, contexte_rendu['titre'])
+        m['octets'] = pdf.getbuffer().nbytes
+    return {'partition_buffers': buffers, 'pdf_buffer': pdf}
+
+def travail_video(travail, code, acc_config, bpm, bg_color, duree, session_artefacts=None):
+    sequence = parser_texte(code)
+    if not sequence: raise ValueError("Tablature vide.")
+    # Magasin adressé par contenu : une vidéo déjà encodée (par n'importe quelle session) est reprise telle quelle
+    cache = magasin_travail('videos', session_artefacts); cle = cle_video(sequence, acc_config, bpm, FPS_VIDEO, bg_color, duree)
+    if cache.existe(cle): return cache.chemin(cle)
+    travail.avancer(10, "Mixage de l'audio...")
+    audio_buffer = generer_audio_mix(sequence, bpm, acc_config, complet=True)
+    if not audio_buffer: raise RuntimeError("Audio indisponible.")
+    travail.avancer(30, "Génération de la partition déroulante (HD)...")
+    styles_video = {'FOND': bg_color, 'TEXTE': 'black', 'PERLE_FOND': bg_color, 'LEGENDE_FOND': bg_color}
+    partition = PartitionLongue(sequence, acc_config, styles_video, dpi=90)
+    travail.avancer(50, "Encodage vidéo en cours...")
+    chemin_tmp = cache.chemin_temporaire(cle)
+    creer_video_avec_son_calibree(partition, audio_buffer, duree, (partition.pixels_par_temps, partition.offset_premiere_note_px), bpm, fps=FPS_VIDEO, output_filename=chemin_tmp)
+    cache.valider(chemin_tmp, cle)
+    return cache.chemin(cle)
+
+def travail_audio(travail, code, acc_config, bpm):
+    sequence = parser_texte(code)
+    travail.avancer(20, "Mixage de l'audio...")
+    wav = generer_audio_mix(sequence, bpm, acc_config)
+    if not wav: raise RuntimeError("Audio indisponible.")
+    return {'audio_buffer': wav, 'audio_source': (sequence, bpm, acc_config)}
+
+# --- Côté session : soumission et suivi ---
+def id_session():
+    if 'id_session' not in st.session_state: st.session_state.id_session = os.urandom(8).hex()
+    return st.session_state.id_session
+
+def lancer_travail(type_travail, nom, fonction, *args):
+    travail = get_ordonnanceur().soumettre(id_session(), nom, fonction, args, mesurer=mesures_actives())
+    if travail is None: st.warning("⏳ Trop de travaux en attente : réessayez dans un instant.")
+    else: st.session_state.travaux[type_travail] = travail
+    return travail
+
+@st.fragment(run_every=INTERVALLE_SUIVI_S)
+def suivre_travail(type_travail):
+    # Rafraîchi seul chaque seconde ; relance toute la page quand le travail est fini
+    travail = st.session_state.travaux.get(type_travail)
+    if travail is None: return
+    if not travail.actif: st.rerun()
+    if travail.etat == 'en_attente': st.progress(0, text=f"⏳ En file d'attente ({get_ordonnanceur().nb_en_attente()} travail(s) en attente sur le serveur)...")
+    else: st.progress(travail.progression, text=travail.message or "Démarrage...")
+
+def afficher_travail(type_travail, appliquer):
+    # À l'endroit du bouton : suivi tant que le travail tourne, puis résultat remis à la session (ou erreur)
+    travail = st.session_state.travaux.get(type_travail)
+    if travail is None: return
+    if travail.actif: suivre_travail(type_travail); return
+    del st.session_state.travaux[type_travail]
+    if travail.etat == 'erreur': st.error(f"❌ {travail.erreur}")
+    else: appliquer(travail.resultat)
+
+# ==============================================================================
+# 🎹 SÉQUENCEUR (grille creuse, une seule composante)
+# ==============================================================================
+# La grille vit dans la session sous forme creuse : l'ensemble des indices t * 12 + corde cochés.
+# Une seule composante HTML/JS l'affiche (au lieu d'une case à cocher par cellule) et renvoie l'ensemble à chaque clic.
+CORDES_SEQUENCEUR = np.array(['6G', '5G', '4G', '3G', '2G', '1G', '1D', '2D', '3D', '4D', '5D', '6D'])
+DOIGTS_SEQUENCEUR = np.where(np.isin(CORDES_SEQUENCEUR, ['1G', '2G', '3G', '1D', '2D', '3D']), " P", " I")
+NB_TEMPS_MAX_SEQUENCEUR = 64
+
+CSS_GRILLE_SEQUENCEUR = """
+.grille { display: grid; gap: 2px; max-height: 400px; overflow: auto; font-family: var(--st-font, sans-serif); font-size: 0.8rem; }
+.grille b { position: sticky; top: 0; text-align: center; background: var(--st-background-color, #fff); padding: 2px 0; }
+.grille .num { text-align: right; padding-right: 4px; opacity: 0.6; align-self: center; }
+.grille button { min-width: 28px; height: 28px; border: 1px solid var(--st-border-color, #ccc); border-radius: 4px; background: transparent; cursor: pointer; padding: 0; }
+.grille button.on { background: var(--st-primary-color, #ff4b4b); border-color: var(--st-primary-color, #ff4b4b); }
+"""
+
+JS_GRILLE_SEQUENCEUR = """
+export default function(composante) {
+    const { data, parentElement, setStateValue } = composante;
+    let grille = parentElement.querySelector('.grille');
+    if (!grille) { grille = document.createElement('div'); grille.className = 'grille'; parentElement.appendChild(grille); }
+    const actives = new Set(data.actives); const nbCordes = data.cordes.length;
+    grille.style.gridTemplateColumns = `2.5em repeat(${nbCordes}, 1fr)`;
+    const cases = ['<b>T</b>', ...data.cordes.map(c => `<b>${c}</b>`)];
+    for (let t = 0; t < data.nb_temps; t++) {
+        cases.push(`<span class="num">${t + 1}</span>`);
+        for (let i = 0; i < nbCordes; i++) {
+            const k = t * nbCordes + i;
+            cases.push(`<button data-k="${k}" title="${t + 1} · ${data.cordes[i]}" class="${actives.has(k) ? 'on' : ''}"></button>`);
+        }
+    }
+    grille.innerHTML = cases.join('');
+    grille.onclick = (e) => {
+        if (!e.target.dataset || e.target.dataset.k === undefined) return;
+        const k = Number(e.target.dataset.k);
+        e.target.classList.toggle('on');
+        if (actives.has(k)) actives.delete(k); else actives.add(k);
+        setStateValue('cellules', [...actives].sort((a, b) => a - b));
+    };
+}
+"""
+
+@st.cache_resource
+def get_composante_grille():
+    return st.components.v2.component("grille_sequenceur", css=CSS_GRILLE_SEQUENCEUR, js=JS_GRILLE_SEQUENCEUR)
+
+def grille_vers_matrice(cellules, nb_temps):
+    # Les cellules au-delà de nb_temps restent en session (réapparaissent si on rallonge la grille) mais sont ignorées ici
+    matrice = np.zeros((nb_temps, len(CORDES_SEQUENCEUR)), dtype=bool)
+    indices = np.fromiter(cellules, dtype=np.int64, count=len(cellules))
+    matrice.flat[indices[indices < matrice.size]] = True
+    return matrice
+
+def matrice_vers_texte(matrice, symbole):
+    # Une ligne par note cochée (la première du temps porte le symbole, les suivantes '='), '{symbole} S' pour un temps vide
+    temps, cordes = np.nonzero(matrice)
+    premier = np.ones(len(temps), dtype=bool); premier[1:] = temps[1:] != temps[:-1]
+    lignes_notes = np.char.add(np.char.add(np.where(premier, f"{symbole} ", "= "), CORDES_SEQUENCEUR[cordes]), DOIGTS_SEQUENCEUR[cordes])
+    vides = np.flatnonzero(~matrice.any(axis=1))
+    lignes = np.concatenate([lignes_notes.astype(object), np.full(len(vides), f"{symbole} S", dtype=object)])
+    ordre = np.argsort(np.concatenate([temps, vides]), kind='stable')
+    return "".join(ligne + "\n" for ligne in lignes[ordre])
+
+def vider_grille():
+    # Nouvelle clé de composante : l'état gardé côté navigateur repart de zéro avec la session
+    st.session_state.seq_grid = frozenset()
+    st.session_state.seq_version = st.session_state.get('seq_version', 0) + 1
+
+def maj_grille_sequenceur(cle):
+    # Appelé seulement quand le navigateur modifie la grille : un changement côté Python (vider_grille) n'est pas écrasé
+    cellules = st.session_state[cle].get('cellules') or []
+    taille_max = NB_TEMPS_MAX_SEQUENCEUR * len(CORDES_SEQUENCEUR)
+    st.session_state.seq_grid = frozenset(k for k in cellules if isinstance(k, int) and 0 <= k < taille_max)
+
+def afficher_grille_sequenceur(nb_temps):
+    cle = f"seq_grille_{st.session_state.get('seq_version', 0)}"; actives = sorted(st.session_state.seq_grid)
+    get_composante_grille()(
+        key=cle, data={'nb_temps': nb_temps, 'cordes': CORDES_SEQUENCEUR.tolist(), 'actives': actives},
+        default={'cellules': actives}, on_cellules_change=lambda: maj_grille_sequenceur(cle))
+
 # ==============================================================================
 # 🎛️ INTERFACE STREAMLIT
 # ==============================================================================
@@ -742,9 +2013,20 @@ if st.session_state.code_actuel == "":
     st.session_state.code_actuel = BANQUE_TABLATURES[PREMIER_TITRE].strip()
 
 query_params = st.query_params
-if "code" in query_params and st.session_state.code_actuel == BANQUE_TABLATURES[PREMIER_TITRE].strip():
-    try: st.session_state.code_actuel = query_params["code"]
-    except: pass
+if query_params.get("debug") == "1": st.session_state.debug_mesures = True
+if 'lien_lu' not in st.session_state:
+    # Le lien n'est lu qu'au premier passage de la session ; ?code= (texte brut) reste accepté pour les anciens liens
+    st.session_state.lien_lu = True
+    if "p" in query_params:
+        try:
+            partage = decoder_lien(query_params["p"])
+            st.session_state.code_actuel = partage['code']
+            for k, note in (partage['accordage'] or {}).items(): st.session_state[f"acc_{k}"] = note
+            st.session_state.stored_blocks.update(partage['blocs'] or {})
+        except ValueError as e: st.toast(f"Lien de partage ignoré : {e}", icon="⚠️")
+    elif "code" in query_params: st.session_state.code_actuel = query_params["code"]
+if 'projet_a_appliquer' in st.session_state:
+    for cle, valeur in st.session_state.pop('projet_a_appliquer').items(): st.session_state[cle] = valeur
 
 def charger_element_banque(titre):
     if titre in BANQUE_TABLATURES:
@@ -752,10 +2034,10 @@ def charger_element_banque(titre):
         st.session_state.code_actuel = nouveau
         st.session_state.widget_input = nouveau
         st.session_state.partition_generated = False
-        st.session_state.video_path = None
+        liberer_video()
         st.session_state.audio_buffer = None
         st.session_state.pdf_buffer = None
-        st.session_state.seq_grid = {}
+        vider_grille()
         gc.collect()
         nom_gamme_a_charger = ASSOCIATIONS_MORCEAUX_GAMMES.get(titre, "1. Pentatonique Fondamentale")
         if nom_gamme_a_charger in GAMMES_PRESETS:
@@ -770,7 +2052,7 @@ def charger_element_banque(titre):
 def mise_a_jour_texte(): 
     st.session_state.code_actuel = st.session_state.widget_input
     st.session_state.partition_generated = False
-    st.session_state.video_path = None
+    liberer_video()
     st.session_state.audio_buffer = None
     st.session_state.pdf_buffer = None
 
@@ -842,9 +2124,14 @@ with st.sidebar:
     mailto_gamme = f"mailto:julienflorin59@gmail.com?subject=Proposition de nouvelle gamme Ngonilélé&body=Bonjour,%0A%0AVoici une proposition de nouvelle gamme :%0A%0A{current_scale_info}%0A%0ANom suggéré : ..."
     st.markdown(f'<a href="{mailto_gamme}" target="_blank"><button title="Envoyez votre gamme personnalisée au développeur" style="width:100%; background-color:#A67C52; color:white; padding:10px; border:none; border-radius:5px; cursor:pointer; font-weight:bold; margin-top:5px;">📧 Proposer une gamme</button></a>', unsafe_allow_html=True)
 
+    c_lien_acc, c_lien_blocs = st.columns(2)
+    with c_lien_acc: lien_accordage = st.checkbox("🎸 Accordage", key="lien_accordage", help="Inclure l'accordage actuel dans le lien")
+    with c_lien_blocs: lien_blocs = st.checkbox("🧱 Blocs", key="lien_blocs", help="Inclure les blocs enregistrés dans le lien")
     if st.button("🔗 Créer un lien de partage", help="Génère une URL unique pour partager votre composition actuelle avec d'autres."):
-        url_share = f"https://share.streamlit.io/votre_app?code={urllib.parse.quote(st.session_state.code_actuel)}"
-        st.code(url_share, language="text")
+        accordage = {k: st.session_state.get(f"acc_{k}", DEF_ACC[k]) for k in ORDRE_MAPPING_GAMME} if lien_accordage else None
+        jeton = encoder_lien(st.session_state.code_actuel, accordage, st.session_state.stored_blocks if lien_blocs else None)
+        url_app = (st.context.url or "https://share.streamlit.io/votre_app").split('?')[0]
+        st.code(f"{url_app}?p={jeton}", language="text")
     
     st.markdown("---")
     with st.expander("📖 Guide & Légende", expanded=False):
@@ -900,10 +2187,10 @@ with tab_acc:
                 for idx, corde_key in enumerate(ORDRE_MAPPING_GAMME):
                     note = parsed_notes_preview[idx]
                     temp_acc_config[corde_key] = {'n': note, 'x': 0} 
-                    temp_sequence.append({'temps': idx + 1, 'corde': corde_key})
+                    temp_sequence.append({'tick': idx * TICKS_NOIRE, 'duration': TICKS_NOIRE, 'corde': corde_key})
                 with st.spinner("Génération de l'aperçu..."):
                     preview_buffer = generer_audio_mix(temp_sequence, 100, temp_acc_config, preview_mode=True)
-                    if preview_buffer: st.audio(preview_buffer, format='audio/mp3', autoplay=True)
+                    if preview_buffer: st.audio(preview_buffer, format='audio/wav', autoplay=True)
 
     st.markdown("---")
     st.markdown("##### Code Couleur des Notes")
@@ -952,14 +2239,14 @@ with tab_acc:
         if st.button("🎧 Écouter la gamme personnalisée", use_container_width=True, help="Joue votre configuration personnalisée"):
              temp_sequence = []
              for idx, corde_key in enumerate(ORDRE_MAPPING_GAMME):
-                 temp_sequence.append({'temps': idx + 1, 'corde': corde_key})
+                 temp_sequence.append({'tick': idx * TICKS_NOIRE, 'duration': TICKS_NOIRE, 'corde': corde_key})
              with st.spinner("Génération..."):
                  preview_buffer = generer_audio_mix(temp_sequence, 100, acc_config, preview_mode=True)
-                 if preview_buffer: st.audio(preview_buffer, format='audio/mp3', autoplay=True)
+                 if preview_buffer: st.audio(preview_buffer, format='audio/wav', autoplay=True)
     st.markdown("---")
 
 with tab_edit:
-    titre_partition = st.text_input("Titre de la partition", "Tablature Ngonilélé", help="Ce titre apparaîtra en haut de votre fichier PDF")
+    titre_partition = st.text_input("Titre de la partition", "Tablature Ngonilélé", key="titre_partition", help="Ce titre apparaîtra en haut de votre fichier PDF")
     col_input, col_view = st.columns([1, 1.5])
     with col_input:
         st.subheader("Éditeur")
@@ -1042,44 +2329,17 @@ with tab_edit:
             symbol_map = {"Noire (+)": "+", "Croche (♪)": "♪", "Triolet (🎶)": "🎶", "Double (♬)": "♬"}
             current_seq_symbol = symbol_map[seq_res]
             
-            nb_temps = st.number_input("Nombre de colonnes", min_value=4, max_value=64, value=8, step=4, help="Nombre de temps affichés dans la grille")
-            cols = st.columns([0.8] + [1]*12) 
-            cordes_list = ['6G', '5G', '4G', '3G', '2G', '1G', '1D', '2D', '3D', '4D', '5D', '6D']
-            with cols[0]: st.write("**T**")
-            for i, c in enumerate(cordes_list):
-                with cols[i+1]: st.markdown(f"**{c}**")
-            with st.container(height=400):
-                for t in range(nb_temps):
-                    cols = st.columns([0.8] + [1]*12)
-                    with cols[0]: st.write(""); st.caption(f"**{t+1}**")
-                    for i, c in enumerate(cordes_list):
-                        key = f"T{t}_{c}"
-                        if key not in st.session_state.seq_grid: st.session_state.seq_grid[key] = False
-                        with cols[i+1]: st.session_state.seq_grid[key] = st.checkbox(" ", key=key, value=st.session_state.seq_grid[key], label_visibility="collapsed")
+            nb_temps = st.number_input("Nombre de colonnes", min_value=4, max_value=NB_TEMPS_MAX_SEQUENCEUR, value=8, step=4, help="Nombre de temps affichés dans la grille")
+            afficher_grille_sequenceur(nb_temps)
             st.write("")
             col_seq_btn, col_seq_reset = st.columns([3, 1])
             with col_seq_btn:
                 if st.button("📥 Insérer la séquence", type="primary", use_container_width=True, help="Convertit la grille ci-dessus en code texte et l'ajoute à l'éditeur"):
-                    texte_genere = ""
-                    for t in range(nb_temps):
-                        notes_activees = []
-                        for c in cordes_list:
-                            if st.session_state.seq_grid[f"T{t}_{c}"]: notes_activees.append(c)
-                        
-                        # --- UTILISATION DU SYMBOLE CHOISI ---
-                        if not notes_activees: texte_genere += f"{current_seq_symbol} S\n"
-                        else:
-                            premier = True
-                            for note in notes_activees:
-                                prefix = current_seq_symbol if premier else "= "
-                                doigt = " P" if note in ['1G','2G','3G','1D','2D','3D'] else " I"
-                                texte_genere += f"{prefix}{note}{doigt}\n"
-                                premier = False
-                    ajouter_texte(texte_genere)
+                    ajouter_texte(matrice_vers_texte(grille_vers_matrice(st.session_state.seq_grid, nb_temps), current_seq_symbol))
                     st.toast("Séquence ajoutée !", icon="🎹")
             with col_seq_reset:
                 if st.button("🗑️", help="Vide toute la grille"):
-                    for k in st.session_state.seq_grid: st.session_state.seq_grid[k] = False
+                    vider_grille()
                     st.rerun()
             afficher_section_sauvegarde_bloc("seq")
 
@@ -1114,18 +2374,17 @@ with tab_edit:
         st.text_area("Code", height=150, key="widget_input", on_change=mise_a_jour_texte, label_visibility="collapsed", help="Zone d'édition manuelle du code de la tablature")
         
         col_play_btn, col_play_bpm = st.columns([1, 1])
-        with col_play_bpm: bpm_preview = st.number_input("BPM", 40, 200, 100, help="Vitesse de lecture pour l'aperçu audio")
+        with col_play_bpm: bpm_preview = st.number_input("BPM", 40, 200, 100, key="bpm_preview", help="Vitesse de lecture pour l'aperçu audio")
         with col_play_btn:
             st.write(""); st.write("")
-            if st.button("🎧 Écouter", help="Génère un aperçu audio rapide de ce qui est écrit dans l'éditeur"):
-                with st.status("🎵 ...", expanded=False) as status:
-                    seq_prev = parser_texte(st.session_state.code_actuel)
-                    audio_prev = generer_audio_mix(seq_prev, bpm_preview, acc_config)
-                    status.update(label="Prêt", state="complete")
-                if audio_prev: st.audio(audio_prev, format="audio/mp3")
+            if st.button("🎧 Écouter", help="Joue ce qui est écrit dans l'éditeur ; la lecture démarre dès la première fenêtre mixée"):
+                with execution_mesuree("Écouter"):
+                    seq_prev = parser_code_actuel()
+                    lire_en_fenetres(seq_prev, bpm_preview, acc_config)
+            if st.button("⏹️ Arrêter", help="Coupe la lecture en cours"): st.html(HTML_ARRET_LECTURE, unsafe_allow_javascript=True)
 
         with st.expander("Gérer le fichier (Sauvegarde & Projet)"):
-            tab_txt, tab_proj = st.tabs(["📄 Texte", "📦 Projet Complet"])
+            tab_txt, tab_proj, tab_midi = st.tabs(["📄 Texte", "📦 Projet Complet", "🎼 MIDI"])
             with tab_txt:
                 st.download_button(label="💾 Sauvegarder (.txt)", data=st.session_state.code_actuel, file_name=f"{titre_partition}.txt", mime="text/plain", use_container_width=True, help="Télécharge uniquement le texte de la tablature")
                 uploaded_txt = st.file_uploader("Charger .txt", type="txt", key="load_txt", help="Charge un fichier texte simple")
@@ -1136,129 +2395,103 @@ with tab_edit:
                     st.toast("Fichier chargé !", icon="✅")
                     st.rerun()
             with tab_proj:
-                projet_data = { "titre": titre_partition, "code": st.session_state.code_actuel, "blocs": st.session_state.stored_blocks, "version": "1.0" }
-                json_str = json.dumps(projet_data, indent=4)
-                st.download_button(label="💾 Sauvegarder votre projet", data=json_str, file_name=f"{titre_partition}.ngoni", mime="application/json", use_container_width=True, help="Sauvegarde tout : code, blocs et configuration")
+                avec_rendus = st.checkbox("🖼️ Inclure les rendus", key="projet_rendus", help="Embarque les pages, le MP3 et la vidéo déjà calculés : le projet rouvert n'a pas à les refaire")
+                artefacts = []
+                if avec_rendus:
+                    artefacts = [('pages', cle) for item in st.session_state.partition_buffers for cle in item.get('cles', {}).values()]
+                    if st.session_state.get('audio_source'): artefacts.append(('audio', cle_audio(*st.session_state.audio_source, 'mp3')))
+                    if st.session_state.video_path: artefacts.append(('videos', os.path.basename(st.session_state.video_path)))
+                projet_args = (titre_partition, st.session_state.code_actuel, dict(st.session_state.stored_blocks), {k: acc_config[k]['n'] for k in ORDRE_MAPPING_GAMME if k in acc_config},
+                               {nom: st.session_state.get(f"bpm_{nom}") for nom in BPM_PROJET if st.session_state.get(f"bpm_{nom}") is not None}, artefacts, session_artefacts())
+                st.download_button(label="💾 Sauvegarder votre projet", data=lambda: exporter_projet(*projet_args), file_name=f"{titre_partition}.ngoni", mime="application/zip", use_container_width=True, help="Sauvegarde tout : code, blocs, accordage et BPM (et les rendus si demandé)")
                 uploaded_proj = st.file_uploader("Charger votre projet sauvegardé", type=["ngoni", "json"], key="load_proj", help="Restaure un projet complet")
-                if uploaded_proj:
+                if uploaded_proj and st.session_state.get('projet_charge') != uploaded_proj.file_id:
                     try:
-                        data = json.load(uploaded_proj)
-                        st.session_state.code_actuel = data.get("code", "")
-                        st.session_state.widget_input = data.get("code", "")
-                        st.session_state.stored_blocks = data.get("blocs", {})
-                        st.toast("Projet restauré (Code + Blocs) !", icon="🎉")
+                        blocs_projet, valeurs_projet, nb_rendus = charger_projet(uploaded_proj, id_session())
+                        if nb_rendus: st.session_state.artefacts_importes = True
+                        st.session_state.stored_blocks = blocs_projet
+                        st.session_state.projet_a_appliquer = valeurs_projet
+                        st.session_state.projet_charge = uploaded_proj.file_id
+                        st.toast("Projet restauré (Code + Blocs + Accordage)" + (f", {nb_rendus} rendu(s) en cache" if nb_rendus else "") + " !", icon="🎉")
                         st.rerun()
-                    except Exception as e: st.error(f"Erreur : {e}")
+                    except (ValueError, KeyError, zipfile.BadZipFile, UnicodeDecodeError, zlib.error, OSError) as e: st.error(f"Erreur : {e}")
+            with tab_midi:
+                if not HAS_MIDO or module_casse('mido'): st.error("Manque mido")
+                else:
+                    code_midi = st.session_state.code_actuel; acc_midi = dict(acc_config)
+                    st.download_button(label="💾 Exporter (.mid)", data=lambda: exporter_midi(parser_texte(code_midi), acc_midi, bpm_preview, titre_partition).getvalue(), file_name=f"{titre_partition}.mid", mime="audio/midi", use_container_width=True, help="Notes à la hauteur de l'accordage actuel, doigté dans le canal (0 = pouce, 1 = index)")
+                    grille_midi = st.radio("Grille d'import", list(GRILLES_IMPORT_MIDI), horizontal=True, key="grille_midi", help="Quantification des attaques du fichier MIDI")
+                    uploaded_midi = st.file_uploader("Charger .mid", type=["mid", "midi"], key="load_midi", help="Chaque note va sur la corde la plus proche de l'accordage actuel")
+                    midi_nouveau = uploaded_midi and st.session_state.get('midi_importe') != uploaded_midi.file_id
+                    if midi_nouveau and not module_utilisable('mido'): st.error("Manque mido")
+                    elif midi_nouveau:
+                        try:
+                            texte_midi, bpm_midi = importer_midi(uploaded_midi.getvalue(), acc_config, GRILLES_IMPORT_MIDI[grille_midi])
+                            st.session_state.midi_importe = uploaded_midi.file_id
+                            st.session_state.code_actuel = texte_midi
+                            st.session_state.widget_input = texte_midi
+                            st.toast(f"MIDI importé ({bpm_midi} BPM)", icon="✅")
+                            st.rerun()
+                        except Exception as e: st.error(f"Erreur : {e}")
        
     with col_view:
         st.subheader("Aperçu")
         view_container = st.container()
-        visuals_rendered_this_run = False 
         def afficher_visuels(container):
             with container:
                 for item in st.session_state.partition_buffers:
-                    if item['type'] == 'legende': st.markdown("#### Page 1 : Légende"); st.pyplot(item['img_ecran'])
-                    elif item['type'] == 'page': st.markdown(f"#### Page {item['idx']}"); st.pyplot(item['img_ecran'])
+                    if item['type'] == 'legende': st.markdown("#### Page 1 : Légende"); st.image(item['img_ecran'])
+                    elif item['type'] == 'page': st.markdown(f"#### Page {item['idx']}"); st.image(item['img_ecran'])
         def afficher_bouton_pdf(container):
             with container:
                  if st.session_state.pdf_buffer:
                     st.markdown("---")
                     st.download_button(label="📕 Télécharger PDF", data=st.session_state.pdf_buffer, file_name=f"{titre_partition}.pdf", mime="application/pdf", type="primary", use_container_width=True, help="Télécharger le fichier PDF final pour impression")
-
+        def appliquer_livret(resultat):
+            # Résultat partagé entre sessions : chaque session reçoit ses propres tampons
+            st.session_state.partition_buffers = [{**item, 'buf': io.BytesIO(item['buf'].getvalue())} if 'buf' in item else dict(item) for item in resultat['partition_buffers']]
+            st.session_state.pdf_buffer = io.BytesIO(resultat['pdf_buffer'].getvalue())
+            st.session_state.partition_generated = True
+            st.toast("✅ Génération terminée !")
+
+        pdf_vectoriel = st.checkbox("✒️ PDF vectoriel", key="pdf_vectoriel", help="Pages dessinées en vectoriel : fichier plus léger et impression nette à toute taille")
         if st.button("🔄 Générer", type="primary", use_container_width=True, help="Lance le traitement pour créer les images de la partition et le PDF"):
             st.session_state.partition_buffers = [] 
             st.session_state.pdf_buffer = None
-            DPI_PDF_OPTIMISE = 150 
+            st.session_state.partition_generated = False
             styles_ecran = {'FOND': bg_color, 'TEXTE': 'black', 'PERLE_FOND': bg_color, 'LEGENDE_FOND': bg_color}
             styles_print = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
             options_visuelles = {'use_bg': use_bg_img, 'alpha': bg_alpha}
-            
-            with st.status("📸 Traitement en cours...", expanded=True) as status:
-                prog_bar = st.progress(0, text="Analyse du texte...")
-                sequence = parser_texte(st.session_state.code_actuel)
-                
-                status.write("📘 Génération de la Légende...")
-                fig_leg_ecran = generer_page_1_legende(titre_partition, styles_ecran, mode_white=False)
-                if force_white_print:
-                    fig_leg_dl = generer_page_1_legende(titre_partition, styles_print, mode_white=True)
-                    buf_leg = io.BytesIO(); fig_leg_dl.savefig(buf_leg, format="png", dpi=DPI_PDF_OPTIMISE, facecolor=styles_print['FOND'], bbox_inches='tight'); buf_leg.seek(0)
-                    plt.close(fig_leg_dl)
-                else:
-                    fig_leg_dl = fig_leg_ecran
-                    buf_leg = io.BytesIO(); fig_leg_dl.savefig(buf_leg, format="png", dpi=DPI_PDF_OPTIMISE, facecolor=styles_ecran['FOND'], bbox_inches='tight'); buf_leg.seek(0)
-                st.session_state.partition_buffers.append({'type':'legende', 'buf': buf_leg, 'img_ecran': fig_leg_ecran})
-                
-                pages_data = []; current_page = []
-                for n in sequence:
-                    if n['corde'] == 'PAGE_BREAK':
-                        if current_page: pages_data.append(current_page); current_page = []
-                    else: current_page.append(n)
-                if current_page: pages_data.append(current_page)
-                
-                if not pages_data: 
-                    st.warning("Vide.")
-                    prog_bar.progress(100, text="Terminé (Vide).")
-                else:
-                    total_steps = len(pages_data)
-                    for idx, page in enumerate(pages_data):
-                        p_cent = int(((idx) / total_steps) * 90)
-                        prog_bar.progress(p_cent + 10, text=f"Dessin de la page {idx+1}/{total_steps}...")
-                        fig_ecran = generer_page_notes(page, idx+2, titre_partition, acc_config, styles_ecran, options_visuelles, mode_white=False)
-                        if force_white_print:
-                            fig_dl = generer_page_notes(page, idx+2, titre_partition, acc_config, styles_print, options_visuelles, mode_white=True)
-                            buf = io.BytesIO(); fig_dl.savefig(buf, format="png", dpi=DPI_PDF_OPTIMISE, facecolor=styles_print['FOND'], bbox_inches='tight'); buf.seek(0)
-                            plt.close(fig_dl)
-                        else:
-                            buf = io.BytesIO(); fig_ecran.savefig(buf, format="png", dpi=DPI_PDF_OPTIMISE, facecolor=styles_ecran['FOND'], bbox_inches='tight'); buf.seek(0)
-                        st.session_state.partition_buffers.append({'type':'page', 'idx': idx+2, 'buf': buf, 'img_ecran': fig_ecran})
-                        plt.close(fig_ecran)
-                
-                st.session_state.partition_generated = True
-                visuals_rendered_this_run = True
-                afficher_visuels(view_container)
-                
-                prog_bar.progress(95, text="Assemblage du livret PDF...")
-                st.session_state.pdf_buffer = generer_pdf_livret(st.session_state.partition_buffers, titre_partition)
-                prog_bar.progress(100, text="Terminé !")
-                status.update(label="✅ Génération terminée !", state="complete", expanded=False)
-                afficher_bouton_pdf(view_container)
+            contexte_rendu = {'titre': titre_partition, 'config_acc': acc_config, 'styles_ecran': styles_ecran, 'styles_print': styles_print, 'options_visuelles': options_visuelles, 'force_white_print': force_white_print, 'vectoriel': pdf_vectoriel, 'mesurer': mesures_actives()}
+            if not parser_code_actuel().pages(): st.warning("Vide.")
+            lancer_travail('livret', "Générer", travail_livret, st.session_state.code_actuel, contexte_rendu, session_artefacts())
+        afficher_travail('livret', appliquer_livret)
 
-        if st.session_state.partition_generated and not visuals_rendered_this_run:
+        if st.session_state.partition_generated:
             afficher_visuels(view_container)
             afficher_bouton_pdf(view_container)
 
 with tab_video:
     st.subheader("Vidéo 🎥")
     st.warning("⚠️ Version Bêta.")
-    if not HAS_MOVIEPY or not HAS_PYDUB: st.error("Modules manquants.")
+    if not HAS_FFMPEG or not HAS_PYDUB or module_casse('pydub'): st.error("Modules manquants.")
     else:
         col_v1, col_v2 = st.columns(2)
         with col_v1:
             bpm = st.slider("BPM", 30, 200, 60, key="bpm_video", help="Vitesse de défilement de la vidéo")
-            seq = parser_texte(st.session_state.code_actuel)
-            duree_estimee = ((seq[-1]['tick'] / 12) * (60/bpm)) + 4 if seq else 10 # Estimation base 12
+            seq = parser_code_actuel()
+            duree_estimee = ((int(seq.ticks[-1]) / 12) * (60/bpm)) + 4 if seq else 10 # Estimation base 12
             st.write(f"Durée : {int(duree_estimee)}s")
         with col_v2:
             if st.button("🎥 Créer Vidéo", type="primary", use_container_width=True, help="Génère un fichier MP4 avec la tablature qui défile"):
-                with st.status("🎬 Studio de montage...", expanded=True) as status:
-                    v_bar = st.progress(0, text="Initialisation...")
-                    sequence = parser_texte(st.session_state.code_actuel)
-                    v_bar.progress(10, text="Mixage de l'audio...")
-                    audio_buffer = generer_audio_mix(sequence, bpm, acc_config)
-                    if audio_buffer:
-                        v_bar.progress(30, text="Génération de la partition déroulante (HD)...")
-                        styles_video = {'FOND': bg_color, 'TEXTE': 'black', 'PERLE_FOND': bg_color, 'LEGENDE_FOND': bg_color}
-                        img_buffer, px, offset = generer_image_longue_calibree(sequence, acc_config, styles_video, dpi=90)
-                        if img_buffer:
-                            v_bar.progress(50, text="Encodage vidéo en cours...")
-                            video_path = creer_video_avec_son_calibree(img_buffer, audio_buffer, duree_estimee, (px, offset), bpm, fps=12)
-                            if video_path:
-                                st.session_state.video_path = video_path 
-                                v_bar.progress(100, text="Terminé !")
-                                status.update(label="✅ Vidéo prête !", state="complete", expanded=False)
-                            else: v_bar.progress(0, text="Erreur."); status.update(label="❌ Erreur encodage", state="error")
+                if not module_utilisable('pydub'): st.error("Modules manquants.")
+                else: lancer_travail('video', "Créer Vidéo", travail_video, st.session_state.code_actuel, acc_config, bpm, bg_color, duree_estimee, session_artefacts())
+            def appliquer_video(video_path):
+                st.session_state.video_path = video_path; st.toast("✅ Vidéo prête !")
+            afficher_travail('video', appliquer_video)
         
         if st.session_state.video_path and os.path.exists(st.session_state.video_path):
+            get_cache_videos().retenir(os.path.basename(st.session_state.video_path), id_session()) # bail renouvelé à chaque affichage
             st.video(st.session_state.video_path)
             with open(st.session_state.video_path, "rb") as file:
                 st.download_button("⬇️ Télécharger MP4", data=file, file_name="ngoni_video.mp4", mime="video/mp4", type="primary", help="Télécharger le fichier vidéo généré")
@@ -1267,22 +2500,44 @@ with tab_audio:
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("🎧 Audio")
-        if not HAS_PYDUB: st.error("Manque pydub")
+        if not HAS_PYDUB or module_casse('pydub'): st.error("Manque pydub")
         else:
-            bpm_audio = st.slider("BPM", 30, 200, 100, key="bpm_audio", help="Vitesse pour le fichier MP3")
-            if st.button("🎵 Créer MP3", type="primary", use_container_width=True, help="Génère un fichier audio complet de votre morceau"):
-                seq = parser_texte(st.session_state.code_actuel)
-                mp3 = generer_audio_mix(seq, bpm_audio, acc_config)
-                if mp3: st.session_state.audio_buffer = mp3
-            if st.session_state.audio_buffer:
-                st.audio(st.session_state.audio_buffer, format="audio/mp3")
-                st.download_button("⬇️ MP3", data=st.session_state.audio_buffer, file_name="ngoni.mp3", mime="audio/mpeg", type="primary", help="Télécharger le fichier audio")
+            bpm_audio = st.slider("BPM", 30, 200, 100, key="bpm_audio", help="Vitesse du morceau")
+            if st.button("🎵 Créer Audio", type="primary", use_container_width=True, help="Génère l'écoute complète de votre morceau (le MP3 est encodé au téléchargement)"):
+                if not module_utilisable('pydub'): st.error("Manque pydub")
+                else: lancer_travail('audio', "Créer Audio", travail_audio, st.session_state.code_actuel, acc_config, bpm_audio)
+            def appliquer_audio(resultat):
+                st.session_state.audio_buffer = io.BytesIO(resultat['audio_buffer'].getvalue()); st.session_state.audio_source = resultat['audio_source']
+            afficher_travail('audio', appliquer_audio)
+            if st.session_state.audio_buffer and st.session_state.get('audio_source'):
+                st.audio(st.session_state.audio_buffer, format="audio/wav")
+                seq_mp3, bpm_mp3, acc_mp3 = st.session_state.audio_source; cache_mp3 = magasin_travail('audio', session_artefacts())
+                st.download_button("⬇️ MP3", data=lambda: encoder_audio_mix(seq_mp3, bpm_mp3, acc_mp3, cache=cache_mp3), file_name="ngoni.mp3", mime="audio/mpeg", type="primary", help="Télécharger le fichier audio (encodé à la demande, puis gardé en cache)")
     with c2:
         st.subheader("🥁 Métronome")
-        sig = st.radio("Sig", ["4/4", "3/4"], horizontal=True, help="Signature rythmique")
+        sig = st.radio("Sig", SIGNATURES_METRONOME, horizontal=True, help="Signature rythmique (en x/8, chaque croche est un temps)")
         bpm_m = st.slider("BPM", 30, 200, 80, key="bpm_metro", help="Vitesse du métronome")
-        dur = st.slider("Sec", 10, 300, 60, help="Durée du métronome")
+        subdiv = st.radio("Subdivision", list(SUBDIVISIONS_METRONOME), horizontal=True, key="subdiv_metro", help="Clics discrets entre les temps")
+        swing = st.slider("Swing", 0.0, 1.0, 0.0, 0.1, key="swing_metro", disabled=SUBDIVISIONS_METRONOME[subdiv] % 2 == 1, help="Retarde les contretemps (1 = ternaire)")
+        boucle = st.toggle("🔁 Boucle", value=True, key="boucle_metro", help="Courte boucle WAV jouée en continu ; désactivez pour une piste MP3 de durée fixe")
+        dur = None if boucle else st.slider("Sec", 10, 300, 60, help="Durée du métronome")
         if st.button("▶️ Start", type="primary", help="Génère et joue une piste de clic"):
-            mb = generer_metronome(bpm_m, dur, sig)
-            if mb: st.session_state.metronome_buffer = mb
-        if st.session_state.metronome_buffer: st.audio(st.session_state.metronome_buffer, format="audio/mp3")
\ No newline at end of file
+            mb = generer_metronome(bpm_m, dur, sig, SUBDIVISIONS_METRONOME[subdiv], swing)
+            if mb: st.session_state.metronome_buffer = mb; st.session_state.metronome_format = "audio/wav" if boucle else "audio/mp3"
+        if st.session_state.metronome_buffer:
+            fmt = st.session_state.get('metronome_format', "audio/mp3")
+            st.audio(st.session_state.metronome_buffer, format=fmt, loop=fmt == "audio/wav")
+
+# --- PANNEAU DE MESURES (caché : ?debug=1 ou NGONI_MESURES=1) ---
+if mesures_actives():
+    with st.sidebar:
+        with st.expander("⏱️ Mesures (debug)", expanded=False):
+            if HAS_PYDUB: st.caption(f"Banque de samples : {get_banque_samples().memoire_octets() / 1e6:.1f} Mo en mémoire")
+            couts = get_couts_imports()
+            st.caption("Imports différés : " + (" · ".join(f"{m} {ms:.0f} ms" for m, ms in sorted(couts.items(), key=lambda c: -c[1])) or "aucun pour l'instant") + " (démarrage : python benchmark_kora.py --imports)")
+            historique = list(get_historique_mesures())
+            if not historique: st.caption("Aucune exécution mesurée pour l'instant.")
+            for bilan in reversed(historique):
+                st.markdown(f"**{bilan['execution']}** · {bilan['duree_ms']:.0f} ms" + (f" · ❌ {bilan['erreur']}" if bilan['erreur'] else ""))
+                lignes = [f"| {e['etape']} | {e['duree_ms']:.1f} | {', '.join(f'{k}={v}' for k, v in e.items() if k not in ('etape', 'duree_ms'))} |" for e in bilan['etapes']]
+                if lignes: st.markdown("| Étape | ms | Détails |\n|---|---:|---|\n" + "\n".join(lignes))
@@ -0,0 +1,288 @@
+# ==============================================================================
+# ⏱️ BENCHMARKS HORS STREAMLIT
+# Usage : python benchmark_kora.py                          (tableaux lisibles)
+#         python benchmark_kora.py --json [--sortie f.json] (suite complète, JSON à comparer entre versions)
+#         python benchmark_kora.py --imports [--json]        (coût d'import de app_kora, module par module)
+# ==============================================================================
+import os
+import sys
+import json
+import time
+import logging
+import warnings
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+# L'import exécute le script Streamlit en "bare mode" : on coupe les avertissements
+logging.disable(logging.WARNING)
+import app_kora as kora
+logging.disable(logging.NOTSET)
+import rendu_kora
+
+CORDES_BENCH = ['1D', '1G', '2D', '2G', '3D', '3G', '4D', '4G', '5D', '5G', '6D', '6G']
+RYTHMES_BENCH = ['+', '♪', '♪', '🎶', '🎶', '🎶']
+
+def tablature_synthetique(nb_notes):
+    lignes = ["1   1D"]
+    for i in range(1, nb_notes):
+        lignes.append(f"{RYTHMES_BENCH[i % len(RYTHMES_BENCH)]}   {CORDES_BENCH[i % len(CORDES_BENCH)]}")
+    return "\n".join(lignes)
+
+def tablature_en_pages(nb_notes, notes_par_page=24):
+    lignes = tablature_synthetique(nb_notes).split("\n")
+    for p in range((len(lignes) - 1) // notes_par_page, 0, -1): lignes.insert(p * notes_par_page, "+   PAGE")
+    return "\n".join(lignes)
+
+def livret_synthetique(nb_pages, notes_par_page=24):
+    return tablature_en_pages(nb_pages * notes_par_page, notes_par_page)
+
+def page_synthetique(nb_notes):
+    # Une seule page dense (doubles-croches et accords) pour mesurer le dessin d'une page chargée
+    lignes = ["1   1D"]
+    for i in range(1, nb_notes): lignes.append(f"{'=' if i % 2 else '♬'}   {CORDES_BENCH[i % len(CORDES_BENCH)]}")
+    return "\n".join(lignes)
+
+def config_acc_defaut():
+    return {k: {'x': kora.POSITIONS_X[k], 'n': v} for k, v in kora.DEF_ACC.items()}
+
+def mixage_overlay_pydub(sequence, bpm, samples_pcm):
+    # Ancienne méthode (un overlay pydub par note), gardée comme référence de comparaison
+    samples = {c: kora.pcm_vers_segment(p) for c, p in samples_pcm.items()}
+    ms_par_tick = (60000 / bpm) / kora.TICKS_NOIRE
+    dernier_tick = sequence[-1]['tick'] + sequence[-1]['duration']
+    mix = kora.importer('pydub').AudioSegment.silent(duration=int(dernier_tick * ms_par_tick) + 1000)
+    for n in sequence:
+        if n['corde'] not in samples: continue
+        note_ms = int(n['duration'] * ms_par_tick); original = samples[n['corde']]
+        joue = original[:note_ms].fade_out(15) if len(original) > note_ms else original
+        mix = mix.overlay(joue, position=int(n['tick'] * ms_par_tick))
+    return mix
+
+def bench_mixage_audio(tailles=(250, 500, 1000, 2000, 4000), bpm=100, taille_max_overlay=500):
+    acc_config = config_acc_defaut()
+    samples_pcm = kora.charger_samples_pcm(set(CORDES_BENCH), acc_config)
+    print("🎹 Mixage audio (NumPy vs overlay pydub)")
+    print(f"{'notes':>8} {'numpy (ms)':>12} {'µs/note':>10} {'overlay (ms)':>14}")
+    for nb in tailles:
+        sequence = kora.parser_texte(tablature_synthetique(nb))
+        t0 = time.perf_counter(); kora.mixer_sequence_pcm(sequence, bpm, samples_pcm); t_numpy = time.perf_counter() - t0
+        t_overlay = "-"
+        if nb <= taille_max_overlay:
+            t0 = time.perf_counter(); mixage_overlay_pydub(sequence, bpm, samples_pcm)
+            t_overlay = f"{(time.perf_counter() - t0) * 1000:.0f}"
+        print(f"{nb:>8} {t_numpy * 1000:>12.1f} {t_numpy * 1e6 / nb:>10.1f} {t_overlay:>14}")
+
+def pdf_livret_fpdf(buffers):
+    # Ancienne méthode (FPDF + un PNG temporaire par page), gardée comme référence de comparaison
+    from fpdf import FPDF
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    with tempfile.TemporaryDirectory() as dossier:
+        for i, item in enumerate(buffers):
+            pdf.add_page()
+            temp_img = os.path.join(dossier, f"page_{i}.png")
+            with open(temp_img, "wb") as f: f.write(item['buf'].getvalue())
+            pdf.image(temp_img, x=10, y=10, w=190)
+    return pdf.output(dest='S').encode('latin-1')
+
+def bench_pdf_livret(nb_pages=30):
+    styles = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
+    ctx = {'titre': "Benchmark", 'config_acc': config_acc_defaut(), 'styles_ecran': styles, 'styles_print': styles, 'options_visuelles': {'use_bg': True, 'alpha': 0.2}, 'force_white_print': True}
+    pages = kora.parser_texte(livret_synthetique(nb_pages)).pages()
+    taches = [('page', idx + 2, page, ctx) for idx, page in enumerate(pages)]
+    print(f"📕 Assemblage PDF ({len(taches)} pages, images mises en cache disque)")
+    t0 = time.perf_counter(); buffers = [item for _, item in kora.rendre_livret(taches, kora.get_cache_pages())]
+    print(f"   rendu des pages : {time.perf_counter() - t0:.1f} s")
+    t0 = time.perf_counter(); pdf = kora.generer_pdf_livret(buffers, "Benchmark").getvalue(); t_memoire = time.perf_counter() - t0
+    t0 = time.perf_counter(); pdf_fpdf = pdf_livret_fpdf(buffers); t_fpdf = time.perf_counter() - t0
+    print(f"{'méthode':>12} {'temps (s)':>10} {'taille (Mo)':>12}")
+    print(f"{'mémoire':>12} {t_memoire:>10.2f} {len(pdf) / 1e6:>12.2f}")
+    print(f"{'fpdf':>12} {t_fpdf:>10.2f} {len(pdf_fpdf) / 1e6:>12.2f}")
+    taches_vectoriel = [(type_page, idx, page, {**ctx, 'vectoriel': True}) for type_page, idx, page, _ in taches]
+    t0 = time.perf_counter(); items = [item for _, item in kora.rendre_livret(taches_vectoriel)]
+    pdf_vectoriel = kora.generer_pdf_livret(items, "Benchmark").getvalue(); t_vectoriel = time.perf_counter() - t0
+    print(f"{'vectoriel':>12} {t_vectoriel:>10.2f} {len(pdf_vectoriel) / 1e6:>12.2f}   (dessin des pages compris)")
+
+def bench_dessin_pages(tailles=(50, 200, 1000), dpi=100):
+    styles = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
+    acc_config = config_acc_defaut(); options = {'use_bg': True, 'alpha': 0.2}
+    print(f"🖼️ Dessin d'une page (generer_page_notes + PNG {dpi} dpi)")
+    print(f"{'notes':>8} {'artistes':>9} {'figure (ms)':>12} {'dessin (ms)':>12}")
+    for nb in tailles:
+        notes = kora.parser_texte(page_synthetique(nb))
+        t0 = time.perf_counter(); fig = rendu_kora.generer_page_notes(notes, 2, "Benchmark", acc_config, styles, options, mode_white=True); t_figure = time.perf_counter() - t0
+        nb_artistes = len(fig.axes[0].get_children())
+        t0 = time.perf_counter(); rendu_kora.figure_vers_png(fig, dpi, 'white'); t_dessin = time.perf_counter() - t0
+        print(f"{nb:>8} {nb_artistes:>9} {t_figure * 1000:>12.0f} {t_dessin * 1000:>12.0f}")
+
+# ==============================================================================
+# 📈 SUITE JSON (une étape = un processus : temps, pic de mémoire et taille de sortie isolés)
+# ==============================================================================
+TAILLES_SUITE = (10, 100, 1000, 10000)
+BPM_SUITE = 100
+NOTES_MAX_ETAPES = {'image_longue': 1000, 'video': 1000} # Au-delà : plusieurs minutes et Go de RAM (voir --sans-limite)
+STYLES_BENCH = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
+OPTIONS_BENCH = {'use_bg': True, 'alpha': 0.2}
+
+def entrees_suite(tailles):
+    entrees = [(f"synthetique_{nb}", tablature_en_pages(nb)) for nb in tailles]
+    return entrees + [(f"banque/{titre}", texte.strip()) for titre, texte in kora.BANQUE_TABLATURES.items()]
+
+def octets_page(notes_page, idx, titre):
+    fig = rendu_kora.generer_page_notes(notes_page, idx, titre, config_acc_defaut(), STYLES_BENCH, OPTIONS_BENCH, mode_white=True)
+    return rendu_kora.figure_vers_png(fig, rendu_kora.DPI_PDF_OPTIMISE, 'white')
+
+# Chaque étape prépare ses entrées (hors chronomètre) et renvoie la fonction mesurée, qui renvoie ses infos de sortie
+def etape_parser(texte):
+    return lambda: {'elements': len(kora.parser_texte(texte))} # notes + marqueurs
+
+def etape_arrangement(texte):
+    lignes = texte.split("\n"); quart = max(1, len(lignes) // 4)
+    blocs = {f"B{i}": "\n".join(lignes[i * quart:(i + 1) * quart if i < 3 else None]) for i in range(4)}
+    return lambda: {'octets': len(kora.compiler_arrangement(" + ".join(blocs), blocs).encode('utf-8'))}
+
+def etape_audio(texte):
+    sequence = kora.parser_texte(texte)
+    return lambda: {'octets': kora.generer_audio_mix(sequence, BPM_SUITE, config_acc_defaut()).getbuffer().nbytes}
+
+def etape_pages(texte):
+    pages = kora.parser_texte(texte).pages()
+    return lambda: {'pages': len(pages), 'octets': sum(octets_page(page, idx + 2, "Benchmark").getbuffer().nbytes for idx, page in enumerate(pages))}
+
+def etape_pdf(texte):
+    pages = kora.parser_texte(texte).pages()
+    buffers = [{'buf': octets_page(page, idx + 2, "Benchmark")} for idx, page in enumerate(pages)]
+    return lambda: {'pages': len(buffers), 'octets': kora.generer_pdf_livret(buffers, "Benchmark").getbuffer().nbytes}
+
+def etape_image_longue(texte):
+    sequence = kora.parser_texte(texte)
+    return lambda: {'octets': rendu_kora.generer_image_longue_calibree(sequence, config_acc_defaut(), STYLES_BENCH)[0].getbuffer().nbytes}
+
+def etape_video(texte):
+    sequence = kora.parser_texte(texte); acc_config = config_acc_defaut()
+    audio = kora.generer_audio_mix(sequence, BPM_SUITE, acc_config, complet=True)
+    duree = (int(sequence.ticks[-1]) / 12) * (60 / BPM_SUITE) + 4
+    sortie = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    def executer():
+        try:
+            partition = rendu_kora.PartitionLongue(sequence, acc_config, STYLES_BENCH, dpi=90)
+            kora.creer_video_avec_son_calibree(partition, audio, duree, (partition.pixels_par_temps, partition.offset_premiere_note_px), BPM_SUITE, fps=kora.FPS_VIDEO, output_filename=sortie)
+            return {'octets': os.path.getsize(sortie), 'duree_video_s': round(duree, 1)}
+        finally: os.remove(sortie)
+    return executer
+
+ETAPES_SUITE = {'parser': etape_parser, 'arrangement': etape_arrangement, 'audio': etape_audio, 'pages': etape_pages,
+                'pdf': etape_pdf, 'image_longue': etape_image_longue, 'video': etape_video}
+
+def rss_pic_octets(qui):
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    if not HAS_RESOURCE: return None
+    return resource.getrusage(qui).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def executer_etape(etape, texte):
+    executer = ETAPES_SUITE[etape](texte)
+    t0 = time.perf_counter(); infos = executer(); duree = time.perf_counter() - t0
+    resultat = {'temps_s': round(duree, 4), **infos}
+    if HAS_RESOURCE:
+        resultat['rss_pic_mo'] = round(rss_pic_octets(resource.RUSAGE_SELF) / 1e6, 1)
+        enfants = rss_pic_octets(resource.RUSAGE_CHILDREN)
+        if enfants: resultat['rss_pic_enfants_mo'] = round(enfants / 1e6, 1) # ffmpeg, processus de rendu
+    return resultat
+
+def _processus_etape(conn, etape, texte):
+    try: conn.send(executer_etape(etape, texte))
+    except Exception as e: conn.send({'erreur': f"{type(e).__name__}: {e}"})
+    finally:
+        # Un processus forké attend ses enfants avant de sortir : les processus de rendu de l'étape sont arrêtés
+        kora.get_pool_rendu().shutdown(); conn.close()
+
+def mesurer_etape(etape, texte):
+    # Processus forké : le pic RSS est celui de l'étape (entrées comprises) et les caches partent à froid
+    if 'fork' not in multiprocessing.get_all_start_methods(): return executer_etape(etape, texte)
+    ctx = multiprocessing.get_context('fork')
+    lecture, ecriture = ctx.Pipe(duplex=False)
+    p = ctx.Process(target=_processus_etape, args=(ecriture, etape, texte)); p.start(); ecriture.close()
+    try: resultat = lecture.recv()
+    except EOFError: resultat = {'erreur': f"processus arrêté (code {p.exitcode})"}
+    p.join()
+    return resultat
+
+def etapes_disponibles():
+    manquants = {}
+    if not kora.HAS_PYDUB: manquants.update(audio="pydub absent", video="pydub absent")
+    if not kora.HAS_FFMPEG: manquants['video'] = "ffmpeg absent"
+    return manquants
+
+def suite_json(tailles=TAILLES_SUITE, etapes=tuple(ETAPES_SUITE), sans_limite=False):
+    manquants = etapes_disponibles(); resultats = []
+    # Hors Streamlit, chaque appel caché avertit (pas de ScriptRunContext) : seule la progression reste sur stderr
+    logging.disable(logging.WARNING); warnings.simplefilter('ignore')
+    for nom, texte in entrees_suite(tailles):
+        sequence = kora.parser_texte(texte); nb_notes = int(sequence.masque_cordes(kora.POSITIONS_X).sum()) # Sans les marqueurs (PAGE, TXT...)
+        if not nb_notes: continue
+        for etape in etapes:
+            ligne = {'entree': nom, 'notes': nb_notes, 'etape': etape}
+            if etape in manquants: ligne['ignoree'] = manquants[etape]
+            elif not sans_limite and nb_notes > NOTES_MAX_ETAPES.get(etape, nb_notes): ligne['ignoree'] = f"plus de {NOTES_MAX_ETAPES[etape]} notes"
+            else: ligne.update(mesurer_etape(etape, texte))
+            print(f"   {nom:<45} {etape:<13} {ligne.get('temps_s', '-')}", file=sys.stderr)
+            resultats.append(ligne)
+    return {'version': 1, 'date': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(), 'plateforme': platform.platform(),
+            'nb_cpu': os.cpu_count(), 'bpm': BPM_SUITE, 'resultats': resultats}
+
+# ==============================================================================
+# 🚦 COÛT DU DÉMARRAGE (python -X importtime dans un processus neuf)
+# ==============================================================================
+def rapport_imports(nb_essais=3):
+    # Imports directs de app_kora (profondeur 1 de -X importtime) et durée totale d'un import à froid
+    code = "import logging; logging.disable(logging.WARNING); import app_kora"
+    dossier = os.path.dirname(os.path.abspath(__file__)); essais = []; modules = {}
+    for _ in range(nb_essais):
+        t0 = time.perf_counter()
+        sortie = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=dossier, capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': dossier})
+        essais.append(time.perf_counter() - t0)
+        for ligne in sortie.stderr.splitlines():
+            if not ligne.startswith("import time:") or ligne.count("|") != 2: continue
+            _, cumul, nom = ligne.split("|")
+            profondeur = (len(nom) - len(nom.lstrip()) - 1) // 2 # 1 espace + 2 par niveau d'imbrication
+            if not cumul.strip().isdigit() or profondeur > 1 or (profondeur == 0 and nom.strip() != 'app_kora'): continue
+            nom = nom.strip(); modules[nom] = min(modules.get(nom, float('inf')), int(cumul) / 1000)
+    total = modules.pop('app_kora', None)
+    return {'processus_s': round(min(essais), 3), 'app_kora_ms': total, 'modules_ms': dict(sorted(modules.items(), key=lambda m: -m[1]))}
+
+def afficher_rapport_imports(rapport, nb_lignes=15):
+    print(f"🚦 Import à froid de app_kora : {rapport['app_kora_ms']:.0f} ms (processus complet {rapport['processus_s']:.2f} s)")
+    for nom, ms in list(rapport['modules_ms'].items())[:nb_lignes]: print(f"{nom:>40} {ms:>8.1f} ms")
+
+if __name__ == "__main__":
+    rendu_kora.principal_non_reimporte(globals()) # Processus de rendu : rendu_kora seul, pas ce script ni app_kora
+    parser = argparse.ArgumentParser(description="Benchmarks Ngonilélé hors Streamlit")
+    parser.add_argument('--json', action='store_true', help="suite complète au format JSON")
+    parser.add_argument('--sortie', help="fichier JSON (sinon sortie standard)")
+    parser.add_argument('--tailles', type=int, nargs='+', default=list(TAILLES_SUITE), help="nombres de notes des tablatures synthétiques")
+    parser.add_argument('--etapes', nargs='+', choices=list(ETAPES_SUITE), default=list(ETAPES_SUITE))
+    parser.add_argument('--sans-limite', action='store_true', help="lance aussi image_longue et video sur les grandes entrées")
+    parser.add_argument('--imports', action='store_true', help="coût d'import de app_kora par module (démarrage)")
+    args = parser.parse_args()
+    if args.imports:
+        rapport = rapport_imports()
+        if args.json: print(json.dumps(rapport, ensure_ascii=False, indent=2))
+        else: afficher_rapport_imports(rapport)
+        sys.exit(0)
+    if args.json:
+        rapport = json.dumps(suite_json(args.tailles, args.etapes, args.sans_limite), ensure_ascii=False, indent=2)
+        if args.sortie:
+            with open(args.sortie, "w", encoding="utf-8") as f: f.write(rapport)
+        else: print(rapport)
+        sys.exit(0)
+    if not kora.HAS_PYDUB: sys.exit("pydub est requis pour le benchmark audio.")
+    bench_mixage_audio()
+    bench_dessin_pages()
+    bench_pdf_livret()
@@ -0,0 +1,23 @@
+# ==============================================================================
+# 📦 CONSTRUCTION DU PACK PCM DES SAMPLES (étape hors-ligne)
+# Usage : python construire_pack_samples.py
+# Décode une fois tous les samples/*.mp3 et écrit samples/samples_pcm.pack,
+# que l'application mappe en mémoire au démarrage au lieu de lancer ffmpeg.
+# ==============================================================================
+import os
+import sys
+import logging
+
+# L'import exécute le script Streamlit en "bare mode" : on coupe les avertissements
+logging.disable(logging.WARNING)
+import app_kora as kora
+logging.disable(logging.NOTSET)
+
+if __name__ == "__main__":
+    if not kora.HAS_PYDUB: sys.exit("pydub (et ffmpeg) sont requis pour décoder les MP3.")
+    banque = kora.BanqueSamples(kora.DOSSIER_SAMPLES)
+    banque.prechauffer()
+    if not banque.pcm: sys.exit(f"Aucun MP3 trouvé dans {kora.DOSSIER_SAMPLES}/")
+    kora.ecrire_pack_samples(kora.CHEMIN_PACK_SAMPLES, banque.pcm)
+    taille_mo = os.path.getsize(kora.CHEMIN_PACK_SAMPLES) / 1e6
+    print(f"✅ {len(banque.pcm)} samples -> {kora.CHEMIN_PACK_SAMPLES} ({taille_mo:.1f} Mo)")
@@ -0,0 +1,591 @@
+# ==============================================================================
+# 🖨️ MOTEUR DE RENDU (pages du livret, partition déroulante)
+# Module ordinaire, importable sous un nom fixe : les processus de rendu l'importent directement
+# (jamais le script Streamlit) et les fonctions qu'on leur envoie se picklent par référence.
+# Pas de streamlit ici : les ressources sont mises en cache au niveau du module.
+# ==============================================================================
+import os
+import io
+import gc
+import time
+import json
+import hashlib
+import functools
+import threading
+import importlib.machinery
+import numpy as np
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.patches as patches
+import matplotlib.font_manager as fm
+import matplotlib.image as mpimg
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from matplotlib.collections import EllipseCollection, LineCollection
+from matplotlib.artist import Artist
+from matplotlib.transforms import Affine2D, Bbox
+from PIL import Image
+
+# --- CONSTANTES & RESOURCES ---
+CHEMIN_POLICE = 'ML.ttf'
+CHEMIN_IMAGE_FOND = 'texture_ngonilele.png'
+CHEMIN_ICON_POUCE = 'icon_pouce.png'
+CHEMIN_ICON_INDEX = 'icon_index.png'
+CHEMIN_ICON_POUCE_BLANC = 'icon_pouce_blanc.png'
+CHEMIN_ICON_INDEX_BLANC = 'icon_index_blanc.png'
+
+# --- COULEURS & LOGIQUE ---
+POSITIONS_X = {'1G': -1, '2G': -2, '3G': -3, '4G': -4, '5G': -5, '6G': -6, '1D': 1, '2D': 2, '3D': 3, '4D': 4, '5D': 5, '6D': 6}
+COULEURS_CORDES_REF = {'C': '#FF0000', 'D': '#FF8C00', 'E': '#FFD700', 'F': '#32CD32', 'G': '#00BFFF', 'A': '#00008B', 'B': '#9400D3'}
+TRADUCTION_NOTES = {'C':'do', 'D':'ré', 'E':'mi', 'F':'fa', 'G':'sol', 'A':'la', 'B':'si'}
+
+# Agg n'est pas sûr entre threads : hors des processus de rendu (repli), un seul rendu à la fois
+VERROU_RENDU_SUR_PLACE = threading.Lock()
+
+def principal_non_reimporte(espace):
+    # spawn/forkserver réexécute le script principal dans chaque nouveau processus (sous le nom __mp_main__),
+    # sauf si son spec s'appelle __main__ : les processus de rendu n'ont besoin que de ce module
+    if espace.get('__spec__') is None: espace['__spec__'] = importlib.machinery.ModuleSpec('__main__', None)
+
+# ==============================================================================
+# 🚀 FONCTIONS UTILES
+# ==============================================================================
+@functools.cache
+def load_font_properties():
+    if os.path.exists(CHEMIN_POLICE):
+        return fm.FontProperties(fname=CHEMIN_POLICE)
+    return fm.FontProperties(family='sans-serif')
+
+@functools.cache
+def load_image_asset(path):
+    if os.path.exists(path):
+        return mpimg.imread(path)
+    return None
+
+def get_color_for_note(note):
+    base_note = note[0].upper() 
+    return COULEURS_CORDES_REF.get(base_note, '#000000')
+
+def get_font_cached(size, weight='normal', style='normal'):
+    prop = load_font_properties().copy()
+    prop.set_size(size)
+    prop.set_weight(weight)
+    prop.set_style(style)
+    return prop
+
+# --- SÉQUENCE DE NOTES COLONNAIRE (tableau structuré NumPy) ---
+CORDES_SEQUENCE = tuple(POSITIONS_X) + ('SILENCE', 'SEPARATOR', 'TEXTE', 'PAGE_BREAK')
+DOIGTS_SEQUENCE = (None, 'P', 'I')
+CODES_DOIGTS = {d: i for i, d in enumerate(DOIGTS_SEQUENCE)}
+DTYPE_NOTES = np.dtype([('tick', '<i4'), ('duration', '<i2'), ('corde', 'u1'), ('doigt', 'u1')])
+
+class NoteSequence:
+    # 8 octets par note au lieu d'un dict. Les cordes sont codées sur uint8 via le vocabulaire
+    # self.cordes (CORDES_SEQUENCE + cordes inconnues tapées par l'utilisateur) et les messages
+    # TXT vivent dans une table à part (position dans self.notes -> texte).
+    # Indexer ou itérer renvoie les mêmes dicts que l'ancien parser_texte (vue de compatibilité).
+    def __init__(self, notes, cordes=CORDES_SEQUENCE, pos_messages=None, messages=()):
+        self.notes = notes
+        self.cordes = cordes
+        self.pos_messages = np.zeros(0, dtype=np.int64) if pos_messages is None else pos_messages
+        self.messages = tuple(messages)
+        self._empreinte = None
+
+    @classmethod
+    def depuis_tuples(cls, tuples):
+        # tuples (tick, duration, corde, doigt, message) dans l'ordre du texte ; tri stable par tick
+        cordes = list(CORDES_SEQUENCE); codes = {c: i for i, c in enumerate(cordes)}
+        codes_cordes = []
+        for t in tuples:
+            code = codes.get(t[2])
+            if code is None:
+                # Vocabulaire uint8 saturé : la corde inconnue est rangée avec les silences (ignorée au rendu)
+                if len(cordes) < 256: code = codes[t[2]] = len(cordes); cordes.append(t[2])
+                else: code = codes['SILENCE']
+            codes_cordes.append(code)
+        notes = np.empty(len(tuples), dtype=DTYPE_NOTES)
+        notes['tick'] = [t[0] for t in tuples]
+        notes['duration'] = [t[1] for t in tuples]
+        notes['corde'] = codes_cordes
+        notes['doigt'] = [CODES_DOIGTS.get(t[3], 0) for t in tuples]
+        ordre = np.argsort(notes['tick'], kind='stable')
+        rang = np.empty_like(ordre); rang[ordre] = np.arange(len(ordre))
+        pos_origine = [i for i, t in enumerate(tuples) if t[4] is not None]
+        pos_messages = rang[pos_origine] if pos_origine else np.zeros(0, dtype=np.int64)
+        tri_messages = np.argsort(pos_messages, kind='stable')
+        messages = [tuples[pos_origine[i]][4] for i in tri_messages]
+        return cls(notes[ordre], tuple(cordes), pos_messages[tri_messages], messages)
+
+    @classmethod
+    def depuis_liste(cls, data):
+        return cls.depuis_tuples([(n['tick'], n['duration'], n['corde'], n.get('doigt'), n.get('message') if n['corde'] == 'TEXTE' else None) for n in data])
+
+    # --- Colonnes ---
+    @property
+    def ticks(self): return self.notes['tick']
+    @property
+    def durees(self): return self.notes['duration']
+    @property
+    def codes_cordes(self): return self.notes['corde']
+
+    def noms_cordes(self):
+        return np.array(self.cordes, dtype=object)[self.notes['corde']]
+
+    def masque_cordes(self, noms):
+        codes = [i for i, c in enumerate(self.cordes) if c in noms]
+        return np.isin(self.notes['corde'], codes)
+
+    def code_corde(self, nom):
+        return self.cordes.index(nom) if nom in self.cordes else -1
+
+    # --- Découpage ---
+    def _tranche(self, debut, fin):
+        i, j = np.searchsorted(self.pos_messages, [debut, fin])
+        return NoteSequence(self.notes[debut:fin], self.cordes, self.pos_messages[i:j] - debut, self.messages[i:j])
+
+    def selection(self, indices):
+        indices = np.asarray(indices)
+        if indices.dtype == bool: indices = np.flatnonzero(indices)
+        msgs = dict(zip(self.pos_messages.tolist(), self.messages))
+        gardes = [(j, msgs[i]) for j, i in enumerate(indices.tolist()) if i in msgs]
+        return NoteSequence(self.notes[indices], self.cordes, np.array([j for j, _ in gardes], dtype=np.int64), [m for _, m in gardes])
+
+    def pages(self):
+        # Découpe aux PAGE_BREAK (exclus), pages vides ignorées ; chaque page est une vue sans copie
+        coupures = np.flatnonzero(self.notes['corde'] == self.code_corde('PAGE_BREAK'))
+        debuts = np.concatenate(([0], coupures + 1)); fins = np.concatenate((coupures, [len(self.notes)]))
+        return [self._tranche(int(a), int(b)) for a, b in zip(debuts, fins) if b > a]
+
+    # --- Vue de compatibilité (dicts) ---
+    def vers_liste(self):
+        noms = self.cordes; msgs = dict(zip(self.pos_messages.tolist(), self.messages))
+        data = []
+        for i, (tick, duration, corde, doigt) in enumerate(self.notes.tolist()):
+            note = {'tick': tick, 'duration': duration, 'corde': noms[corde]}
+            if noms[corde] == 'TEXTE': note['message'] = msgs.get(i, "")
+            elif doigt: note['doigt'] = DOIGTS_SEQUENCE[doigt]
+            data.append(note)
+        return data
+
+    def __len__(self): return len(self.notes)
+    def __iter__(self): return iter(self.vers_liste())
+
+    def __getitem__(self, cle):
+        if isinstance(cle, slice):
+            debut, fin, pas = cle.indices(len(self.notes))
+            if pas == 1: return self._tranche(debut, max(debut, fin))
+            return self.selection(np.arange(debut, fin, pas))
+        i = range(len(self.notes))[cle]
+        tick, duration, corde, doigt = self.notes[i].tolist()
+        note = {'tick': tick, 'duration': duration, 'corde': self.cordes[corde]}
+        if note['corde'] == 'TEXTE':
+            k = np.searchsorted(self.pos_messages, i)
+            note['message'] = self.messages[k] if k < len(self.messages) and self.pos_messages[k] == i else ""
+        elif doigt: note['doigt'] = DOIGTS_SEQUENCE[doigt]
+        return note
+
+    # --- Empreinte (clé de cache bon marché) ---
+    def empreinte(self):
+        if self._empreinte is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(np.ascontiguousarray(self.notes).tobytes())
+            h.update(json.dumps([self.cordes, self.pos_messages.tolist(), self.messages]).encode('utf-8'))
+            self._empreinte = h.hexdigest()
+        return self._empreinte
+
+    # --- Transport vers les processus de rendu (données simples, sans référence à la classe) ---
+    def etat(self):
+        return self.notes, self.cordes, self.pos_messages, self.messages
+
+    def __eq__(self, autre):
+        if isinstance(autre, list): return self.vers_liste() == autre
+        if hasattr(autre, 'empreinte'): return self.empreinte() == autre.empreinte()
+        return NotImplemented
+
+    def __hash__(self): return hash(self.empreinte())
+
+    def __repr__(self): return f"NoteSequence({len(self.notes)} notes, {len(self.messages)} messages)"
+
+def en_note_sequence(sequence):
+    return NoteSequence.depuis_liste(sequence) if isinstance(sequence, list) else sequence
+
+# ==============================================================================
+# 🎨 MOTEUR AFFICHAGE
+# ==============================================================================
+# --- DESSIN GROUPÉ (une collection par type d'élément au lieu d'un artiste par note) ---
+ZOOM_ICONES = 0.045
+DPI_CALQUE_ICONES = 150 # Résolution du calque d'icônes dans les sorties vectorielles (celle du PDF image)
+
+def dessiner_perles(ax, xs, ys, couleurs, c_perle, rayon=0.30):
+    # Perles en unités de données (comme patches.Circle) : un fond plein puis un anneau coloré
+    if not xs: return
+    positions = np.column_stack([xs, ys]); diametre = 2 * rayon
+    ax.add_collection(EllipseCollection(diametre, diametre, 0, units='xy', offsets=positions, offset_transform=ax.transData, facecolors=c_perle, edgecolors=c_perle, linewidths=1, zorder=3))
+    ax.add_collection(EllipseCollection(diametre, diametre, 0, units='xy', offsets=positions, offset_transform=ax.transData, facecolors='none', edgecolors=couleurs, linewidths=3, zorder=4))
+
+def dessiner_segments(ax, segments, couleur, largeurs, zorder, alpha=None):
+    if segments: ax.add_collection(LineCollection(segments, colors=couleur, linewidths=largeurs, zorder=zorder, alpha=alpha, capstyle='projecting'))
+
+@functools.cache
+def icone_calque(chemin, dpi):
+    # Icône RGBA uint8 à la taille qu'aurait OffsetImage(zoom=ZOOM_ICONES) à cette résolution
+    img = load_image_asset(chemin)
+    if img is None: return None
+    h, w = img.shape[:2]; taille = (max(1, round(w * ZOOM_ICONES * dpi / 72)), max(1, round(h * ZOOM_ICONES * dpi / 72)))
+    return np.asarray(Image.fromarray((img * 255).round().astype(np.uint8)).resize(taille, Image.LANCZOS))
+
+class CalqueIcones(Artist):
+    # Icônes de doigté composées en une seule image RGBA à la résolution du rendu, envoyée en un seul draw_image :
+    # pixel pour pixel en Agg (aucun rééchantillonnage), image à DPI_CALQUE_ICONES mise à l'échelle en PDF/SVG
+    def __init__(self, poses, zorder=8):
+        # poses = (chemin de l'icône, x, y du centre en unités de données)
+        super().__init__(); self.poses = poses; self.set_zorder(zorder)
+
+    def geometrie(self, renderer):
+        dpi = DPI_CALQUE_ICONES if renderer.option_scale_image() else renderer.dpi
+        unites_par_px = renderer.points_to_pixels(72) / dpi
+        centres = self.axes.transData.transform([(x, y) for _, x, y in self.poses]) / unites_par_px
+        icones = [(icone_calque(chemin, dpi), cx, cy) for (chemin, _, _), (cx, cy) in zip(self.poses, centres)]
+        return dpi, unites_par_px, [(img, int(round(cx - img.shape[1] / 2)), int(round(cy - img.shape[0] / 2))) for img, cx, cy in icones if img is not None]
+
+    def get_window_extent(self, renderer=None):
+        if renderer is None: renderer = self.figure._get_renderer()
+        _, unites_par_px, icones = self.geometrie(renderer) if self.poses else (None, 1, [])
+        if not icones: return Bbox.null()
+        return Bbox([[min(g for _, g, _ in icones) * unites_par_px, min(b for _, _, b in icones) * unites_par_px],
+                     [max(g + img.shape[1] for img, g, _ in icones) * unites_par_px, max(b + img.shape[0] for img, _, b in icones) * unites_par_px]])
+
+    def draw(self, renderer):
+        if not self.get_visible() or not self.poses: return
+        dpi, unites_par_px, icones = self.geometrie(renderer)
+        if not icones: return
+        gauche = min(g for _, g, _ in icones); bas = min(b for _, _, b in icones)
+        droite = max(g + img.shape[1] for img, g, _ in icones); haut = max(b + img.shape[0] for img, _, b in icones)
+        calque = np.zeros((haut - bas, droite - gauche, 4), dtype=np.uint8)
+        for img, g, b in icones:
+            l = haut - (b + img.shape[0]); c = g - gauche
+            zone = calque[l:l + img.shape[0], c:c + img.shape[1]]
+            if not zone[..., 3].any(): zone[:] = img; continue
+            # Chevauchement : composition « over » en alpha non prémultiplié
+            sa = img[..., 3:] / 255.0; da = zone[..., 3:] / 255.0; oa = sa + da * (1 - sa)
+            zone[..., :3] = np.round((img[..., :3] * sa + zone[..., :3] * da * (1 - sa)) / np.maximum(oa, 1e-6)); zone[..., 3:] = np.round(oa * 255)
+        gc = renderer.new_gc(); self._set_gc_clip(gc)
+        if renderer.option_scale_image(): renderer.draw_image(gc, gauche * unites_par_px, bas * unites_par_px, calque, Affine2D().scale(calque.shape[1] * unites_par_px, calque.shape[0] * unites_par_px))
+        else: renderer.draw_image(gc, gauche, bas, calque)
+        gc.restore()
+        self.stale = False
+
+def dessiner_contenu_legende(ax, y_pos, styles, mode_white=False):
+    c_txt = styles['TEXTE']; c_fond = styles['LEGENDE_FOND']
+    prop_annotation = get_font_cached(16, 'bold'); prop_legende = get_font_cached(12, 'bold')
+    img_pouce = load_image_asset(CHEMIN_ICON_POUCE_BLANC if mode_white else CHEMIN_ICON_POUCE)
+    img_index = load_image_asset(CHEMIN_ICON_INDEX_BLANC if mode_white else CHEMIN_ICON_INDEX)
+
+    rect = patches.FancyBboxPatch((-7.5, y_pos - 3.6), 15, 3.3, boxstyle="round,pad=0.1", linewidth=1.5, edgecolor=c_txt, facecolor=c_fond, zorder=0); ax.add_patch(rect)
+    ax.text(0, y_pos - 0.6, "LÉGENDE", ha='center', va='center', fontsize=14, fontweight='bold', color=c_txt, fontproperties=prop_annotation)
+    x_icon_center = -5.5; x_text_align = -4.5; y_row1 = y_pos - 1.2; y_row2 = y_pos - 1.8; y_row3 = y_pos - 2.4; y_row4 = y_pos - 3.0
+    
+    if img_pouce is not None: ab = AnnotationBbox(OffsetImage(img_pouce, zoom=0.045), (x_icon_center, y_row1), frameon=False); ax.add_artist(ab)
+    ax.text(x_text_align, y_row1, "= Pouce", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
+    
+    if img_index is not None: ab = AnnotationBbox(OffsetImage(img_index, zoom=0.045), (x_icon_center, y_row2), frameon=False); ax.add_artist(ab)
+    ax.text(x_text_align, y_row2, "= Index", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
+    
+    ax.text(0, y_row3, "RYTHMES :  + = Noire  |  ♪ = Croche  |  🎶 = Triolet  |  ♬ = Double", ha='center', va='center', fontsize=12, fontweight='bold', color=c_txt)
+
+    x_droite = 1.5; y_text_top = y_pos - 1.2; line_height = 0.45
+    ax.plot([x_droite + 0.5, 6.0], [y_text_top + 0.2, y_text_top + 0.2], color='black', lw=2)
+    ax.text(x_droite + 0.2, y_text_top + 0.2, "G", ha='right', va='center', fontsize=14, fontweight='bold', color=c_txt)
+    ax.text(6.3, y_text_top + 0.2, "D", ha='left', va='center', fontsize=14, fontweight='bold', color=c_txt)
+    ax.text(x_droite, y_text_top - line_height, "1G = 1ère corde à gauche", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
+    ax.text(x_droite, y_text_top - line_height*2, "2G = 2ème corde à gauche", ha='left', va='center', fontproperties=prop_legende, color=c_txt)
+
+def generer_page_1_legende(titre, styles, mode_white=False):
+    c_fond = styles['FOND']; c_txt = styles['TEXTE']; prop_titre = get_font_cached(32, 'bold')
+    fig = Figure(figsize=(16, 8), facecolor=c_fond)
+    ax = fig.subplots()
+    ax.set_facecolor(c_fond)
+    ax.text(0, 2.5, titre, ha='center', va='bottom', fontproperties=prop_titre, color=c_txt)
+    dessiner_contenu_legende(ax, 0.5, styles, mode_white)
+    ax.set_xlim(-7.5, 7.5); ax.set_ylim(-6, 4); ax.axis('off')
+    return fig
+
+def generer_page_notes(notes_page, idx, titre, config_acc, styles, options_visuelles, mode_white=False):
+    c_fond = styles['FOND']; c_txt = styles['TEXTE']; c_perle = styles['PERLE_FOND']
+    chemin_pouce = CHEMIN_ICON_POUCE_BLANC if mode_white else CHEMIN_ICON_POUCE; img_pouce = load_image_asset(chemin_pouce)
+    chemin_index = CHEMIN_ICON_INDEX_BLANC if mode_white else CHEMIN_ICON_INDEX; img_index = load_image_asset(chemin_index)
+    
+    tick_min = notes_page[0]['tick']
+    tick_max = notes_page[-1]['tick'] + 12 
+    hauteur_unites = (tick_max - tick_min) / 12.0
+    hauteur_fig = max(6, (hauteur_unites * 0.75) + 6)
+    
+    fig = Figure(figsize=(16, hauteur_fig), facecolor=c_fond)
+    ax = fig.subplots()
+    ax.set_facecolor(c_fond)
+    
+    y_top = 2.5; y_bot = - hauteur_unites - 1.5; y_top_cordes = y_top
+    prop_titre = get_font_cached(32, 'bold'); prop_texte = get_font_cached(20, 'bold')
+    prop_note_us = get_font_cached(24, 'bold'); prop_note_eu = get_font_cached(18, 'normal', 'italic')
+    prop_numero = get_font_cached(14, 'bold'); prop_standard = get_font_cached(14, 'bold')
+    prop_annotation = get_font_cached(16, 'bold')
+    
+    if not mode_white and options_visuelles['use_bg']:
+        img_fond = load_image_asset(CHEMIN_IMAGE_FOND)
+        if img_fond is not None:
+            try:
+                h_px, w_px = img_fond.shape[:2]; ratio = w_px / h_px
+                largeur_finale = 15.0 * 0.7; hauteur_finale = (largeur_finale / ratio) * 1.4
+                y_center = (y_top + y_bot) / 2
+                extent = [-largeur_finale/2, largeur_finale/2, y_center - hauteur_finale/2, y_center + hauteur_finale/2]
+                ax.imshow(img_fond, extent=extent, aspect='auto', zorder=-1, alpha=options_visuelles['alpha'])
+            except: pass
+            
+    ax.text(0, y_top + 3.0, f"{titre} (Page {idx})", ha='center', va='bottom', fontproperties=prop_titre, color=c_txt)
+    ax.text(-3.5, y_top_cordes + 2.0, "Cordes de Gauche", ha='center', va='bottom', fontproperties=prop_texte, color=c_txt)
+    ax.text(3.5, y_top_cordes + 2.0, "Cordes de Droite", ha='center', va='bottom', fontproperties=prop_texte, color=c_txt)
+    ax.vlines(0, y_bot, y_top_cordes + 1.8, color=c_txt, lw=5, zorder=2)
+    
+    for code, props in config_acc.items():
+        x = props['x']; note = props['n']; 
+        c = get_color_for_note(note)
+        ax.text(x, y_top_cordes + 1.3, code, ha='center', color='gray', fontproperties=prop_numero)
+        ax.text(x, y_top_cordes + 0.7, note, ha='center', color=c, fontproperties=prop_note_us)
+        ax.text(x, y_top_cordes + 0.1, TRADUCTION_NOTES.get(note[0].upper(), '?'), ha='center', color=c, fontproperties=prop_note_eu)
+        ax.vlines(x, y_bot, y_top_cordes, colors=c, lw=3, zorder=1)
+    
+    start_beat_tick = (tick_min // 12) * 12
+    ys_temps = [- ((t - tick_min) / 12.0) for t in range(start_beat_tick, tick_max + 12, 12)]
+    ax.hlines(ys_temps, -7.5, 7.5, color='#666666', linestyle='-', linewidth=1, alpha=0.7, zorder=0.5)
+
+    map_labels = {}; last_sep_tick = tick_min - 12
+    processed_t = set()
+    for n in notes_page:
+        t = n['tick']
+        if n['corde'] in ['SEPARATOR', 'TEXTE']: last_sep_tick = t
+        elif t % 12 == 0 and t not in processed_t:
+            num_temps = (t - last_sep_tick) // 12
+            if num_temps > 0: map_labels[t] = str(num_temps)
+            processed_t.add(t)
+            
+    notes_par_tick = {}; rayon = 0.30
+    perles_x = []; perles_y = []; perles_c = []; icones = []
+    for n in notes_page:
+        tick_absolu = n['tick']
+        y = - ((tick_absolu - tick_min) / 12.0)
+        if y not in notes_par_tick: notes_par_tick[y] = []
+        notes_par_tick[y].append(n); code = n['corde']
+        
+        if code == 'TEXTE': 
+            bbox = dict(boxstyle="round,pad=0.5", fc=c_perle, ec=c_txt, lw=2)
+            ax.text(0, y, n.get('message',''), ha='center', va='center', color='black', fontproperties=prop_annotation, bbox=bbox, zorder=10)
+        elif code == 'SEPARATOR': 
+            ax.axhline(y, color=c_txt, lw=3, zorder=4)
+        elif code in config_acc:
+            props = config_acc[code]; x = props['x']; c = get_color_for_note(props['n'])
+            perles_x.append(x); perles_y.append(y); perles_c.append(c)
+            label = map_labels.get(tick_absolu, "")
+            if label: ax.text(x, y, label, ha='center', va='center', color='black', fontproperties=prop_standard, zorder=6)
+            if 'doigt' in n:
+                doigt = n['doigt']; current_img = img_index if doigt == 'I' else img_pouce
+                if current_img is not None: icones.append((chemin_index if doigt == 'I' else chemin_pouce, x - 0.70, y + 0.1))
+                else: ax.text(x - 0.70, y, doigt, ha='center', va='center', color=c_txt, fontproperties=prop_standard, zorder=7)
+    dessiner_perles(ax, perles_x, perles_y, perles_c, c_perle, rayon)
+    
+    accords = []
+    for y, group in notes_par_tick.items():
+        xs = [config_acc[n['corde']]['x'] for n in group if n['corde'] in config_acc]
+        if len(xs) > 1: accords.append([(min(xs), y), (max(xs), y)])
+    dessiner_segments(ax, accords, c_txt, 2, zorder=2)
+
+    liens = []; largeurs_liens = []
+    sorted_notes = sorted([n for n in notes_page if n['corde'] in config_acc], key=lambda x: x['tick'])
+    for i in range(len(sorted_notes) - 1):
+        n1 = sorted_notes[i]; n2 = sorted_notes[i+1]
+        if n1['duration'] < 12 and n2['duration'] < 12:
+            beat1 = n1['tick'] // 12; beat2 = n2['tick'] // 12
+            if beat1 == beat2:
+                y1 = - ((n1['tick'] - tick_min) / 12.0); y2 = - ((n2['tick'] - tick_min) / 12.0)
+                lw_link = 3 if n1['duration'] <= 4 else 1.5
+                xs_liens = [-0.2, -0.3] if n1['duration'] == 3 else [-0.2]
+                for x_lien in xs_liens: liens.append([(x_lien, y1), (x_lien, y2)]); largeurs_liens.append(lw_link)
+    dessiner_segments(ax, liens, '#A67C52', largeurs_liens, zorder=2, alpha=0.7)
+            
+    ax.add_artist(CalqueIcones(icones))
+    ax.set_xlim(-7.5, 7.5); ax.set_ylim(y_bot, y_top + 5); ax.axis('off')
+    return fig
+
+# --- PARTITION DÉROULANTE EN TUILES (mémoire bornée quelle que soit la longueur du morceau) ---
+HAUTEUR_TUILE_PX = 1024
+POUCES_PAR_TEMPS = 0.8 * 0.77 # Échelle de l'ancienne figure unique : 0.8 po par temps, axes sur 77 % de la hauteur
+Y_HAUT_PARTITION = 4.0 # Laisse la place aux trois lignes d'en-tête au-dessus des cordes
+MARGE_TUILE = 1.0 # Notes dessinées un peu au-delà de la tuile : perles et bulles coupées au raccord
+
+def ticks_fenetre(t_min, y_bas, y_haut):
+    # Intervalle de ticks des notes qui touchent la fenêtre [y_bas, y_haut], marge comprise
+    return t_min - 12 * (y_haut + MARGE_TUILE), t_min - 12 * (y_bas - MARGE_TUILE)
+
+def dessiner_partition_longue(ax, sequence, config_acc, styles, t_min, t_max, y_bas, y_haut, y_bot):
+    c_fond = styles['FOND']; c_txt = styles['TEXTE']; c_perle = styles['PERLE_FOND']
+    y_top = 2.0
+    prop_note_us = get_font_cached(24, 'bold'); prop_note_eu = get_font_cached(18, 'normal', 'italic'); prop_numero = get_font_cached(14, 'bold'); prop_standard = get_font_cached(14, 'bold'); prop_annotation = get_font_cached(16, 'bold')
+    chemin_pouce = CHEMIN_ICON_POUCE_BLANC if c_fond == 'white' else CHEMIN_ICON_POUCE; img_pouce = load_image_asset(chemin_pouce)
+    chemin_index = CHEMIN_ICON_INDEX_BLANC if c_fond == 'white' else CHEMIN_ICON_INDEX; img_index = load_image_asset(chemin_index)
+
+    ax.vlines(0, y_bot, y_top + 1.8, color=c_txt, lw=5, zorder=2)
+    for code, props in config_acc.items():
+        x = props['x']; note = props['n']; c = get_color_for_note(note)
+        if y_haut > y_top - MARGE_TUILE: ax.text(x, y_top + 1.3, code, ha='center', color='gray', fontproperties=prop_numero); ax.text(x, y_top + 0.7, note, ha='center', color=c, fontproperties=prop_note_us); ax.text(x, y_top + 0.1, TRADUCTION_NOTES.get(note[0].upper(), '?'), ha='center', color=c, fontproperties=prop_note_eu)
+        ax.vlines(x, y_bot, y_top, colors=c, lw=3, zorder=1)
+
+    # Seuls les temps et les notes qui touchent la fenêtre [y_bas, y_haut] sont dessinés
+    tick_debut, tick_fin = ticks_fenetre(t_min, y_bas, y_haut)
+    start_beat = max((t_min // 12) * 12, int(tick_debut // 12) * 12)
+    ys_temps = [- ((t - t_min) / 12.0) for t in range(start_beat, min(t_max + 12, int(tick_fin) + 12), 12)]
+    if ys_temps: ax.hlines(ys_temps, -7.5, 7.5, color='#666666', linestyle='-', linewidth=1, alpha=0.7, zorder=0.5)
+
+    i, j = np.searchsorted(sequence.ticks, [tick_debut, tick_fin], side='left')
+    notes_par_tick = {}; rayon = 0.30
+    perles_x = []; perles_y = []; perles_c = []; icones = []
+    for n in sequence[int(i):int(j)]:
+        if n['corde'] == 'PAGE_BREAK': continue
+        t_absolu = n['tick']; y = - ((t_absolu - t_min) / 12.0)
+        if y not in notes_par_tick: notes_par_tick[y] = []
+        notes_par_tick[y].append(n); code = n['corde']
+
+        if code == 'TEXTE': bbox = dict(boxstyle="round,pad=0.5", fc=c_perle, ec=c_txt, lw=2); ax.text(0, y, n.get('message',''), ha='center', va='center', color='black', fontproperties=prop_annotation, bbox=bbox, zorder=10)
+        elif code == 'SEPARATOR': ax.axhline(y, color=c_txt, lw=3, zorder=4)
+        elif code in config_acc:
+            props = config_acc[code]; x = props['x']; c = get_color_for_note(props['n'])
+            perles_x.append(x); perles_y.append(y); perles_c.append(c)
+            if 'doigt' in n:
+                doigt = n['doigt']; current_img = img_index if doigt == 'I' else img_pouce
+                if current_img is not None: icones.append((chemin_index if doigt == 'I' else chemin_pouce, x - 0.70, y + 0.1))
+                else: ax.text(x - 0.70, y, doigt, ha='center', va='center', color=c_txt, fontproperties=prop_standard, zorder=7)
+    dessiner_perles(ax, perles_x, perles_y, perles_c, c_perle, rayon)
+    accords = []
+    for y, group in notes_par_tick.items():
+        xs = [config_acc[n['corde']]['x'] for n in group if n['corde'] in config_acc];
+        if len(xs) > 1: accords.append([(min(xs), y), (max(xs), y)])
+    dessiner_segments(ax, accords, c_txt, 2, zorder=2)
+    ax.add_artist(CalqueIcones(icones))
+
+class PartitionLongue:
+    # Partition déroulante découpée en tuiles de HAUTEUR_TUILE_PX lignes qui partagent le même calibrage :
+    # chaque tuile est une figure dont les axes couvrent toute la hauteur, sur une fenêtre exacte de l'axe Y
+    # bornes = (t_min, t_max) de la partition entière quand sequence n'en est qu'un extrait (voir extrait)
+    def __init__(self, sequence, config_acc, styles, dpi=72, hauteur_tuile=HAUTEUR_TUILE_PX, bornes=None):
+        self.sequence = en_note_sequence(sequence); self.config_acc = config_acc; self.styles = styles
+        self.dpi = dpi; self.hauteur_tuile = hauteur_tuile
+        self.t_min, self.t_max = bornes if bornes is not None else (int(self.sequence.ticks[0]), int(self.sequence.ticks[-1]))
+        self.y_min_footer = - (self.t_max - self.t_min) / 12.0 - 2.0
+        self.pixels_par_temps = POUCES_PAR_TEMPS * dpi
+        self.offset_premiere_note_px = Y_HAUT_PARTITION * self.pixels_par_temps
+        self.hauteur = int(round((Y_HAUT_PARTITION - self.y_min_footer) * self.pixels_par_temps))
+        self.largeur = int(16 * dpi)
+        self.nb_tuiles = -(-self.hauteur // hauteur_tuile)
+        self.tuiles_rendues = 0; self.duree_tuiles_ms = 0.0
+
+    def fenetre(self, k):
+        # (hauteur en pixels, hauteur de la figure, y_bas, y_haut) de la tuile k
+        debut = k * self.hauteur_tuile; h_px = min(self.hauteur_tuile, self.hauteur - debut)
+        h_fig = h_px + 0.01 # Évite que h * dpi tombe à h_px - 1 par arrondi flottant
+        y_haut = Y_HAUT_PARTITION - debut / self.pixels_par_temps
+        return h_px, h_fig, y_haut - h_fig / self.pixels_par_temps, y_haut
+
+    def extrait(self, k):
+        # Seules notes que la tuile k dessine : une tuile rendue ailleurs n'a besoin que d'elles (et des bornes)
+        _, _, y_bas, y_haut = self.fenetre(k)
+        i, j = np.searchsorted(self.sequence.ticks, ticks_fenetre(self.t_min, y_bas, y_haut), side='left')
+        return self.sequence[int(i):int(j)]
+
+    def tuile(self, k):
+        t0 = time.perf_counter()
+        h_px, h_fig, y_bas, y_haut = self.fenetre(k)
+        c_fond = self.styles['FOND']
+        fig = Figure(figsize=(self.largeur / self.dpi, h_fig / self.dpi), dpi=self.dpi, facecolor=c_fond)
+        ax = fig.add_axes([0.125, 0, 0.775, 1]); ax.set_facecolor(c_fond)
+        ax.set_ylim(y_bas, y_haut); ax.set_xlim(-7.5, 7.5)
+        dessiner_partition_longue(ax, self.sequence, self.config_acc, self.styles, self.t_min, self.t_max, y_bas, y_haut, self.y_min_footer + 1.0)
+        ax.axis('off')
+        canvas = FigureCanvasAgg(fig); canvas.draw()
+        tuile = np.array(np.asarray(canvas.buffer_rgba())[:h_px, :self.largeur, :3])
+        # La figure est pleine de cycles (artistes <-> axes) : sans collecte, les tuiles rendues s'empilent en mémoire
+        del fig, ax, canvas; gc.collect()
+        self.tuiles_rendues += 1; self.duree_tuiles_ms += (time.perf_counter() - t0) * 1000
+        return tuile
+
+    def tuiles(self):
+        for k in range(self.nb_tuiles): yield self.tuile(k)
+
+def generer_image_longue_calibree(sequence, config_acc, styles, dpi=72):
+    # Image complète (assemblage des tuiles) : à réserver aux morceaux courts, la vidéo lit les tuiles une à une
+    if not sequence: return None, 0, 0
+    partition = PartitionLongue(sequence, config_acc, styles, dpi=dpi)
+    buf = io.BytesIO(); Image.fromarray(np.concatenate(list(partition.tuiles()))).save(buf, format='png')
+    buf.seek(0)
+    return buf, partition.pixels_par_temps, partition.offset_premiere_note_px
+
+# ==============================================================================
+# 🖨️ POINTS D'ENTRÉE DES PROCESSUS DE RENDU
+# ==============================================================================
+DPI_PDF_OPTIMISE = 150
+DPI_ECRAN = 100
+
+def rendre_tuile_video(tache):
+    # tache = (extrait(k) en données simples, (t_min, t_max), config_acc, styles, dpi, hauteur de tuile, k) ;
+    # renvoie (tuile RVB, durée en ms)
+    etat_notes, bornes, config_acc, styles, dpi, hauteur_tuile, k = tache
+    partition = PartitionLongue(NoteSequence(*etat_notes), config_acc, styles, dpi=dpi, hauteur_tuile=hauteur_tuile, bornes=bornes)
+    tuile = partition.tuile(k)
+    return tuile, partition.duree_tuiles_ms
+
+def figure_vers_png(fig, dpi, facecolor):
+    buf = io.BytesIO(); fig.savefig(buf, format="png", dpi=dpi, facecolor=facecolor, bbox_inches='tight'); buf.seek(0)
+    return buf
+
+def figure_vers_pdf(fig, facecolor):
+    buf = io.BytesIO(); fig.savefig(buf, format="pdf", facecolor=facecolor, bbox_inches='tight'); buf.seek(0)
+    return buf
+
+def styles_impression(ctx):
+    # (styles, mode_white) de la version imprimée
+    if ctx['force_white_print']: return ctx['styles_print'], True
+    return ctx['styles_ecran'], False
+
+def variantes_page(ctx):
+    # (champ de l'item, styles, mode_white, dpi) des rendus produits pour chaque page ;
+    # en mode vectoriel, l'impression est un PDF d'une page (dpi None) au lieu d'une image
+    impression = ('pdf', *styles_impression(ctx), None) if ctx.get('vectoriel') else ('buf', *styles_impression(ctx), DPI_PDF_OPTIMISE)
+    return [impression, ('img_ecran', ctx['styles_ecran'], False, DPI_ECRAN)]
+
+def figure_page_livret(tache, styles, mode_white):
+    type_page, idx, notes_page, ctx = tache
+    if type_page == 'legende': return generer_page_1_legende(ctx['titre'], styles, mode_white=mode_white)
+    return generer_page_notes(notes_page, idx, ctx['titre'], ctx['config_acc'], styles, ctx['options_visuelles'], mode_white=mode_white)
+
+def emballer_tache(tache):
+    # Les processus de rendu reçoivent les notes de la page en données simples (tableaux NumPy, tuples)
+    type_page, idx, notes_page, ctx = tache
+    return type_page, idx, None if notes_page is None else notes_page.etat(), ctx
+
+def deballer_tache(tache):
+    type_page, idx, etat_notes, ctx = tache
+    return type_page, idx, None if etat_notes is None else NoteSequence(*etat_notes), ctx
+
+def rendre_page_livret(tache):
+    # tache = emballer_tache((type, idx, notes de la page, contexte commun)) ; renvoie {champ: octets PNG}
+    # (+ 'mesures' si le contexte le demande : les processus de rendu ne voient pas l'exécution mesurée)
+    tache = deballer_tache(tache); type_page, idx, notes_page, ctx = tache
+    images = {}; figures = {}; durees = {'figure_ms': 0.0, 'savefig_ms': 0.0}
+    for champ, styles, mode_white, dpi in variantes_page(ctx):
+        cle_fig = (json.dumps(styles, sort_keys=True), mode_white)
+        t0 = time.perf_counter()
+        if cle_fig not in figures: figures[cle_fig] = figure_page_livret(tache, styles, mode_white)
+        t1 = time.perf_counter()
+        images[champ] = (figure_vers_pdf(figures[cle_fig], styles['FOND']) if dpi is None else figure_vers_png(figures[cle_fig], dpi, styles['FOND'])).getvalue()
+        durees['figure_ms'] += (t1 - t0) * 1000; durees['savefig_ms'] += (time.perf_counter() - t1) * 1000
+    if ctx.get('mesurer'): images['mesures'] = {'type': type_page, 'idx': idx, 'notes': len(notes_page) if notes_page is not None else 0, 'octets': sum(len(v) for v in images.values()), **{k: round(v, 2) for k, v in durees.items()}}
+    return images
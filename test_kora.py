@@ -0,0 +1,378 @@
+import base64
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+import pytest
+
+logging.disable(logging.WARNING)
+import app_kora as kora  # noqa: E402 (le script Streamlit s'exécute en mode "bare" à l'import)
+
+MORCEAUX = [titre for titre, code in kora.BANQUE_TABLATURES.items() if code.strip()]
+
+# ==============================================================================
+# 🔗 LIENS DE PARTAGE
+# ==============================================================================
+CAS_LIEN = [
+    "+ 4G\n= 1D P\n♪ 2G I x3\n+ S\n+ TXT Refrain  à deux\n+ SEP\n+ PAGE\nligne libre 😀\n\n🎶   6D   P",
+    "",
+    "+ TXT",
+]
+
+def jeton_brut(corps, version=kora.VERSION_LIEN):
+    return base64.urlsafe_b64encode(bytes([version]) + zlib.compress(bytes(corps))).decode('ascii').rstrip('=')
+
+@pytest.mark.parametrize("titre", MORCEAUX)
+def test_lien_aller_retour_banque(titre):
+    code = kora.BANQUE_TABLATURES[titre].strip()
+    partage = kora.decoder_lien(kora.encoder_lien(code))
+    assert list(kora.parser_texte(partage['code'])) == list(kora.parser_texte(code))
+    assert partage['accordage'] is None and partage['blocs'] is None
+
+@pytest.mark.parametrize("code", CAS_LIEN)
+def test_lien_aller_retour_cas_limites(code):
+    accordage = dict(kora.DEF_ACC); accordage['1D'] = "F3"
+    blocs = {"Refrain": "+ 4G\n= 1D", "Vide": ""}
+    partage = kora.decoder_lien(kora.encoder_lien(code, accordage, blocs))
+    assert list(kora.parser_texte(partage['code'])) == list(kora.parser_texte(code))
+    assert partage['accordage'] == accordage
+    assert {nom: list(kora.parser_texte(c)) for nom, c in partage['blocs'].items()} == {nom: list(kora.parser_texte(c)) for nom, c in blocs.items()}
+
+JETONS_CORROMPUS = [
+    "", "=", "!!!!", "AA", "AQ", "Ag" + kora.encoder_lien("+ 4G")[2:],
+    kora.encoder_lien("+ 4G\n+ 5D P x2")[:-4],
+    kora.encoder_lien("+ 4G") + "A",
+    jeton_brut(b""),                                # corps vide
+    jeton_brut(b"\x00\x05\x01"),                    # 5 lignes annoncées, 1 présente
+    jeton_brut(b"\x00\x01\x60"),                    # rythme 6 inconnu
+    jeton_brut(b"\x00\x01\x80\x03"),                # doigt 3 inconnu
+    jeton_brut(b"\x00\x01\x80\x08"),                # bit de modificateur inconnu
+    jeton_brut(b"\x00\x01\x80\x04\xff"),            # répétition tronquée
+    jeton_brut(b"\x00\x01\x0f\x09abc"),             # TXT plus court que annoncé
+    jeton_brut(b"\x00\x01\x70\x02\xff\xfe"),        # ligne brute en UTF-8 invalide
+    jeton_brut(b"\x01\x00"),                        # accordage annoncé mais absent
+    jeton_brut(b"\x02\x00\x02\x01A"),               # blocs tronqués
+    jeton_brut(b"\x00\x00", version=2),
+]
+
+@pytest.mark.parametrize("jeton", JETONS_CORROMPUS)
+def test_lien_corrompu_leve_value_error(jeton):
+    with pytest.raises(ValueError):
+        kora.decoder_lien(jeton)
+
+def test_lien_accordage_forge_ignore():
+    accordage = dict(kora.DEF_ACC)
+    accordage.update({'1D': "", '1G': '"><img src=x onerror=alert(1)>', '2D': "C9"})
+    partage = kora.decoder_lien(kora.encoder_lien("+ 4G", accordage))
+    assert partage['accordage'] == {k: v for k, v in kora.DEF_ACC.items() if k not in ('1D', '1G', '2D')}
+
+def test_lien_bombe_zlib_refusee():
+    jeton = base64.urlsafe_b64encode(bytes([kora.VERSION_LIEN]) + zlib.compress(b"\x00" * (kora.TAILLE_MAX_LIEN_DECOMPRESSE + 1), 9)).decode('ascii')
+    with pytest.raises(ValueError):
+        kora.decoder_lien(jeton)
+
+# ==============================================================================
+# 🧠 PARSER (différentiel contre le parser d'origine, copie figée ci-dessous)
+# ==============================================================================
+def parser_texte_reference(texte):
+    data = []
+    current_tick = 0
+    last_note_tick = 0
+    last_note_duration = kora.TICKS_NOIRE # Durée par défaut = Noire
+    
+    if not texte: return []
+    
+    for ligne in texte.strip().split('\n'):
+        parts = ligne.strip().split(maxsplit=2)
+        if not parts: continue
+        try:
+            col1 = parts[0]
+            
+            # 1. DÉTECTION DU RYTHME
+            if col1 == '=':
+                this_start = last_note_tick
+                this_duration = last_note_duration
+            elif col1.isdigit():
+                # Cas "1" (début) ou chiffre => on reset ou on avance d'une noire
+                this_start = 0 if col1 == '1' else current_tick
+                this_duration = kora.TICKS_NOIRE
+                current_tick = this_start + this_duration
+            elif col1 in kora.SYMBOLES_DUREE:
+                # C'est un symbole (+, ♪, etc.)
+                this_duration = kora.SYMBOLES_DUREE[col1]
+                this_start = current_tick
+                current_tick += this_duration
+            else:
+                # Cas par défaut (si l'utilisateur a tapé une vieille syntaxe sans symbole)
+                # On assume que c'est une Noire si ça ressemble à un '+' ou chiffre
+                if col1 == '+': 
+                    this_duration = kora.TICKS_NOIRE
+                    this_start = current_tick
+                    current_tick += this_duration
+                else: continue
+
+            last_note_tick = this_start
+            last_note_duration = this_duration
+
+            # 2. ANALYSE DU CONTENU
+            corde_valide = parts[1].upper()
+            
+            if corde_valide == 'TXT':
+                msg = parts[2] if len(parts) > 2 else ""
+                data.append({'tick': this_start, 'duration': this_duration, 'corde': 'TEXTE', 'message': msg}); continue
+            elif corde_valide == 'PAGE':
+                data.append({'tick': this_start, 'duration': 0, 'corde': 'PAGE_BREAK'}); continue
+            
+            corde_valide = 'SILENCE' if corde_valide=='S' else 'SEPARATOR' if corde_valide=='SEP' else corde_valide
+            
+            doigt = None; repetition = 1
+            if len(parts) > 2:
+                for p in parts[2].split():
+                    p_upper = p.upper()
+                    if p_upper.startswith('X') and p_upper[1:].isdigit(): repetition = int(p_upper[1:])
+                    elif p_upper in ['I', 'P']: doigt = p_upper
+            
+            if not doigt and corde_valide in kora.AUTOMATIC_FINGERING: doigt = kora.AUTOMATIC_FINGERING[corde_valide]
+            
+            # Gestion répétition
+            temp_cursor = this_start
+            for i in range(repetition):
+                note = {'tick': temp_cursor, 'duration': this_duration, 'corde': corde_valide}
+                if doigt: note['doigt'] = doigt
+                data.append(note)
+                
+                if i < repetition - 1:
+                    temp_cursor += this_duration
+                    current_tick = temp_cursor + this_duration # Mise à jour du curseur global si répétition
+
+        except Exception: pass
+        
+    data.sort(key=lambda x: x['tick'])
+    return data
+
+LIGNES_ALEATOIRES = [
+    "+ 4G", "+ 1D P", "= 2G", "= 6D I", "♪ 3G", "🎶 5D", "♬ 1G x3", "+ 2D I x2", "= S", "+ S", "+ SEP", "+ PAGE",
+    "+ TXT Refrain", "+ TXT", "1 4D", "2 5G", "7 1D", "+", "=", "", "   ", "x 4G", "+ ZZ", "♪ 4g p", "+ 1D X0", "+ 1D Xa",
+]
+
+def texte_aleatoire(rng, nb):
+    return "\n".join(rng.choice(LIGNES_ALEATOIRES) for _ in range(nb))
+
+@pytest.mark.parametrize("titre", MORCEAUX)
+def test_parser_identique_reference_banque(titre):
+    code = kora.BANQUE_TABLATURES[titre]
+    assert list(kora.parser_texte(code)) == parser_texte_reference(code)
+
+def test_parser_identique_reference_aleatoire():
+    rng = random.Random(4)
+    for _ in range(500):
+        texte = texte_aleatoire(rng, rng.randint(0, 40))
+        assert list(kora.parser_texte(texte)) == parser_texte_reference(texte), texte
+
+def test_parseur_incremental_identique_reference():
+    # Ajouts, éditions, suppressions et insertions successives sur la même instance
+    rng = random.Random(5); parseur = kora.ParseurIncremental(); lignes = []
+    for _ in range(3000):
+        action = rng.choice(["ajout", "ajout", "edition", "suppression", "insertion"])
+        if action == "ajout" or not lignes: lignes.append(rng.choice(LIGNES_ALEATOIRES))
+        elif action == "edition": lignes[rng.randrange(len(lignes))] = rng.choice(LIGNES_ALEATOIRES)
+        elif action == "suppression": del lignes[rng.randrange(len(lignes))]
+        else: lignes.insert(rng.randrange(len(lignes) + 1), rng.choice(LIGNES_ALEATOIRES))
+        texte = "\n".join(lignes)
+        assert list(parseur.parser(texte)) == parser_texte_reference(texte), texte
+
+# ==============================================================================
+# 🎹 MIXAGE AUDIO (tolérance contre l'overlay pydub d'origine)
+# ==============================================================================
+TOLERANCE_MIXAGE = 2e-3
+
+@pytest.mark.parametrize("bpm", [60, 100, 173])
+def test_mixage_numpy_proche_overlay_pydub(bpm):
+    if not kora.HAS_PYDUB: pytest.skip("pydub absent")
+    import benchmark_kora as bench
+    samples_pcm = kora.charger_samples_pcm(set(bench.CORDES_BENCH), bench.config_acc_defaut())
+    sequence = kora.parser_texte(bench.tablature_synthetique(120) + "\n= 4G\n+ S\n🎶 2D x3")
+    mix = np.clip(kora.mixer_sequence_pcm(sequence, bpm, samples_pcm), -1.0, 1.0) # Écrêté comme à l'export (pydub sature à chaque overlay)
+    reference = kora.segment_vers_pcm(bench.mixage_overlay_pydub(list(sequence), bpm, samples_pcm))
+    assert abs(len(mix) - len(reference)) <= 1
+    n = min(len(mix), len(reference))
+    assert np.abs(mix[:n] - reference[:n]).max() <= TOLERANCE_MIXAGE
+
+# ==============================================================================
+# 🎼 MIDI (aller-retour export -> import)
+# ==============================================================================
+def notes_sans_silences(sequence):
+    # Les silences ne voyagent pas dans le MIDI : ils sont recréés à l'import à partir des écarts
+    return [(n['tick'], n['duration'], n['corde'], n.get('doigt'), n.get('message')) for n in sequence if n['corde'] != 'SILENCE']
+
+def config_acc_defaut():
+    return {k: {'x': kora.POSITIONS_X[k], 'n': v} for k, v in kora.DEF_ACC.items()}
+
+CODES_MIDI = [kora.BANQUE_TABLATURES[titre] for titre in MORCEAUX] + [
+    "1   4G\n=   1D   I\n♪   2G   P x3\n🎶   S\n♬   6D\n+   TXT  Refrain\n+   PAGE\n+   SEP\n🎶   3G\n🎶   4D\n🎶   5G",
+]
+
+@pytest.mark.parametrize("code", CODES_MIDI)
+def test_midi_aller_retour(code):
+    pytest.importorskip("mido")
+    acc_config = config_acc_defaut(); sequence = kora.parser_texte(code)
+    texte, bpm = kora.importer_midi(kora.exporter_midi(sequence, acc_config, bpm=87, titre="Test").getvalue(), acc_config)
+    assert bpm == 87
+    assert notes_sans_silences(kora.parser_texte(texte)) == notes_sans_silences(sequence)
+
+# ==============================================================================
+# 📦 PROJETS .ngoni (fichiers malformés)
+# ==============================================================================
+def zip_projet(manifeste, blocs="{}", membres=None):
+    membres = {"tablature.txt": "1   1D", "blocs.json": blocs} if membres is None else membres
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(kora.MANIFESTE_PROJET, json.dumps(manifeste))
+        for nom, contenu in membres.items(): z.writestr(nom, contenu)
+    return buf.getvalue()
+
+def corrompre_membre(data, nom):
+    # Flux deflate du membre remplacé par des blocs invalides : sa lecture lève zlib.error
+    info = zipfile.ZipFile(io.BytesIO(data)).getinfo(nom)
+    longueur_nom, longueur_extra = struct.unpack("<HH", data[info.header_offset + 26:info.header_offset + 30])
+    debut = info.header_offset + 30 + longueur_nom + longueur_extra
+    return data[:debut] + b"\xff" * info.compress_size + data[debut + info.compress_size:]
+
+MANIFESTE_VALIDE = {'format': "ngoni", 'version': kora.VERSION_PROJET, 'membres': kora.MEMBRES_PROJET}
+
+PROJETS_MALFORMES = [
+    b"[]", b"3", b'"texte"', b"null", b'{"code": 5}', b'{"code": "1 1D", "blocs": []}', b'{"code": "1 1D", "blocs": {"A": 3}}',
+    zip_projet([]), zip_projet("ngoni"), zip_projet({'format': "ngoni", 'version': 1}),
+    zip_projet({**MANIFESTE_VALIDE, 'membres': []}), zip_projet({**MANIFESTE_VALIDE, 'membres': {'code': 1, 'blocs': "blocs.json"}}),
+    zip_projet(MANIFESTE_VALIDE, blocs="[]"),
+    zip_projet(MANIFESTE_VALIDE, membres={"blocs.json": "{}"}),
+    corrompre_membre(zip_projet(MANIFESTE_VALIDE), "tablature.txt"),
+    corrompre_membre(zip_projet(MANIFESTE_VALIDE), "blocs.json"),
+]
+
+@pytest.mark.parametrize("data", PROJETS_MALFORMES)
+def test_projet_malforme_leve_value_error(data):
+    with pytest.raises(ValueError):
+        projet = kora.ouvrir_projet(io.BytesIO(data))
+        projet.blocs(); kora.valeurs_widgets_projet(projet)
+
+def test_projet_champs_invalides_ignores():
+    projet = kora.ouvrir_projet(io.BytesIO(zip_projet({**MANIFESTE_VALIDE, 'titre': 5, 'accordage': [], 'bpm': "vite", 'artefacts': {'x': 1}})))
+    assert kora.valeurs_widgets_projet(projet) == {'code_actuel': "1   1D", 'widget_input': "1   1D"}
+    assert projet.restaurer_artefacts("test") == 0
+
+# ==============================================================================
+# 📄 LIVRET VECTORIEL (pages PDF rendues séparément puis fusionnées)
+# ==============================================================================
+def test_livret_vectoriel_fusionne_les_pages():
+    pypdf = pytest.importorskip("pypdf")
+    styles = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
+    ctx = {'titre': "Test", 'config_acc': config_acc_defaut(), 'styles_ecran': styles, 'styles_print': styles, 'options_visuelles': {'use_bg': True, 'alpha': 0.2}, 'force_white_print': True, 'vectoriel': True}
+    pages = kora.parser_texte(kora.BANQUE_TABLATURES[MORCEAUX[0]]).pages()[:2]
+    taches = [('legende', 1, None, ctx)] + [('page', idx + 2, page, ctx) for idx, page in enumerate(pages)]
+    items = [kora.rendre_page_livret(kora.emballer_tache(tache)) for tache in taches]
+    livret = pypdf.PdfReader(io.BytesIO(kora.generer_pdf_livret(items, "Test").getvalue()), strict=True)
+    assert len(livret.pages) == len(taches)
+    for page, item in zip(livret.pages, items):
+        source = pypdf.PdfReader(io.BytesIO(item['pdf'])).pages[0]
+        assert page.mediabox == source.mediabox
+        assert page.get_contents().get_data() == source.get_contents().get_data()
+        assert page.extract_text() == source.extract_text()
+
+def taches_livret_ecran():
+    styles = {'FOND': 'white', 'TEXTE': 'black', 'PERLE_FOND': 'white', 'LEGENDE_FOND': 'white'}
+    ctx = {'titre': "Test", 'config_acc': config_acc_defaut(), 'styles_ecran': styles, 'styles_print': styles, 'options_visuelles': {'use_bg': False, 'alpha': 0.2}, 'force_white_print': False}
+    pages = kora.parser_texte(kora.BANQUE_TABLATURES[MORCEAUX[0]]).pages()[:1]
+    return [('legende', 1, None, ctx)] + [('page', idx + 2, page, ctx) for idx, page in enumerate(pages)]
+
+def verifier_livret_ecran(rendues, taches):
+    assert [i for i, _ in rendues] == list(range(len(taches)))
+    for (_, item), (type_page, idx, _, _) in zip(rendues, taches):
+        assert (item['type'], item['idx']) == (type_page, idx)
+        assert item['img_ecran'].startswith(kora.PNG_SIGNATURE) and item['buf'].getvalue().startswith(kora.PNG_SIGNATURE)
+
+def test_livret_rendu_par_les_processus_de_rendu():
+    taches = taches_livret_ecran()
+    verifier_livret_ecran(list(kora.rendre_livret(taches)), taches)
+
+def test_livret_rendu_sur_place_sans_processus(monkeypatch):
+    def pool_impossible(): raise OSError("processus interdits")
+    monkeypatch.setattr(kora, 'get_pool_rendu', pool_impossible)
+    taches = taches_livret_ecran()
+    verifier_livret_ecran(list(kora.rendre_livret(taches)), taches)
+
+# ==============================================================================
+# 🎥 TUILES DE LA VIDÉO (rendues à part, à partir des seules notes de la tuile)
+# ==============================================================================
+def test_tuile_rendue_depuis_son_extrait():
+    styles = {'FOND': '#e5c4a3', 'TEXTE': 'black', 'PERLE_FOND': '#e5c4a3', 'LEGENDE_FOND': '#e5c4a3'}
+    sequence = kora.parser_texte(kora.BANQUE_TABLATURES["Démonstration Rythmes"])
+    partition = kora.PartitionLongue(sequence, config_acc_defaut(), styles, dpi=40, hauteur_tuile=128)
+    assert partition.nb_tuiles > 3
+    for k in range(partition.nb_tuiles):
+        extrait = partition.extrait(k)
+        assert len(extrait) < len(sequence)
+        tache = (extrait.etat(), (partition.t_min, partition.t_max), partition.config_acc, styles, partition.dpi, partition.hauteur_tuile, k)
+        tuile, _ = kora.rendre_tuile_video(tache)
+        assert np.array_equal(tuile, partition.tuile(k))
+
+# ==============================================================================
+# ⏳ TRAVAUX (clé de partage)
+# ==============================================================================
+def test_cle_travail_stable():
+    acc = config_acc_defaut(); sequence = kora.parser_texte("1   1D\n+   2G")
+    assert kora.cle_travail("Vidéo", ("1   1D", acc, 60, None)) == kora.cle_travail("Vidéo", ["1   1D", dict(reversed(acc.items())), 60, None])
+    assert kora.cle_travail("Vidéo", ("1   1D", acc, 60, None)) != kora.cle_travail("Vidéo", ("1   1D", acc, 61, None))
+    assert kora.cle_travail("x", (sequence,)) == kora.cle_travail("x", (kora.parser_texte("1   1D\n+   2G"),))
+
+def test_cle_travail_refuse_argument_instable():
+    with pytest.raises(TypeError):
+        kora.cle_travail("x", (object(),))
+
+CLE_PAGE = "0" * 40 + ".png"
+
+@pytest.fixture
+def session_test():
+    session = "test-projet"; dossier = os.path.join(kora.DOSSIER_ARTEFACTS_SESSIONS, session)
+    shutil.rmtree(dossier, ignore_errors=True)
+    yield session, dossier
+    shutil.rmtree(dossier, ignore_errors=True)
+
+def test_projet_artefacts_invalides_ignores(session_test):
+    session, _ = session_test
+    artefacts = [{'magasin': "pages", 'cle': CLE_PAGE, 'membre': ["rendus/a.png"]},
+                 {'magasin': "pages", 'cle': CLE_PAGE, 'membre': "rendus/absent.png"},
+                 {'magasin': "pages", 'cle': CLE_PAGE, 'membre': "rendus/corrompu.png"},
+                 {'magasin': "pages", 'cle': "1" * 40 + ".png", 'membre': "rendus/ok.png"}]
+    membres = {"tablature.txt": "1   1D", "blocs.json": "{}", "rendus/corrompu.png": "x" * 200, "rendus/ok.png": "png"}
+    data = corrompre_membre(zip_projet({**MANIFESTE_VALIDE, 'artefacts': artefacts}, membres=membres), "rendus/corrompu.png")
+    blocs, valeurs, nb_rendus = kora.charger_projet(io.BytesIO(data), session)
+    assert (blocs, valeurs['code_actuel'], nb_rendus) == ({}, "1   1D", 1)
+    assert kora.artefacts_session(session, "pages").lire("1" * 40 + ".png") == b"png"
+    assert not kora.artefacts_session(session, "pages").existe(CLE_PAGE)
+
+def test_projet_refuse_ne_restaure_aucun_rendu(session_test):
+    session, dossier = session_test
+    manifeste = {**MANIFESTE_VALIDE, 'artefacts': [{'magasin': "pages", 'cle': CLE_PAGE, 'membre': "rendus/a.png"}]}
+    data = zip_projet(manifeste, membres={"tablature.txt": "1   1D", "blocs.json": "[]", "rendus/a.png": "png"})
+    with pytest.raises(ValueError):
+        kora.charger_projet(io.BytesIO(data), session)
+    assert not os.path.exists(dossier)
+
+# ==============================================================================
+# 📥 IMPORTS DIFFÉRÉS (module installé mais cassé)
+# ==============================================================================
+def test_module_casse_traite_comme_absent(tmp_path, monkeypatch):
+    (tmp_path / "module_casse_kora").mkdir()
+    (tmp_path / "module_casse_kora" / "__init__.py").write_text("import module_introuvable_kora\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    assert kora.module_disponible("module_casse_kora")
+    assert not kora.module_utilisable("module_casse_kora")
+    assert kora.module_casse("module_casse_kora")